@@ -1,18 +1,50 @@
 import xml.etree.ElementTree as ET
 import logging
 import sys
+import os
+try:
+    from ConfigSchema import ConfigSchema
+except ImportError:
+    # Imported as part of the src package, as the simulators do.
+    from .ConfigSchema import ConfigSchema
 
 def get_text(element):
     """Safely return element.text.strip() or an empty string."""
     return element.text.strip() if element is not None and element.text is not None else ""
 
+def get_bool(element, default):
+    """Parse an xs:boolean element, or return default when it is missing or empty."""
+    text = get_text(element).lower()
+    if not text:
+        return default
+    if text in ("true", "1"):
+        return True
+    if text in ("false", "0"):
+        return False
+    raise ValueError(f"Invalid boolean value '{text}'")
+
 class ConfigLoader:
-    def __init__(self, filePath="config.xml"):
+    """
+    One validated, compiled snapshot of config.xml. The snapshot is frozen
+    once loaded: a changed file is loaded into a new ConfigLoader and
+    swapped in as a whole (see MissionPlannerIntegrator.ReloadConfig).
+
+    The file is validated against schemaPath first, by default config.xsd
+    next to it. With exitOnError=False, errors raise ValueError instead of
+    ending the process, which is what a reload needs.
+    """
+    def __init__(self, filePath="config.xml", schemaPath=None, exitOnError=True):
         self.filePath = filePath
+        if schemaPath is None:
+            schemaPath = os.path.join(os.path.dirname(filePath), "config.xsd")
         try:
             logging.info("Loading configuration from XML...")
             tree = ET.parse(filePath)
             root = tree.getroot()
+            if os.path.exists(schemaPath):
+                errors = ConfigSchema(schemaPath).Validate(root)
+                if errors:
+                    raise ValueError(f"{filePath} does not match {schemaPath}: " + "; ".join(errors))
             
             # Network configuration
             network = root.find("Network")
@@ -43,6 +75,17 @@ class ConfigLoader:
             self.pwmPitchMax_ = int(get_text(gimbal.find("PWMPitchMax")))
             self.pwmYawMin_ = int(get_text(gimbal.find("PWMYawMin")))
             self.pwmYawMax_ = int(get_text(gimbal.find("PWMYawMax")))
+            # Motion limits of the gimbal controller; an acceleration of 0 means unlimited.
+            self.pwmMaxAccel_ = float(get_text(gimbal.find("PWMMaxAccel")) or 0.0)
+            self.mountPitchMin_ = float(get_text(gimbal.find("MountPitchMinDeg")) or -90.0)
+            self.mountPitchMax_ = float(get_text(gimbal.find("MountPitchMaxDeg")) or 90.0)
+            self.mountYawMin_ = float(get_text(gimbal.find("MountYawMinDeg")) or -180.0)
+            self.mountYawMax_ = float(get_text(gimbal.find("MountYawMaxDeg")) or 180.0)
+            self.mountRate_ = float(get_text(gimbal.find("MountRateDegS")) or 10.0)
+            self.mountMaxAccel_ = float(get_text(gimbal.find("MountMaxAccelDegS2")) or 0.0)
+            self.mountFeedback_ = get_bool(gimbal.find("MountFeedback"), False)
+            self.mountMaxLead_ = float(get_text(gimbal.find("MountMaxLeadDeg")) or 10.0)
+            self.mountFeedbackTimeout_ = float(get_text(gimbal.find("MountFeedbackTimeoutMs")) or 500.0) / 1000.0
             
             # RCChannels configuration
             rc = root.find("RCChannels")
@@ -64,9 +107,136 @@ class ConfigLoader:
             self.exponentialFactor_ = float(get_text(ja.find("ExponentialFactor")))
             self.deadZone = float(get_text(ja.find("DeadZone")))
 
+            # USB joystick engine (optional)
+            self.usbJoystickEnabled_ = get_bool(root.find("UsbJoystick/Enabled"), True)
+            self.usbJoystickMode_ = get_text(root.find("UsbJoystick/Mode")) or "events"
+            if self.usbJoystickMode_ not in ("events", "poll"):
+                raise ValueError(f"Unknown USB joystick mode '{self.usbJoystickMode_}'")
+            self.usbJoystickPollRateHz_ = float(get_text(root.find("UsbJoystick/PollRateHz")) or 500.0)
+            self.usbJoystickSendRateHz_ = float(get_text(root.find("UsbJoystick/SendRateHz")) or 100.0)
+            self.usbJoystickSmoothing_ = float(get_text(root.find("UsbJoystick/SmoothingMs")) or 0.0) / 1000.0
+
+            # Control loop (optional)
+            self.controlRateHz_ = float(get_text(root.find("Control/RateHz")) or 50.0)
+
+            # Control input receive mode (optional)
+            self.latestValueMode_ = get_bool(root.find("Inputs/LatestValueMode"), True)
+            self.maxInputAge_ = float(get_text(root.find("Inputs/MaxInputAgeMs")) or 200.0) / 1000.0
+            # Only for touch apps that send an incrementing counter in the first field.
+            self.touchSequence_ = get_bool(root.find("Inputs/TouchSequence"), False)
+
+            # Telemetry history (optional)
+            self.historyCapacity_ = int(get_text(root.find("History/Capacity")) or 36000)
+
+            # Flight data recorder (optional)
+            self.recorderEnabled_ = get_bool(root.find("Recorder/Enabled"), False)
+            self.recorderDirectory_ = get_text(root.find("Recorder/Directory")) or "recordings"
+
+            # Inbound MAVLink frame filtering (optional)
+            self.mavlinkHeaderFilter_ = get_bool(root.find("MavlinkInput/HeaderFilter"), True)
+
+            # Outbound MAVLink command queue (optional)
+            self.rcOverrideMaxRateHz_ = float(get_text(root.find("MavlinkOutput/RcOverrideMaxRateHz")) or 25.0)
+            self.rcOverrideKeepaliveHz_ = float(get_text(root.find("MavlinkOutput/RcOverrideKeepaliveHz")) or 2.0)
+            self.mountMaxRateHz_ = float(get_text(root.find("MavlinkOutput/MountMaxRateHz")) or 25.0)
+            self.mountKeepaliveHz_ = float(get_text(root.find("MavlinkOutput/MountKeepaliveHz")) or 1.0)
+
+            # Runtime mode (optional): "threads", "asyncio" or "processes"
+            self.runtimeMode_ = get_text(root.find("Runtime/Mode")) or "threads"
+            if self.runtimeMode_ not in ("threads", "asyncio", "processes"):
+                raise ValueError(f"Unknown runtime mode '{self.runtimeMode_}'")
+            self.sharedStateName_ = get_text(root.find("Runtime/SharedStateName")) or None
+
+            # Outbound telemetry publishing (optional)
+            self.metaMaxRateHz_ = float(get_text(root.find("Publishing/MetaMaxRateHz")) or 20.0)
+            self.metaKeepaliveHz_ = float(get_text(root.find("Publishing/MetaKeepaliveHz")) or 1.0)
+            self.videoAppMaxRateHz_ = float(get_text(root.find("Publishing/VideoAppMaxRateHz")) or 20.0)
+            self.videoAppKeepaliveHz_ = float(get_text(root.find("Publishing/VideoAppKeepaliveHz")) or 1.0)
+
+            # Fleet mode (optional): one DroneState per MAVLink system id
+            self.fleetEnabled_ = get_bool(root.find("Fleet/Enabled"), False)
+            self.fleetMaxVehicles_ = int(get_text(root.find("Fleet/MaxVehicles")) or 64)
+            self.fleetVideoPortBase_ = int(get_text(root.find("Fleet/VideoPortBase")) or 15500)
+            self.fleetHistoryCapacity_ = int(get_text(root.find("Fleet/HistoryCapacity")) or 6000)
+            if self.fleetEnabled_ and self.runtimeMode_ == "processes":
+                raise ValueError("Fleet mode is not supported by the processes runtime")
+
+            # Logging (optional)
+            self.logLevel_ = (get_text(root.find("Logging/Level")) or "INFO").upper()
+            if self.logLevel_ not in ("DEBUG", "INFO", "WARNING", "ERROR"):
+                raise ValueError(f"Unknown log level '{self.logLevel_}'")
+            self.logFile_ = get_text(root.find("Logging/File")) or "mission_planner.log"
+            self.logQueued_ = get_bool(root.find("Logging/Queued"), True)
+            self.logRateLimitSeconds_ = float(get_text(root.find("Logging/RateLimitSeconds")) or 1.0)
+            self.packetLogging_ = get_bool(root.find("Logging/PacketLogging"), False)
+
+            # Metrics endpoint (optional)
+            self.metricsEnabled_ = get_bool(root.find("Metrics/Enabled"), False)
+            self.metricsHost_ = get_text(root.find("Metrics/Host")) or "127.0.0.1"
+            self.metricsPort_ = int(get_text(root.find("Metrics/Port")) or 8765)
+
+            # Live reload (optional)
+            self.reloadEnabled_ = get_bool(root.find("Reload/Enabled"), False)
+            self.reloadInterval_ = float(get_text(root.find("Reload/IntervalMs")) or 500.0) / 1000.0
+
+            # Loop stall watchdog (optional)
+            self.supervisorEnabled_ = get_bool(root.find("Supervisor/Enabled"), True)
+            self.supervisorInterval_ = float(get_text(root.find("Supervisor/CheckIntervalMs")) or 500.0) / 1000.0
+            self.supervisorStallFactor_ = float(get_text(root.find("Supervisor/StallFactor")) or 5.0)
+            self.supervisorBusyCpu_ = float(get_text(root.find("Supervisor/BusyCpu")) or 0.9)
+
+            # Geofence (optional); the fence polygons are in a GeoJSON file
+            self.geofenceEnabled_ = get_bool(root.find("Geofence/Enabled"), False)
+            self.geofenceFile_ = get_text(root.find("Geofence/File")) or "geofence.json"
+            floor = get_text(root.find("Geofence/FloorM"))
+            self.geofenceFloor_ = float(floor) if floor else None
+            ceiling = get_text(root.find("Geofence/CeilingM"))
+            self.geofenceCeiling_ = float(ceiling) if ceiling else None
+            self.geofenceNearMargin_ = float(get_text(root.find("Geofence/NearMarginM")) or 20.0)
+            self.geofenceAltitudeMargin_ = float(get_text(root.find("Geofence/AltitudeMarginM")) or 5.0)
+            self.geofenceCellSize_ = float(get_text(root.find("Geofence/CellSizeM")) or 500.0)
+            self.geofenceAltitudeReference_ = get_text(root.find("Geofence/AltitudeReference")) or "relative"
+
+            # Telemetry estimator and publisher prediction (optional)
+            self.estimatorEnabled_ = get_bool(root.find("Estimator/Enabled"), False)
+            self.predictAhead_ = float(get_text(root.find("Estimator/PredictAheadMs")) or 0.0) / 1000.0
+            self.maxPrediction_ = float(get_text(root.find("Estimator/MaxPredictionMs")) or 1000.0) / 1000.0
+            self.estimatorAccelNoise_ = float(get_text(root.find("Estimator/AccelNoise")) or 2.0)
+            self.estimatorAngularAccelNoise_ = float(get_text(root.find("Estimator/AngularAccelNoise")) or 1.0)
+            self.estimatorPositionNoise_ = float(get_text(root.find("Estimator/PositionNoiseM")) or 2.0)
+            self.timesyncInterval_ = float(get_text(root.find("Estimator/TimesyncIntervalMs")) or 1000.0) / 1000.0
+
+            # Outbound packet distribution (optional): destinations besides the Ports ones,
+            # and the port consumers subscribe on (0 disables subscriptions)
+            self.subscribePort_ = int(get_text(root.find("Distribution/SubscribePort")) or 0)
+            self.subscriptionTimeout_ = float(get_text(root.find("Distribution/SubscriptionTimeoutS")) or 10.0)
+            self.maxSubscribers_ = int(get_text(root.find("Distribution/MaxSubscribers")) or 8)
+            self.metaSubscribers_ = tuple((get_text(s.find("IP")), int(get_text(s.find("Port"))))
+                                          for s in root.findall("Distribution/MetaSubscriber"))
+            self.videoAppSubscribers_ = tuple((get_text(s.find("IP")), int(get_text(s.find("Port"))))
+                                              for s in root.findall("Distribution/VideoAppSubscriber"))
+
         except Exception as e:
+            if not exitOnError:
+                raise ValueError(f"Error loading XML configuration: {e}") from e
             print("Error loading XML configuration:", e)
             sys.exit(1)
-        
+
+        self.frozen_ = True
         logging.info("Configuration loaded successfully.")
 
+    def __setattr__(self, name, value):
+        if getattr(self, "frozen_", False):
+            raise AttributeError(f"Configuration is read-only; cannot set {name}")
+        object.__setattr__(self, name, value)
+
+    def Values(self):
+        """Setting name -> value, e.g. {"gain_": 25.1, ...}."""
+        return {name: value for name, value in vars(self).items() if name not in ("filePath", "frozen_")}
+
+    def Changed(self, other):
+        """Names of the settings whose value differs in other."""
+        mine = self.Values()
+        theirs = other.Values()
+        return {name for name in mine.keys() | theirs.keys() if mine.get(name) != theirs.get(name)}
+
@@ -0,0 +1,150 @@
+"""
+Module: ConfigSchema.py
+Description: Validates config.xml against config.xsd without third-party XML libraries.
+
+Only the part of XML Schema that config.xsd uses is understood: nested
+xs:element declarations with xs:complexType/xs:sequence, minOccurs and
+maxOccurs, the built-in simple types below, and xs:simpleType restrictions
+with xs:enumeration and xs:minInclusive/xs:maxInclusive facets. Anything
+else in the schema is rejected when the schema is loaded, so a schema
+change that needs more than this subset is noticed instead of silently
+not enforced.
+"""
+import re
+import xml.etree.ElementTree as ET
+
+XS = "{http://www.w3.org/2001/XMLSchema}"
+
+DECIMAL = re.compile(r"^[+-]?(\d+(\.\d*)?|\.\d+)$")
+INTEGER = re.compile(r"^[+-]?\d+$")
+
+def IsInteger(text, minimum=None):
+    return INTEGER.match(text) is not None and (minimum is None or int(text) >= minimum)
+
+BUILTIN_TYPES = {
+    "string": lambda text: True,
+    "boolean": lambda text: text in ("true", "false", "1", "0"),
+    "decimal": lambda text: DECIMAL.match(text) is not None,
+    "integer": IsInteger,
+    "int": IsInteger,
+    "nonNegativeInteger": lambda text: IsInteger(text, 0),
+    "positiveInteger": lambda text: IsInteger(text, 1),
+}
+
+class SimpleType:
+    def __init__(self, base, enumeration=None, minimum=None, maximum=None):
+        self.base_ = base
+        self.enumeration_ = enumeration
+        self.minimum_ = minimum
+        self.maximum_ = maximum
+
+    def Check(self, text):
+        """Error message for text, or None if it is valid."""
+        if not BUILTIN_TYPES[self.base_](text):
+            return f"'{text}' is not a valid xs:{self.base_}"
+        if self.enumeration_ is not None and text not in self.enumeration_:
+            return f"'{text}' is not one of {', '.join(self.enumeration_)}"
+        if self.minimum_ is not None and float(text) < self.minimum_:
+            return f"{text} is below the minimum {self.minimum_:g}"
+        if self.maximum_ is not None and float(text) > self.maximum_:
+            return f"{text} is above the maximum {self.maximum_:g}"
+        return None
+
+class ElementDecl:
+    """One xs:element: either simple (simpleType_) or a sequence of children_."""
+    def __init__(self, name, minOccurs=1, maxOccurs=1, simpleType=None, children=None):
+        self.name_ = name
+        self.minOccurs_ = minOccurs
+        self.maxOccurs_ = maxOccurs
+        self.simpleType_ = simpleType
+        self.children_ = children
+
+class ConfigSchema:
+    def __init__(self, xsdPath):
+        root = ET.parse(xsdPath).getroot()
+        elements = [child for child in root if child.tag == f"{XS}element"]
+        if len(elements) != 1:
+            raise ValueError(f"{xsdPath}: expected exactly one top-level xs:element")
+        self.root_ = self.ParseElement(elements[0])
+
+    def ParseElement(self, node):
+        name = node.get("name")
+        minOccurs = int(node.get("minOccurs", "1"))
+        maxText = node.get("maxOccurs", "1")
+        maxOccurs = None if maxText == "unbounded" else int(maxText)
+        typeName = node.get("type")
+        if typeName is not None:
+            return ElementDecl(name, minOccurs, maxOccurs, simpleType=SimpleType(self.BuiltinName(typeName)))
+        body = [child for child in node if child.tag != f"{XS}annotation"]
+        if len(body) != 1:
+            raise ValueError(f"Element {name}: expected a type attribute or one inline type")
+        definition = body[0]
+        if definition.tag == f"{XS}simpleType":
+            return ElementDecl(name, minOccurs, maxOccurs, simpleType=self.ParseSimpleType(name, definition))
+        if definition.tag == f"{XS}complexType":
+            sequence = [child for child in definition if child.tag != f"{XS}annotation"]
+            if len(sequence) != 1 or sequence[0].tag != f"{XS}sequence":
+                raise ValueError(f"Element {name}: only xs:sequence content is supported")
+            children = [self.ParseElement(child) for child in sequence[0]
+                        if child.tag != f"{XS}annotation"]
+            return ElementDecl(name, minOccurs, maxOccurs, children=children)
+        raise ValueError(f"Element {name}: unsupported definition {definition.tag}")
+
+    def ParseSimpleType(self, name, node):
+        restriction = node.find(f"{XS}restriction")
+        if restriction is None:
+            raise ValueError(f"Element {name}: only xs:restriction simple types are supported")
+        simpleType = SimpleType(self.BuiltinName(restriction.get("base")))
+        for facet in restriction:
+            value = facet.get("value")
+            if facet.tag == f"{XS}enumeration":
+                simpleType.enumeration_ = (simpleType.enumeration_ or ()) + (value,)
+            elif facet.tag == f"{XS}minInclusive":
+                simpleType.minimum_ = float(value)
+            elif facet.tag == f"{XS}maxInclusive":
+                simpleType.maximum_ = float(value)
+            elif facet.tag != f"{XS}annotation":
+                raise ValueError(f"Element {name}: unsupported facet {facet.tag}")
+        return simpleType
+
+    def BuiltinName(self, typeName):
+        local = typeName.split(":", 1)[-1]
+        if local not in BUILTIN_TYPES:
+            raise ValueError(f"Unsupported schema type {typeName}")
+        return local
+
+    def Validate(self, root):
+        """List of error messages for an ElementTree root; empty when the document is valid."""
+        errors = []
+        if root.tag != self.root_.name_:
+            errors.append(f"root element is <{root.tag}>, expected <{self.root_.name_}>")
+        else:
+            self.CheckElement(self.root_, root, root.tag, errors)
+        return errors
+
+    def CheckElement(self, decl, node, path, errors):
+        if decl.simpleType_ is not None:
+            if len(node):
+                errors.append(f"{path}: unexpected child elements")
+            error = decl.simpleType_.Check((node.text or "").strip())
+            if error is not None:
+                errors.append(f"{path}: {error}")
+            return
+        if node.text is not None and node.text.strip():
+            errors.append(f"{path}: unexpected text content")
+        children = list(node)
+        index = 0
+        for child in decl.children_:
+            count = 0
+            while index < len(children) and children[index].tag == child.name_:
+                if child.maxOccurs_ is not None and count == child.maxOccurs_:
+                    errors.append(f"{path}/{child.name_}: more than {child.maxOccurs_} occurrence(s)")
+                self.CheckElement(child, children[index], f"{path}/{child.name_}", errors)
+                count += 1
+                index += 1
+            if count < child.minOccurs_:
+                errors.append(f"{path}: missing <{child.name_}>")
+        if index < len(children):
+            expected = [child.name_ for child in decl.children_]
+            where = "out of order" if children[index].tag in expected else "not allowed"
+            errors.append(f"{path}/{children[index].tag}: element {where}")
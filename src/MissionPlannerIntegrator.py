@@ -1,93 +1,406 @@
 import threading
 import logging
-import subprocess
+import os
 import sys
+import time
 from ConfigLoader import ConfigLoader
 from state.DroneState import DroneState
+from state.FleetRegistry import FleetRegistry
+from interfaces.MavLinkConnectionManager import MavlinkConnectionManager
 from interfaces.MavLinkReaderInterface import MavlinkReaderInterface
 from interfaces.MavLinkWriterInterface import MavlinkWriterInterface
 from interfaces.GCSInterface import GCSInterface
 from interfaces.Raspinterface import RaspiInterface
-from interfaces.UsbJoystickInterface import USBJoystickInterface
 from interfaces.VideoAppInterface import VideoAppInterface
 from interfaces.MetaInterface import MetaInterface
+from interfaces.SubscriptionInterface import SubscriptionInterface
+from core.AsyncRuntime import AsyncRuntime
+from core.ProcessRuntime import ProcessRuntime
+from core.LogPipeline import LogPipeline, PACKET_LOGGER
+from core.Metrics import GetMetrics
+from core.DependencyCheck import DependencyCheck, MissingDependencyError
+from core.StartupProfile import StartupProfile
+from core.ConfigWatcher import ConfigWatcher
+from core.GimbalController import GimbalController, AxisLimits
+from core.SubscriberRegistry import SubscriberRegistry
+from core.LoopSupervisor import SUPERVISOR
+from core.FlightRecorder import (FlightRecorder, CHANNEL_TOUCH, CHANNEL_JOYSTICK,
+                                 CHANNEL_TEMPERATURE, CHANNEL_META)
 
 
 class MissionPlannerIntegrator:
-    def __init__(self):
+    def __init__(self, profile=None):
+        # Cold start is timed phase by phase and reported once everything runs.
+        self.profile_ = profile or StartupProfile()
 
-        logging.basicConfig(level=logging.DEBUG)
+        self.config_ = ConfigLoader("config.xml")
+        self.profile_.Mark("config")
+        self.logPipeline_ = LogPipeline(self.config_.logFile_,
+                                        self.config_.logLevel_,
+                                        self.config_.logQueued_,
+                                        self.config_.logRateLimitSeconds_,
+                                        self.config_.packetLogging_).Start()
         self.logger = logging.getLogger("MissionPlanner")
         self.components = []  # List to store initialized components
         logging.info("Starting Mission Planner...")
-        self.config_ = ConfigLoader("config.xml")
 
-        self.state_ = DroneState()
-        self.state_.id_ = self.config_.id_
-        self.state_.rc_channels_.rcChannelPitch_ = self.config_.channelPitch_
-        self.state_.rc_channels_.rcChannelYaw_ = self.config_.channelYaw_
-        self.state_.rc_channels_.rcChannelCam_ = self.config_.channelCam_
-        self.state_.rc_channels_.rcChannelDeploy1_ = self.config_.channelDeploy1_
-        self.state_.rc_channels_.rcChannelDeploy2_ = self.config_.channelDeploy2_
-        self.state_.gimbal_.gimbalGain_ = self.config_.gain_
-        self.state_.gimbal_.gimbalPitchNeutral_ = self.config_.pitchNeutral_
-        self.state_.gimbal_.gimbalYawNeutral_ = self.config_.yawNeutral_
-        self.state_.gimbal_.pwmPitchMin_ = self.config_.pwmPitchMin_
-        self.state_.gimbal_.pwmPitchMax_ = self.config_.pwmPitchMax_
-        self.state_.gimbal_.pwmYawMin_ = self.config_.pwmYawMin_
-        self.state_.gimbal_.pwmYawMax_ = self.config_.pwmYawMax_
-
-        self.mavlinkReaderInterface_ = MavlinkReaderInterface(self.state_,
-                                                              self.config_.udpIpMavlink_,
-                                                              self.config_.portSendMavlink_)
-
-        self.mavLinkWriterInterface = MavlinkWriterInterface(self.state_,
-                                                              self.config_.udpIpMavlink_,
-                                                              self.config_.portSendMavlink_)
+        # Offline and cached: nothing is installed at startup any more.
+        try:
+            DependencyCheck("requirements.txt", optional={"pygame": self.config_.usbJoystickEnabled_}).Run()
+        except MissingDependencyError as e:
+            self.logger.error(str(e))
+            # main() never gets this object, so its finally cannot stop the pipeline.
+            self.logPipeline_.Stop()
+            sys.exit(1)
+        self.profile_.Mark("logging and dependency check")
+
+        self.state_ = self.BuildState(self.config_.id_, self.config_.historyCapacity_)
+
+        # Fleet mode: other vehicles get their own state on their first message.
+        self.fleet_ = None
+        if self.config_.fleetEnabled_:
+            self.fleet_ = FleetRegistry(lambda sysid: self.BuildState(sysid, self.config_.fleetHistoryCapacity_),
+                                        self.config_.fleetMaxVehicles_)
+            self.fleet_.Add(self.config_.id_, self.state_)
+
+        self.profile_.Mark("state")
+
+        # One link for both directions: the reader subscribes to it, the writer sends through it.
+        self.mavlinkConnection_ = MavlinkConnectionManager(self.config_.udpIpMavlink_,
+                                                           self.config_.portSendMavlink_,
+                                                           headerFilter=self.config_.mavlinkHeaderFilter_)
+        # The reader feeds the estimator; the publishers send its predictions.
+        self.estimator_ = None
+        self.predictor_ = None
+        if self.config_.estimatorEnabled_:
+            from core.TelemetryEstimator import TelemetryEstimator, TelemetryPredictor
+            self.estimator_ = TelemetryEstimator(self.mavlinkConnection_,
+                                                 self.config_.estimatorAccelNoise_,
+                                                 self.config_.estimatorAngularAccelNoise_,
+                                                 self.config_.estimatorPositionNoise_,
+                                                 self.config_.timesyncInterval_)
+            self.predictor_ = TelemetryPredictor(self.config_.predictAhead_, self.config_.maxPrediction_)
+        self.mavlinkReaderInterface_ = MavlinkReaderInterface(self.state_, self.mavlinkConnection_,
+                                                              fleet=self.fleet_, estimator=self.estimator_)
+        self.mavlinkConnection_.Subscribe("HEARTBEAT", self.OnFirstHeartbeat)
+
+        # Checked inline on every position update, in whichever process runs the receive loop.
+        self.geofenceMonitor_ = None
+        if self.config_.geofenceEnabled_:
+            from core.Geofence import GeofenceMonitor
+            self.geofenceMonitor_ = GeofenceMonitor(self.LoadGeofence(self.config_), self.mavlinkConnection_,
+                                                    self.config_.geofenceAltitudeReference_)
+        self.profile_.Mark("MAVLink connect")
+
+        # Mount angle setpoint driven by the USB joystick, optionally held near the reported angles.
+        mountGimbal = GimbalController(*self.MountLimits(self.config_), self.config_.mountMaxLead_,
+                                       self.MountFeedback if self.config_.mountFeedback_ else None,
+                                       self.config_.mountFeedbackTimeout_)
+        self.mavLinkWriterInterface = MavlinkWriterInterface(self.mavlinkConnection_,
+                                                              self.config_.rcOverrideMaxRateHz_,
+                                                              self.config_.rcOverrideKeepaliveHz_,
+                                                              self.config_.mountMaxRateHz_,
+                                                              self.config_.mountKeepaliveHz_,
+                                                              mountGimbal)
 
         self.gcsInterface_ = GCSInterface(self.config_.udpIpRec_,
                                            self.config_.portRecMeta_,
-                                           self.config_.portRecTouch_)
+                                           self.config_.portRecTouch_,
+                                           self.config_.controlRateHz_,
+                                           self.config_.latestValueMode_,
+                                           self.config_.maxInputAge_,
+                                           self.config_.touchSequence_,
+                                           self.config_.pwmMaxAccel_ or float("inf"))
         self.raspiInterface_ = RaspiInterface(self.config_.udpIpRec_,
                                                self.config_.portRecJoystick_,
                                                self.config_.portRecTemperature_,
-                                               self.config_.exponentialFactor_)
+                                               self.config_.exponentialFactor_,
+                                               self.config_.latestValueMode_,
+                                               self.config_.maxInputAge_)
+
+        # Each outbound packet is packed once and sent to every destination of its stream:
+        # the Ports one, any extra ones in Distribution, and consumers that subscribed.
+        self.metaSubscribers_ = SubscriberRegistry("Meta", self.MetaDestinations(self.config_),
+                                                   self.config_.subscriptionTimeout_, self.config_.maxSubscribers_)
+        self.videoAppSubscribers_ = SubscriberRegistry("VideoApp", self.VideoAppDestinations(self.config_),
+                                                       self.config_.subscriptionTimeout_,
+                                                       self.config_.maxSubscribers_)
 
         self.videoappInterface_ = VideoAppInterface(self.config_.udpIpRec_,
-                                                    self.config_.txPortVideoApp_)
+                                                    self.config_.txPortVideoApp_,
+                                                    self.config_.videoAppMaxRateHz_,
+                                                    self.config_.videoAppKeepaliveHz_,
+                                                    self.config_.fleetVideoPortBase_,
+                                                    self.predictor_,
+                                                    self.videoAppSubscribers_)
 
         self.metaInterface_ = MetaInterface(self.config_.udpIpMeta_,
                                             self.config_.udpIpRec_,
                                             self.config_.portSendMeta_,
-                                            self.config_.portRecMeta_)
+                                            self.config_.portRecMeta_,
+                                            self.config_.metaMaxRateHz_,
+                                            self.config_.metaKeepaliveHz_,
+                                            self.predictor_,
+                                            self.metaSubscribers_)
 
-        self.usbJoystickInterface_ = USBJoystickInterface(self.state_, self.config_.exponentialFactor_,self.config_.deadZone,self.mavLinkWriterInterface)
+        self.subscriptionInterface_ = None
+        if self.config_.subscribePort_:
+            if self.config_.runtimeMode_ == "processes":
+                # The publishers run in their own processes and would never see the new subscribers.
+                self.logger.warning("Subscriptions are not supported in the processes runtime; "
+                                    "only the configured destinations receive packets.")
+            elif not self.config_.token_:
+                self.logger.warning("Subscriptions need a Token in config.xml; "
+                                    "only the configured destinations receive packets.")
+            else:
+                self.subscriptionInterface_ = SubscriptionInterface(self.config_.udpIpRec_,
+                                                                    self.config_.subscribePort_,
+                                                                    {"meta": self.metaSubscribers_,
+                                                                     "videoapp": self.videoAppSubscribers_},
+                                                                    self.config_.token_)
 
+        self.profile_.Mark("sockets")
 
-    def InstallDependencies(self):
-        try:
-            logging.info("Installing dependencies...")
-            subprocess.check_call([sys.executable, "-m", "pip", "install", "-r", "requirements.txt"])
-            logging.info("Dependencies installed successfully.")
-        except subprocess.CalledProcessError as e:
-            logging.error("Failed to install dependencies: " + str(e))
-            sys.exit(1)
-            
+        self.usbJoystickInterface_ = None
+        if self.config_.usbJoystickEnabled_:
+            # Imported here so that setups without a USB joystick skip it (pygame itself loads in Run()).
+            from interfaces.UsbJoystickInterface import USBJoystickInterface
+            self.usbJoystickInterface_ = USBJoystickInterface(self.state_, self.config_.exponentialFactor_,self.config_.deadZone,self.mavLinkWriterInterface,
+                                                              self.config_.usbJoystickMode_,
+                                                              self.config_.usbJoystickPollRateHz_,
+                                                              self.config_.usbJoystickSendRateHz_,
+                                                              self.config_.usbJoystickSmoothing_)
+            self.profile_.Mark("USB joystick")
+
+        self.recorder_ = None
+        if self.config_.recorderEnabled_:
+            self.StartRecorder()
+
+        metrics = GetMetrics("MissionPlanner")
+        metrics.Gauges("logging", self.logPipeline_.Stats)
+        if self.recorder_ is not None:
+            metrics.Gauges("recorder", self.recorder_.Stats)
+        if self.fleet_ is not None:
+            metrics.Gauge("fleet_vehicles", lambda: len(self.fleet_))
+        self.metricsServer_ = None
+        if self.config_.metricsEnabled_:
+            from core.MetricsServer import MetricsServer
+            self.metricsServer_ = MetricsServer(self.config_.metricsHost_, self.config_.metricsPort_).Start()
+        self.profile_.Mark("recorder and metrics")
+
+        self.reloaders_ = self.BuildReloaders()
+        self.configWatcher_ = None
+        if self.config_.reloadEnabled_:
+            self.configWatcher_ = ConfigWatcher(self.config_.filePath,
+                                                lambda path: ConfigLoader(path, exitOnError=False),
+                                                self.ReloadConfig, self.config_.reloadInterval_)
+            metrics.Gauges("config_reload", self.configWatcher_.Stats)
+        SUPERVISOR.Configure(self.config_.supervisorInterval_, self.config_.supervisorStallFactor_,
+                             self.config_.supervisorBusyCpu_)
+
+    def MetaDestinations(self, config):
+        return ((config.udpIpMeta_, config.portSendMeta_),) + config.metaSubscribers_
+
+    def VideoAppDestinations(self, config):
+        return ((config.udpIpRec_, config.txPortVideoApp_),) + config.videoAppSubscribers_
+
+    def BuildState(self, sysid, historyCapacity):
+        """DroneState for one vehicle with the gimbal and RC channel settings from config."""
+        state = DroneState(historyCapacity)
+        state.id_ = sysid
+        self.ApplyVehicleConfig(state, self.config_)
+        return state
+
+    def ApplyVehicleConfig(self, state, config):
+        with state.rc_channels_.WriteSection() as rc:
+            rc.rcChannelPitch_ = config.channelPitch_
+            rc.rcChannelYaw_ = config.channelYaw_
+            rc.rcChannelCam_ = config.channelCam_
+            rc.rcChannelDeploy1_ = config.channelDeploy1_
+            rc.rcChannelDeploy2_ = config.channelDeploy2_
+        with state.gimbal_.WriteSection() as gimbal:
+            gimbal.gimbalGain_ = config.gain_
+            gimbal.gimbalPitchNeutral_ = config.pitchNeutral_
+            gimbal.gimbalYawNeutral_ = config.yawNeutral_
+            gimbal.pwmPitchMin_ = config.pwmPitchMin_
+            gimbal.pwmPitchMax_ = config.pwmPitchMax_
+            gimbal.pwmYawMin_ = config.pwmYawMin_
+            gimbal.pwmYawMax_ = config.pwmYawMax_
+
+    def LoadGeofence(self, config):
+        from core.Geofence import LoadGeofence
+        return LoadGeofence(config.geofenceFile_, config.geofenceFloor_, config.geofenceCeiling_,
+                            config.geofenceNearMargin_, config.geofenceAltitudeMargin_,
+                            config.geofenceCellSize_)
+
+    def MountLimits(self, config):
+        """(pitch, yaw) AxisLimits of the mount angle setpoint."""
+        accel = config.mountMaxAccel_ or float("inf")
+        return (AxisLimits(config.mountPitchMin_, config.mountPitchMax_, config.mountRate_, accel),
+                AxisLimits(config.mountYawMin_, config.mountYawMax_, config.mountRate_, accel))
+
+    def MountFeedback(self):
+        """Gimbal angles last reported by the primary vehicle, as (pitch, yaw, age), or None."""
+        gimbal = self.state_.gimbal_.Snapshot()
+        if gimbal.mountTime_ == 0:
+            return None
+        return gimbal.mountPitch_, gimbal.mountYaw_, time.monotonic() - gimbal.mountTime_
+
+    def StartRecorder(self):
+        path = os.path.join(self.config_.recorderDirectory_,
+                            time.strftime("flight_%Y%m%d_%H%M%S.mpj"))
+        self.recorder_ = FlightRecorder(path)
+        self.mavlinkConnection_.recorder_ = self.recorder_
+        self.gcsInterface_.touchChannel_.AttachRecorder(self.recorder_, CHANNEL_TOUCH)
+        self.raspiInterface_.joystickChannel_.AttachRecorder(self.recorder_, CHANNEL_JOYSTICK)
+        self.raspiInterface_.tempChannel_.AttachRecorder(self.recorder_, CHANNEL_TEMPERATURE)
+        self.metaInterface_.receiverChannel_.AttachRecorder(self.recorder_, CHANNEL_META)
+
+
+    def OnFirstHeartbeat(self, msg):
+        self.mavlinkConnection_.Unsubscribe("HEARTBEAT", self.OnFirstHeartbeat)
+        self.logger.info(f"First heartbeat from system {msg.get_srcSystem()} "
+                         f"{self.profile_.Elapsed() * 1000:.0f} ms after start")
+
+    def BuildReloaders(self):
+        """
+        (settings, apply(old, new)) pairs for the settings that can change
+        while running. In the processes runtime only what lives in this
+        process, or in the shared state, can be updated.
+        """
+        mode = self.config_.runtimeMode_
+        reloaders = [
+            ({"gain_", "pitchNeutral_", "yawNeutral_", "pwmPitchMin_", "pwmPitchMax_", "pwmYawMin_",
+              "pwmYawMax_", "channelPitch_", "channelYaw_", "channelCam_", "channelDeploy1_",
+              "channelDeploy2_"}, self.ReloadVehicles),
+            ({"controlRateHz_"}, lambda old, new: self.gcsInterface_.controlScheduler_.SetRate(new.controlRateHz_)),
+            ({"rcOverrideMaxRateHz_", "rcOverrideKeepaliveHz_", "mountMaxRateHz_", "mountKeepaliveHz_"},
+             lambda old, new: self.mavLinkWriterInterface.SetRates(new.rcOverrideMaxRateHz_, new.rcOverrideKeepaliveHz_,
+                                                                   new.mountMaxRateHz_, new.mountKeepaliveHz_)),
+            ({"logLevel_", "packetLogging_"}, self.ReloadLogging),
+            ({"pwmMaxAccel_"}, lambda old, new: setattr(self.gcsInterface_, "pwmMaxAccel_",
+                                                         new.pwmMaxAccel_ or float("inf"))),
+            ({"supervisorInterval_", "supervisorStallFactor_", "supervisorBusyCpu_"},
+             lambda old, new: SUPERVISOR.Configure(new.supervisorInterval_, new.supervisorStallFactor_,
+                                                   new.supervisorBusyCpu_)),
+        ]
+        if mode != "asyncio":
+            # The event loop holds its own transports for these sockets.
+            reloaders.append(({"udpIpRec_", "portRecTouch_", "portRecJoystick_", "portRecTemperature_",
+                               "portRecMeta_", "subscribePort_"}, self.ReloadReceivePorts))
+        if mode != "processes" and self.geofenceMonitor_ is not None:
+            reloaders.append(({"geofenceFile_", "geofenceFloor_", "geofenceCeiling_", "geofenceNearMargin_",
+                               "geofenceAltitudeMargin_", "geofenceCellSize_"},
+                              lambda old, new: self.geofenceMonitor_.SetFence(self.LoadGeofence(new))))
+        if mode != "processes":
+            # The USB joystick, and with it the mount setpoint, runs in a worker process otherwise.
+            reloaders.append(({"mountPitchMin_", "mountPitchMax_", "mountYawMin_", "mountYawMax_", "mountRate_",
+                               "mountMaxAccel_"},
+                              lambda old, new: self.mavLinkWriterInterface.gimbal_.SetLimits(*self.MountLimits(new))))
+        if mode != "processes" and self.predictor_ is not None:
+            reloaders.append(({"predictAhead_", "maxPrediction_"}, self.ReloadPrediction))
+        if mode != "processes":
+            reloaders += [
+                ({"exponentialFactor_", "deadZone"}, self.ReloadJoystickShaping),
+                ({"udpIpMeta_", "portSendMeta_", "txPortVideoApp_", "udpIpRec_", "metaSubscribers_",
+                  "videoAppSubscribers_"}, self.ReloadSendPorts),
+                ({"subscriptionTimeout_", "maxSubscribers_"},
+                 lambda old, new: (self.metaSubscribers_.SetLimits(new.subscriptionTimeout_, new.maxSubscribers_),
+                                   self.videoAppSubscribers_.SetLimits(new.subscriptionTimeout_,
+                                                                       new.maxSubscribers_))),
+                ({"metaMaxRateHz_", "metaKeepaliveHz_", "videoAppMaxRateHz_", "videoAppKeepaliveHz_"},
+                 lambda old, new: (self.metaInterface_.publisher_.SetRates(new.metaMaxRateHz_, new.metaKeepaliveHz_),
+                                   self.videoappInterface_.publisher_.SetRates(new.videoAppMaxRateHz_,
+                                                                               new.videoAppKeepaliveHz_))),
+            ]
+        return reloaders
+
+    def ReloadConfig(self, config):
+        """Swap in a new configuration snapshot and update only the parts it changes."""
+        old = self.config_
+        changed = old.Changed(config)
+        if not changed:
+            return
+        # Components read self.config_ once per use, so they see either the old or the new snapshot.
+        self.config_ = config
+        applied = set()
+        for settings, apply in self.reloaders_:
+            if changed & settings:
+                try:
+                    apply(old, config)
+                    applied |= changed & settings
+                except Exception as e:
+                    self.logger.error(f"Could not apply {', '.join(sorted(changed & settings))}: {e}")
+        self.logger.info(f"Configuration reloaded: {', '.join(sorted(applied)) or 'nothing applied'}")
+        pending = changed - applied
+        if pending:
+            self.logger.warning(f"Restart to apply: {', '.join(sorted(pending))}")
 
+    def ReloadVehicles(self, old, new):
+        for state in (self.fleet_.States() if self.fleet_ is not None else (self.state_,)):
+            self.ApplyVehicleConfig(state, new)
+
+    def ReloadJoystickShaping(self, old, new):
+        self.raspiInterface_.exponential_factor_ = new.exponentialFactor_
+        if self.usbJoystickInterface_ is not None:
+            self.usbJoystickInterface_.SetShaping(new.exponentialFactor_, new.deadZone)
+
+    def ReloadReceivePorts(self, old, new):
+        # Only the channels whose address changed are reopened.
+        channels = ((self.gcsInterface_.touchChannel_, new.portRecTouch_),
+                    (self.raspiInterface_.joystickChannel_, new.portRecJoystick_),
+                    (self.raspiInterface_.tempChannel_, new.portRecTemperature_),
+                    (self.gcsInterface_.metaChannel_, new.portRecMeta_),
+                    (self.metaInterface_.receiverChannel_, new.portRecMeta_))
+        if self.subscriptionInterface_ is not None:
+            if not new.subscribePort_:
+                raise ValueError("subscriptions cannot be turned off while running")
+            channels += ((self.subscriptionInterface_.channel_, new.subscribePort_),)
+        for channel, port in channels:
+            previous = (channel.ip_, channel.port_)
+            if previous != (new.udpIpRec_, port):
+                channel.Rebind(new.udpIpRec_, port)
+                self.logger.info(f"Receiving on {new.udpIpRec_}:{port} instead of {previous[0]}:{previous[1]}")
+
+    def ReloadSendPorts(self, old, new):
+        self.metaSubscribers_.SetStatic(self.MetaDestinations(new))
+        self.videoAppSubscribers_.SetStatic(self.VideoAppDestinations(new))
+        self.videoappInterface_.udpIpRec_ = new.udpIpRec_
+
+    def ReloadPrediction(self, old, new):
+        self.predictor_.lead_ = new.predictAhead_
+        self.predictor_.maxHorizon_ = new.maxPrediction_
+
+    def ReloadLogging(self, old, new):
+        logging.getLogger().setLevel(new.logLevel_)
+        logging.getLogger(PACKET_LOGGER).setLevel(logging.DEBUG if new.packetLogging_ else logging.WARNING)
+
+    def StartupComplete(self):
+        self.profile_.Mark("thread launch")
+        self.profile_.Report()
 
     def Start(self):
 
         self.logger.info("Starting Mission Planner Integration process")
-        self.logger.info("Installing dependencies")
-        self.InstallDependencies()
-        self.logger.debug("Dependencies installed.")
+        if self.configWatcher_ is not None:
+            self.configWatcher_.Start()
+        if self.config_.supervisorEnabled_:
+            # Started before the runtimes fork, so every worker process runs its own watchdog.
+            SUPERVISOR.Start()
+
+        if self.config_.runtimeMode_ == "asyncio":
+            self.StartAsync()
+            return
+        if self.config_.runtimeMode_ == "processes":
+            self.StartProcesses()
+            return
 
         threads = []
 
-        self.logger.debug("Starting Mavlink Reader Interface thread...")
+        self.logger.debug("Starting Mavlink Connection thread...")
         t_mav = threading.Thread(
-            target=self.mavlinkReaderInterface_.MavlinkReader,
-            name="Mavlink Reader Interface Thread",
+            target=self.mavlinkConnection_.ReceiveLoop,
+            name="Mavlink Connection Thread",
             daemon=False  # Set to False so that the thread runs as a non-daemon thread
         )
         t_mav.start()
@@ -106,13 +419,23 @@ class MissionPlannerIntegrator:
         self.logger.debug("Starting GSC Control Interface thread...")
         t_gcs = threading.Thread(
             target=self.gcsInterface_.GCSControlHandler,
-            args=(self.state_, self.mavlinkReaderInterface_),
+            args=(self.state_, self.mavLinkWriterInterface),
             name="GCS Control Handler Thread",
             daemon=False
         )
         t_gcs.start()
         threads.append(t_gcs)
 
+        self.logger.debug("Starting Joystick Reader Interface thread...")
+        t_joy = threading.Thread(
+            target=self.raspiInterface_.ReceiveJoystick,
+            args=(self.state_,),
+            name="Joystick Reader Interface Thread",
+            daemon=False
+        )
+        t_joy.start()
+        threads.append(t_joy)
+
         self.logger.debug("Starting Temperature Reader Interface thread...")
         t_temp = threading.Thread(
             target=self.raspiInterface_.ReceiveTemperature,
@@ -123,25 +446,153 @@ class MissionPlannerIntegrator:
         t_temp.start()
         threads.append(t_temp)
 
+        self.logger.debug("Starting Meta Publisher thread...")
+        t_meta = threading.Thread(
+            target=self.metaInterface_.GCSToMeta,
+            args=(self.state_, self.fleet_),
+            name="Meta Publisher Thread",
+            daemon=False
+        )
+        t_meta.start()
+        threads.append(t_meta)
 
-        t_usbjoy = threading.Thread(
-            target=self.usbJoystickInterface_.Run,
-            name="USBJoystickThread",
+        self.logger.debug("Starting VideoApp Publisher thread...")
+        t_video = threading.Thread(
+            target=self.videoappInterface_.MissionPlannerToVideoApp,
+            args=(self.state_, self.fleet_),
+            name="VideoApp Publisher Thread",
             daemon=False
         )
-        t_usbjoy.start()
-        threads.append(t_usbjoy)
+        t_video.start()
+        threads.append(t_video)
+
+        if self.subscriptionInterface_ is not None:
+            self.logger.debug("Starting Subscription Receiver thread...")
+            t_subscribe = threading.Thread(
+                target=self.subscriptionInterface_.ReceiveSubscriptions,
+                name="Subscription Receiver Thread",
+                daemon=False
+            )
+            t_subscribe.start()
+            threads.append(t_subscribe)
+
+
+        if self.usbJoystickInterface_ is not None:
+            t_usbjoy = threading.Thread(
+                target=self.usbJoystickInterface_.Run,
+                name="USBJoystickThread",
+                daemon=False
+            )
+            t_usbjoy.start()
+            threads.append(t_usbjoy)
 
         self.logger.info("All threads have been launched.")
+        self.StartupComplete()
         # Wait for all threads to finish
         for thread in threads:
             self.logger.info(f"Waiting for thread {thread.name} to finish...")
             thread.join()
 
+        self.mavLinkWriterInterface.Stop()
+        if self.recorder_ is not None:
+            self.recorder_.Close()
         self.logger.info("All threads have terminated. Mission Planner Integration process completed.")
 
 
+    def StartAsync(self):
+        """Run every UDP interface on one event loop instead of one thread per socket."""
+        self.logger.info("Starting asyncio runtime")
+        runtime = AsyncRuntime()
+        self.runtime_ = runtime
+
+        runtime.AddReceiver("Touch App Receiver", self.gcsInterface_.touchChannel_,
+                            lambda data: self.gcsInterface_.HandleTouchPacket(self.state_, data))
+        runtime.AddReceiver("Joystick Receiver", self.raspiInterface_.joystickChannel_,
+                            lambda data: self.raspiInterface_.HandleJoystickPacket(self.state_, data))
+        runtime.AddReceiver("Temperature Receiver", self.raspiInterface_.tempChannel_,
+                            lambda data: self.raspiInterface_.HandleTemperaturePacket(self.state_, data))
+        runtime.AddReceiver("Meta Receiver", self.metaInterface_.receiverChannel_,
+                            self.metaInterface_.HandleMetaPacket)
+        if self.subscriptionInterface_ is not None:
+            runtime.AddReceiver("Subscription Receiver", self.subscriptionInterface_.channel_,
+                                self.subscriptionInterface_.HandleSubscribePacket, withAddress=True)
+
+        runtime.AddTask("GCS Control Handler",
+                        lambda: self.gcsInterface_.GCSControlHandlerAsync(self.state_, self.mavLinkWriterInterface),
+                        stop=self.gcsInterface_.Stop)
+        runtime.AddTask("Meta Publisher",
+                        lambda: self.metaInterface_.GCSToMetaAsync(self.state_, self.fleet_),
+                        stop=self.metaInterface_.Stop)
+        runtime.AddTask("VideoApp Publisher",
+                        lambda: self.videoappInterface_.MissionPlannerToVideoAppAsync(self.state_, self.fleet_),
+                        stop=self.videoappInterface_.Stop)
+
+        # pymavlink and pygame only offer blocking APIs.
+        runtime.AddBlocking("Mavlink Connection", self.mavlinkConnection_.ReceiveLoop,
+                            stop=self.mavlinkConnection_.Stop)
+        if self.usbJoystickInterface_ is not None:
+            runtime.AddBlocking("USB Joystick", self.usbJoystickInterface_.Run,
+                                stop=self.usbJoystickInterface_.Stop)
+
+        try:
+            runtime.Run(onStarted=self.StartupComplete)
+        finally:
+            self.mavLinkWriterInterface.Stop()
+            if self.recorder_ is not None:
+                self.recorder_.Close()
+        self.logger.info("Asyncio runtime terminated. Mission Planner Integration process completed.")
+
+    def StartProcesses(self):
+        """
+        Run the MAVLink reader, the USB joystick and the publishers in their own
+        processes, sharing state_ through shared memory; the UDP receivers and
+        the GCS control loop stay in this process.
+        """
+        self.logger.info("Starting process runtime")
+        from state.SharedStateBlock import SharedStateBlock
+        self.sharedState_ = SharedStateBlock(self.config_.sharedStateName_, create=True,
+                                             vehicleId=self.config_.id_)
+        self.sharedState_.Attach(self.state_)
+        if self.recorder_ is not None:
+            # The recorder's writer thread only exists in this process.
+            self.logger.warning("MAVLink frames are not recorded in the processes runtime.")
+            self.mavlinkConnection_.recorder_ = None
+
+        runtime = ProcessRuntime()
+        self.runtime_ = runtime
+        runtime.AddProcess("Mavlink Connection", self.mavlinkConnection_.ReceiveLoop,
+                           stop=self.mavlinkConnection_.Stop)
+        if self.usbJoystickInterface_ is not None:
+            runtime.AddProcess("USB Joystick", self.usbJoystickInterface_.Run,
+                               stop=self.usbJoystickInterface_.Stop)
+        runtime.AddProcess("Meta Publisher", lambda: self.metaInterface_.GCSToMeta(self.state_),
+                           stop=self.metaInterface_.Stop)
+        runtime.AddProcess("VideoApp Publisher", lambda: self.videoappInterface_.MissionPlannerToVideoApp(self.state_),
+                           stop=self.videoappInterface_.Stop)
+
+        runtime.AddThread("Touch App Receiver", lambda: self.gcsInterface_.TouchAppReceiver(self.state_))
+        runtime.AddThread("GCS Control Handler",
+                          lambda: self.gcsInterface_.GCSControlHandler(self.state_, self.mavLinkWriterInterface),
+                          stop=self.gcsInterface_.Stop)
+        runtime.AddThread("Joystick Reader Interface",
+                          lambda: self.raspiInterface_.ReceiveJoystick(self.state_))
+        runtime.AddThread("Temperature Reader Interface",
+                          lambda: self.raspiInterface_.ReceiveTemperature(self.state_))
+
+        try:
+            runtime.Run(onStarted=self.StartupComplete)
+        finally:
+            self.mavLinkWriterInterface.Stop()
+            if self.recorder_ is not None:
+                self.recorder_.Close()
+            self.sharedState_.Close()
+        self.logger.info("Process runtime terminated. Mission Planner Integration process completed.")
+
+
 if __name__ == "__main__":
 
     mp = MissionPlannerIntegrator()
-    mp.Start()
\ No newline at end of file
+    try:
+        mp.Start()
+    finally:
+        mp.logPipeline_.Stop()
\ No newline at end of file
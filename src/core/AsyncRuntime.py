@@ -0,0 +1,124 @@
+"""
+Module: AsyncRuntime.py
+Description: Runs every UDP receiver and periodic sender on a single asyncio event loop.
+"""
+import asyncio
+import logging
+import signal
+from concurrent.futures import ThreadPoolExecutor
+
+class DatagramReceiver(asyncio.DatagramProtocol):
+    """Feeds each datagram arriving on a UDPChannel socket to a packet handler."""
+    def __init__(self, name, channel, handler, withAddress=False):
+        self.logger = logging.getLogger(name)
+        self.name_ = name
+        self.channel_ = channel
+        self.handler_ = handler
+        self.withAddress_ = withAddress
+
+    def datagram_received(self, data, addr):
+        recorder = self.channel_.recorder_
+        if recorder is not None:
+            recorder.Record(self.channel_.recordChannel_, data)
+        try:
+            if self.withAddress_:
+                self.handler_(data, addr)
+            else:
+                self.handler_(data)
+        except Exception as e:
+            self.logger.error(f"{self.name_} packet error: {e}")
+
+    def error_received(self, exc):
+        self.logger.error(f"{self.name_} socket error: {exc}")
+
+class AsyncRuntime:
+    """
+    One event loop for all UDP interfaces.
+
+    Receivers are DatagramProtocols on the channels' existing sockets, periodic
+    senders are loop tasks, and only the calls that block inside third-party
+    libraries (pymavlink, pygame) are handed to a small thread pool. Stop()
+    is the single shutdown point for all of them.
+    """
+    def __init__(self, maxBlockingWorkers=2, shutdownTimeout=2.0):
+        self.logger = logging.getLogger("Async Runtime")
+        self.receivers_ = []
+        self.tasks_ = []
+        self.blocking_ = []
+        self.stopCallbacks_ = []
+        self.maxBlockingWorkers_ = maxBlockingWorkers
+        self.shutdownTimeout_ = shutdownTimeout
+        self.loop_ = None
+        self.stopEvent_ = None
+
+    def AddReceiver(self, name, channel, handler, withAddress=False):
+        """handler(data), or handler(data, address) with withAddress."""
+        self.receivers_.append((name, channel, handler, withAddress))
+
+    def AddTask(self, name, coroutineFactory, stop=None):
+        self.tasks_.append((name, coroutineFactory))
+        if stop is not None:
+            self.stopCallbacks_.append(stop)
+
+    def AddBlocking(self, name, function, stop=None):
+        self.blocking_.append((name, function))
+        if stop is not None:
+            self.stopCallbacks_.append(stop)
+
+    def Run(self, onStarted=None):
+        """onStarted() is called once every receiver, task and blocking worker has been launched."""
+        asyncio.run(self.Main(onStarted))
+
+    def Stop(self):
+        """Request shutdown. Safe to call from any thread."""
+        if self.loop_ is not None and self.stopEvent_ is not None:
+            self.loop_.call_soon_threadsafe(self.stopEvent_.set)
+
+    async def Main(self, onStarted=None):
+        self.loop_ = asyncio.get_running_loop()
+        self.stopEvent_ = asyncio.Event()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            try:
+                self.loop_.add_signal_handler(sig, self.stopEvent_.set)
+            except (NotImplementedError, RuntimeError):
+                pass  # Windows: KeyboardInterrupt still ends asyncio.run()
+
+        transports = []
+        for name, channel, handler, withAddress in self.receivers_:
+            transport, _ = await self.loop_.create_datagram_endpoint(
+                lambda name=name, channel=channel, handler=handler, withAddress=withAddress:
+                    DatagramReceiver(name, channel, handler, withAddress),
+                sock=channel.socket_)
+            transports.append(transport)
+            self.logger.debug(f"Receiver {name} registered on port {channel.port_}")
+
+        tasks = [asyncio.create_task(factory(), name=name) for name, factory in self.tasks_]
+
+        executor = ThreadPoolExecutor(max_workers=max(1, self.maxBlockingWorkers_),
+                                      thread_name_prefix="Blocking")
+        blocking = [self.loop_.run_in_executor(executor, function) for _, function in self.blocking_]
+        self.logger.info(f"Async runtime started: {len(transports)} receivers, "
+                         f"{len(tasks)} tasks, {len(blocking)} blocking workers.")
+        if onStarted is not None:
+            onStarted()
+
+        try:
+            await self.stopEvent_.wait()
+        finally:
+            self.logger.info("Async runtime shutting down...")
+            for stop in self.stopCallbacks_:
+                try:
+                    stop()
+                except Exception as e:
+                    self.logger.error(f"Error during shutdown: {e}")
+            for transport in transports:
+                transport.close()
+            pending = tasks + blocking
+            if pending:
+                done, notDone = await asyncio.wait(pending, timeout=self.shutdownTimeout_)
+                for task in notDone:
+                    task.cancel()
+                if notDone:
+                    self.logger.warning(f"{len(notDone)} workers did not stop within {self.shutdownTimeout_}s")
+            executor.shutdown(wait=False)
+            self.logger.info("Async runtime stopped.")
@@ -0,0 +1,147 @@
+"""
+Module: CommandQueue.py
+Description: Coalescing, prioritised outbound command queue drained by one writer thread.
+"""
+import os
+import time
+import logging
+import threading
+from core.Metrics import GetMetrics
+
+# Lower values are sent first. Critical commands also bypass the rate caps.
+PRIORITY_CRITICAL = 0
+PRIORITY_COMMAND = 1
+PRIORITY_STREAM = 2
+
+class CommandKind:
+    """Per-kind sending policy: rate cap and how often an unchanged command is repeated."""
+    def __init__(self, maxRateHz=0.0, keepaliveHz=0.0, suppressRepeats=True):
+        self.SetRates(maxRateHz, keepaliveHz)
+        self.suppressRepeats_ = suppressRepeats
+        self.lastSendTime_ = -float("inf")
+
+    def SetRates(self, maxRateHz, keepaliveHz):
+        self.minInterval_ = 1.0 / maxRateHz if maxRateHz > 0 else 0.0
+        self.keepalivePeriod_ = 1.0 / keepaliveHz if keepaliveHz > 0 else float("inf")
+
+class CommandQueue:
+    """
+    Holds at most one pending command per key; submitting a command for a key
+    that is still pending replaces it (the older one is superseded). The
+    writer thread sends the highest-priority pending command whose kind is
+    not rate-capped at the moment, so callers never wait for the socket.
+
+    A command identical to the last one sent for its key is dropped unless
+    its kind's keepalive period has passed, so steady streams such as RC
+    overrides only repeat as often as the vehicle needs them.
+    """
+    def __init__(self, name, kinds):
+        self.logger = logging.getLogger(name)
+        self.name_ = name
+        self.kinds_ = kinds
+        self.pending_ = {}      # key -> [priority, order, kind, payload, send, submit time]
+        self.lastSent_ = {}     # key -> (payload, send time)
+        self.order_ = 0
+        self.running_ = True
+        self.condition_ = threading.Condition()
+        self.thread_ = None
+        self.threadPid_ = None
+        os.register_at_fork(after_in_child=self.AfterForkInChild)
+
+        metrics = GetMetrics(name)
+        self.submittedCount_ = metrics.Counter("submitted")
+        self.sentCount_ = metrics.Counter("sent")
+        self.supersededCount_ = metrics.Counter("superseded")
+        self.repeatCount_ = metrics.Counter("repeats_suppressed")
+        self.sendErrors_ = metrics.Counter("send_errors")
+        self.queueLatency_ = metrics.Histogram("queue_latency")
+        metrics.Gauge("pending", lambda: len(self.pending_))
+
+    def AfterForkInChild(self):
+        # The writer thread and the lock state do not survive a fork.
+        self.condition_ = threading.Condition()
+        self.thread_ = None
+
+    def Submit(self, key, kind, payload, send, priority=PRIORITY_STREAM):
+        """Queue send(*payload) under key, replacing any pending command for key."""
+        now = time.monotonic()
+        with self.condition_:
+            if self.thread_ is None or self.threadPid_ != os.getpid():
+                self.StartWriter()
+            self.submittedCount_.Add()
+            entry = self.pending_.get(key)
+            if entry is not None:
+                self.supersededCount_.Add()
+                # Keep the original submit time, so queue latency counts from the first request.
+                entry[0] = min(entry[0], priority)
+                entry[3] = payload
+                entry[4] = send
+            else:
+                self.order_ += 1
+                self.pending_[key] = [priority, self.order_, kind, payload, send, now]
+            self.condition_.notify()
+
+    def StartWriter(self):
+        self.thread_ = threading.Thread(target=self.WriterLoop, name=f"{self.name_} Thread", daemon=True)
+        self.threadPid_ = os.getpid()
+        self.thread_.start()
+
+    def NextReady(self, now):
+        """
+        Key of the next command to send, or None. When None, also returns how
+        long until a rate-capped command becomes sendable (None: nothing pending).
+        """
+        best = None
+        wait = None
+        for key, entry in self.pending_.items():
+            if entry[0] != PRIORITY_CRITICAL:
+                kind = self.kinds_[entry[2]]
+                readyAt = kind.lastSendTime_ + kind.minInterval_
+                if readyAt > now:
+                    wait = readyAt - now if wait is None else min(wait, readyAt - now)
+                    continue
+            if best is None or entry[:2] < self.pending_[best][:2]:
+                best = key
+        return best, wait
+
+    def WriterLoop(self):
+        while True:
+            with self.condition_:
+                while True:
+                    if not self.running_ and not self.pending_:
+                        return
+                    now = time.monotonic()
+                    key, wait = self.NextReady(now)
+                    if key is not None:
+                        entry = self.pending_.pop(key)
+                        break
+                    self.condition_.wait(wait)
+            self.Transmit(key, entry, now)
+
+    def Transmit(self, key, entry, now):
+        priority, order, kindName, payload, send, submitted = entry
+        kind = self.kinds_[kindName]
+        last = self.lastSent_.get(key)
+        if (kind.suppressRepeats_ and last is not None and last[0] == payload
+                and now - last[1] < kind.keepalivePeriod_):
+            self.repeatCount_.Add()
+            return
+        try:
+            send(*payload)
+        except Exception as e:
+            self.sendErrors_.Add()
+            self.logger.error(f"{self.name_} send error for {key}: {e}")
+            return
+        kind.lastSendTime_ = now
+        self.lastSent_[key] = (payload, now)
+        self.sentCount_.Add()
+        self.queueLatency_.Record(time.monotonic() - submitted)
+
+    def Stop(self, timeout=1.0):
+        """Send what is still pending, then stop the writer thread."""
+        with self.condition_:
+            self.running_ = False
+            self.condition_.notify()
+            thread = self.thread_
+        if thread is not None and thread.is_alive():
+            thread.join(timeout)
@@ -0,0 +1,74 @@
+"""
+Module: ConfigWatcher.py
+Description: Polls the configuration file and hands each new valid version to a callback.
+"""
+import os
+import logging
+import threading
+
+class ConfigWatcher:
+    """
+    Checks the file's modification time and size every `interval` seconds.
+    A change is only loaded once the file has stayed the same for one more
+    interval, so an editor that is still writing it is not read half-way.
+    load(path) must return the compiled configuration or raise; on an error
+    the running configuration is kept and the error logged.
+    """
+    def __init__(self, path, load, apply, interval=0.5):
+        self.logger = logging.getLogger("Config Watcher")
+        self.path_ = path
+        self.load_ = load
+        self.apply_ = apply
+        self.interval_ = interval
+        self.stopEvent_ = threading.Event()
+        self.thread_ = None
+        self.loaded_ = self.Signature()
+        self.reloadCount_ = 0
+        self.errorCount_ = 0
+
+    def Signature(self):
+        try:
+            stat = os.stat(self.path_)
+        except OSError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size)
+
+    def Start(self):
+        self.thread_ = threading.Thread(target=self.Run, name="Config Watcher Thread", daemon=True)
+        self.thread_.start()
+        return self
+
+    def Stop(self):
+        self.stopEvent_.set()
+
+    def Run(self):
+        self.logger.info(f"Watching {self.path_} for changes every {self.interval_ * 1000:.0f} ms")
+        pending = None
+        while not self.stopEvent_.wait(self.interval_):
+            signature = self.Signature()
+            if signature is None or signature == self.loaded_:
+                pending = None
+                continue
+            if signature != pending:
+                pending = signature
+                continue
+            self.loaded_ = signature
+            pending = None
+            self.Reload()
+
+    def Reload(self):
+        try:
+            config = self.load_(self.path_)
+        except Exception as e:
+            self.errorCount_ += 1
+            self.logger.error(f"Keeping the running configuration: {e}")
+            return
+        try:
+            self.apply_(config)
+            self.reloadCount_ += 1
+        except Exception as e:
+            self.errorCount_ += 1
+            self.logger.error(f"Error applying reloaded configuration: {e}")
+
+    def Stats(self):
+        return {"reloads": self.reloadCount_, "errors": self.errorCount_}
@@ -0,0 +1,102 @@
+"""
+Module: DependencyCheck.py
+Description: Offline check that the packages in requirements.txt are installed, cached between runs.
+
+Nothing is downloaded or installed at startup: a missing package is
+reported with the pip command that fixes it. The result is cached in a
+small JSON file keyed by the requirements file, the interpreter and the
+modification times of the package directories on sys.path, so a restart
+with an unchanged environment does not look up any package metadata.
+"""
+import os
+import re
+import sys
+import json
+import hashlib
+import logging
+
+CACHE_FILE = ".dependency_check.json"
+# Distribution name at the start of a requirements line, before any version or marker.
+REQUIREMENT_NAME = re.compile(r"^\s*([A-Za-z0-9][A-Za-z0-9._-]*)")
+
+def ReadRequirements(path):
+    names = []
+    with open(path, "r") as requirements:
+        for line in requirements:
+            line = line.split("#", 1)[0]
+            match = REQUIREMENT_NAME.match(line)
+            if match:
+                names.append(match.group(1))
+    return names
+
+def EnvironmentKey(requirementsPath):
+    """Changes when the requirements, the interpreter or any installed package set changes."""
+    digest = hashlib.sha1()
+    with open(requirementsPath, "rb") as requirements:
+        digest.update(requirements.read())
+    digest.update(sys.executable.encode())
+    digest.update(sys.version.encode())
+    for entry in sys.path:
+        try:
+            digest.update(f"{entry}:{os.stat(entry or '.').st_mtime_ns}".encode())
+        except OSError:
+            pass
+    return digest.hexdigest()
+
+class MissingDependencyError(RuntimeError):
+    pass
+
+class DependencyCheck:
+    """
+    optional maps a requirement name to whether it is needed with the
+    current configuration (e.g. pygame only when the USB joystick is on).
+    """
+    def __init__(self, requirementsPath="requirements.txt", cachePath=CACHE_FILE, optional=None):
+        self.logger = logging.getLogger("Dependency Check")
+        self.requirementsPath_ = requirementsPath
+        self.cachePath_ = cachePath
+        self.optional_ = optional or {}
+
+    def Missing(self):
+        """Names of the needed requirements that are not installed."""
+        key = EnvironmentKey(self.requirementsPath_)
+        needed = [name for name in ReadRequirements(self.requirementsPath_)
+                  if self.optional_.get(name.lower(), True)]
+        cached = self.LoadCache()
+        if cached.get("key") == key and set(needed) <= set(cached.get("installed", ())):
+            return []
+        # Only imported on a cache miss; it is slow to load.
+        from importlib import metadata
+        missing = []
+        for name in needed:
+            try:
+                metadata.version(name)
+            except metadata.PackageNotFoundError:
+                missing.append(name)
+        if not missing:
+            self.SaveCache(key, needed)
+        return missing
+
+    def Run(self):
+        """Raise MissingDependencyError if a needed package is missing."""
+        if not os.path.exists(self.requirementsPath_):
+            self.logger.warning(f"{self.requirementsPath_} not found, skipping dependency check")
+            return
+        missing = self.Missing()
+        if missing:
+            raise MissingDependencyError(f"Missing dependencies: {', '.join(missing)}. Install them with: "
+                                         f"{sys.executable} -m pip install -r {self.requirementsPath_}")
+
+    def LoadCache(self):
+        try:
+            with open(self.cachePath_, "r") as cache:
+                return json.load(cache)
+        except (OSError, ValueError):
+            return {}
+
+    def SaveCache(self, key, installed):
+        try:
+            with open(self.cachePath_, "w") as cache:
+                json.dump({"key": key, "installed": installed}, cache)
+        except OSError as e:
+            self.logger.warning(f"Could not write dependency cache {self.cachePath_}: {e}")
@@ -0,0 +1,140 @@
+"""
+Module: FlightRecorder.py
+Description: Append-only, memory-mapped binary journal of every inbound frame, and its reader.
+
+Journal layout (little endian):
+    header:  magic b"MPFJ", uint16 version, uint16 reserved, float64 wall-clock start time
+    records: float64 seconds since start (monotonic), uint16 channel, uint16 length, payload
+
+The file grows in fixed-size chunks and is truncated to its real length on
+Close(). After a crash the unused tail is zero-filled; a record with channel
+0 marks the end of the journal.
+"""
+import os
+import mmap
+import time
+import struct
+import logging
+import threading
+from collections import deque
+
+JOURNAL_MAGIC = b"MPFJ"
+JOURNAL_VERSION = 1
+JOURNAL_HEADER = struct.Struct("<4sHHd")
+RECORD_HEADER = struct.Struct("<dHH")
+
+CHANNEL_MAVLINK = 1
+CHANNEL_TOUCH = 2
+CHANNEL_JOYSTICK = 3
+CHANNEL_TEMPERATURE = 4
+CHANNEL_META = 5
+CHANNEL_NAMES = {
+    CHANNEL_MAVLINK: "mavlink",
+    CHANNEL_TOUCH: "touch",
+    CHANNEL_JOYSTICK: "joystick",
+    CHANNEL_TEMPERATURE: "temperature",
+    CHANNEL_META: "meta",
+}
+
+class FlightRecorder:
+    """
+    Records inbound frames without blocking the receive threads.
+
+    Record() only timestamps the frame, copies it and appends it to a deque;
+    a background thread moves queued frames into the memory-mapped journal.
+    If the writer falls more than maxPending frames behind, new frames are
+    dropped and counted instead of growing memory without bound.
+    """
+    def __init__(self, path, chunkSize=16 * 1024 * 1024, maxPending=100000, flushInterval=0.02):
+        self.logger = logging.getLogger("Flight Recorder")
+        self.path_ = path
+        self.chunkSize_ = chunkSize
+        self.maxPending_ = maxPending
+        self.flushInterval_ = flushInterval
+        self.pending_ = deque()
+        self.recordedCount_ = 0
+        self.droppedCount_ = 0
+        self.startMonotonic_ = time.monotonic()
+        self.stopEvent_ = threading.Event()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.file_ = open(path, "w+b")
+        self.size_ = chunkSize
+        self.file_.truncate(self.size_)
+        self.map_ = mmap.mmap(self.file_.fileno(), self.size_)
+        JOURNAL_HEADER.pack_into(self.map_, 0, JOURNAL_MAGIC, JOURNAL_VERSION, 0, time.time())
+        self.offset_ = JOURNAL_HEADER.size
+
+        self.thread_ = threading.Thread(target=self.WriterLoop, name="Flight Recorder Thread", daemon=True)
+        self.thread_.start()
+        self.logger.info(f"Recording inbound frames to {path}")
+
+    def Record(self, channel, data):
+        """Queue one frame. Safe to call from any thread; never blocks on I/O."""
+        if len(self.pending_) >= self.maxPending_:
+            self.droppedCount_ += 1
+            return
+        self.pending_.append((time.monotonic() - self.startMonotonic_, channel, bytes(data)))
+
+    def WriterLoop(self):
+        while not self.stopEvent_.wait(self.flushInterval_):
+            self.WritePending()
+        self.WritePending()
+
+    def WritePending(self):
+        pending = self.pending_
+        while pending:
+            timestamp, channel, data = pending.popleft()
+            end = self.offset_ + RECORD_HEADER.size + len(data)
+            if end > self.size_:
+                self.Grow(end)
+            RECORD_HEADER.pack_into(self.map_, self.offset_, timestamp, channel, len(data))
+            self.map_[self.offset_ + RECORD_HEADER.size:end] = data
+            self.offset_ = end
+            self.recordedCount_ += 1
+
+    def Grow(self, required):
+        self.map_.flush()
+        self.map_.close()
+        while self.size_ < required:
+            self.size_ += self.chunkSize_
+        self.file_.truncate(self.size_)
+        self.map_ = mmap.mmap(self.file_.fileno(), self.size_)
+
+    def Close(self):
+        self.stopEvent_.set()
+        self.thread_.join()
+        self.map_.flush()
+        self.map_.close()
+        self.file_.truncate(self.offset_)
+        self.file_.close()
+        self.logger.info(f"Recorder closed: {self.recordedCount_} frames, {self.droppedCount_} dropped, "
+                         f"{self.offset_} bytes")
+
+    def Stats(self):
+        return {"recorded": self.recordedCount_, "dropped": self.droppedCount_,
+                "pending": len(self.pending_), "bytes": self.offset_}
+
+def ReadJournal(path):
+    """Yield (seconds, channel, payload) for every record in a journal, in order."""
+    with open(path, "rb") as f:
+        data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            magic, version, _, startTime = JOURNAL_HEADER.unpack_from(data, 0)
+            if magic != JOURNAL_MAGIC or version != JOURNAL_VERSION:
+                raise ValueError(f"{path} is not a version {JOURNAL_VERSION} flight journal")
+            offset = JOURNAL_HEADER.size
+            end = len(data)
+            while offset + RECORD_HEADER.size <= end:
+                timestamp, channel, length = RECORD_HEADER.unpack_from(data, offset)
+                if channel == 0:
+                    break
+                offset += RECORD_HEADER.size
+                if offset + length > end:
+                    break
+                yield timestamp, channel, data[offset:offset + length]
+                offset += length
+        finally:
+            data.close()
@@ -0,0 +1,277 @@
+"""
+Module: Geofence.py
+Description: Inclusion/exclusion polygons and altitude limits checked on every position update.
+
+Fences are loaded from a GeoJSON FeatureCollection of Polygon or
+MultiPolygon features; only the outer ring of each polygon is used and
+coordinates are [lon, lat] as GeoJSON has them. Feature properties:
+    fence:          "inclusion" or "exclusion" (default "exclusion")
+    name:           label used in events (default: the feature's index)
+    floor, ceiling: optional altitude band in metres. Inside an inclusion
+                    polygon the vehicle must stay within its band; an
+                    exclusion polygon only forbids its band (all altitudes
+                    when it has none).
+When there are inclusion polygons, the vehicle must be inside at least one.
+
+Positions are projected onto a local east/north plane in metres around the
+centre of the fence set (equirectangular; the error stays well below 1 %
+over the tens of kilometres a fence set covers). Each polygon is entered in
+every cell of a uniform grid that its bounding box, grown by the near-breach
+margin, overlaps, so one update only tests the polygons of one cell.
+"""
+import json
+import math
+import time
+import logging
+from collections import namedtuple
+import numpy as np
+from core.Metrics import GetMetrics
+
+EARTH_RADIUS = 6371000.0
+
+LEVEL_CLEAR = 0
+LEVEL_NEAR = 1
+LEVEL_BREACH = 2
+LEVEL_NAMES = ("clear", "near breach", "breach")
+
+GeofenceEvent = namedtuple("GeofenceEvent",
+                           ("sysid", "level", "previousLevel", "reasons", "latitude", "longitude", "altitude"))
+
+class FencePolygon:
+    """One polygon in local metres, with its edges precomputed for vectorised tests."""
+    __slots__ = ("name_", "inclusion_", "floor_", "ceiling_", "bounds_",
+                 "x0_", "y0_", "dx_", "dy_", "slope_", "length2_")
+
+    def __init__(self, name, inclusion, points, floor=None, ceiling=None):
+        if len(points) > 1 and points[0] == points[-1]:
+            points = points[:-1]
+        if len(points) < 3:
+            raise ValueError(f"Fence {name}: a polygon needs at least 3 vertices")
+        self.name_ = name
+        self.inclusion_ = inclusion
+        self.floor_ = floor
+        self.ceiling_ = ceiling
+        vertices = np.asarray(points, dtype=float)
+        self.x0_ = vertices[:, 0]
+        self.y0_ = vertices[:, 1]
+        self.dx_ = np.roll(self.x0_, -1) - self.x0_
+        self.dy_ = np.roll(self.y0_, -1) - self.y0_
+        # Horizontal edges never cross the test ray, so their slope is unused.
+        flat = self.dy_ == 0
+        self.slope_ = self.dx_ / np.where(flat, 1.0, self.dy_)
+        self.length2_ = np.maximum(self.dx_ * self.dx_ + self.dy_ * self.dy_, 1e-12)
+        self.bounds_ = (float(self.x0_.min()), float(self.y0_.min()),
+                        float(self.x0_.max()), float(self.y0_.max()))
+
+    def Contains(self, x, y):
+        """Even-odd ray casting towards +x."""
+        y0 = self.y0_
+        crosses = (y0 > y) != (y0 + self.dy_ > y)
+        return bool(np.count_nonzero(crosses & (x < self.x0_ + (y - y0) * self.slope_)) & 1)
+
+    def Distance(self, x, y):
+        """Distance in metres from (x, y) to the nearest edge."""
+        px = x - self.x0_
+        py = y - self.y0_
+        t = np.clip((px * self.dx_ + py * self.dy_) / self.length2_, 0.0, 1.0)
+        ex = px - t * self.dx_
+        ey = py - t * self.dy_
+        return math.sqrt(float(np.min(ex * ex + ey * ey)))
+
+    def InBand(self, altitude, margin=0.0):
+        """True if altitude is within the polygon's band grown by margin (shrunk if negative)."""
+        return ((self.floor_ is None or altitude >= self.floor_ - margin)
+                and (self.ceiling_ is None or altitude <= self.ceiling_ + margin))
+
+class Geofence:
+    """
+    An immutable fence set. zones are (name, inclusion, [(lat, lon), ...],
+    floor, ceiling) tuples; floor and ceiling are the global altitude limits.
+    nearMargin (horizontal) and altitudeMargin (vertical) are how close to a
+    limit counts as a near breach.
+    """
+    def __init__(self, zones, floor=None, ceiling=None, nearMargin=20.0, altitudeMargin=5.0, cellSize=500.0):
+        self.floor_ = floor
+        self.ceiling_ = ceiling
+        self.nearMargin_ = nearMargin
+        self.altitudeMargin_ = altitudeMargin
+        self.cellSize_ = cellSize
+
+        latitudes = [lat for zone in zones for lat, lon in zone[2]]
+        longitudes = [lon for zone in zones for lat, lon in zone[2]]
+        self.originLat_ = (min(latitudes) + max(latitudes)) / 2 if zones else 0.0
+        self.originLon_ = (min(longitudes) + max(longitudes)) / 2 if zones else 0.0
+        self.metresPerDegLat_ = math.radians(EARTH_RADIUS)
+        self.metresPerDegLon_ = self.metresPerDegLat_ * math.cos(math.radians(self.originLat_))
+
+        self.polygons_ = [FencePolygon(name, inclusion, [self.Project(lat, lon) for lat, lon in points],
+                                       zoneFloor, zoneCeiling)
+                          for name, inclusion, points, zoneFloor, zoneCeiling in zones]
+        self.hasInclusion_ = any(polygon.inclusion_ for polygon in self.polygons_)
+
+        self.cells_ = {}
+        for polygon in self.polygons_:
+            minX, minY, maxX, maxY = polygon.bounds_
+            for ix in range(self.Cell(minX - nearMargin), self.Cell(maxX + nearMargin) + 1):
+                for iy in range(self.Cell(minY - nearMargin), self.Cell(maxY + nearMargin) + 1):
+                    self.cells_.setdefault((ix, iy), []).append(polygon)
+
+    def __len__(self):
+        return len(self.polygons_)
+
+    def Project(self, lat, lon):
+        """(east, north) in metres from the fence origin."""
+        return ((lon - self.originLon_) * self.metresPerDegLon_,
+                (lat - self.originLat_) * self.metresPerDegLat_)
+
+    def Cell(self, metres):
+        return math.floor(metres / self.cellSize_)
+
+    def Evaluate(self, lat, lon, altitude):
+        """
+        (level, reasons) for one position. reasons is a sorted tuple of short
+        descriptions without measured values, so it only changes when the
+        vehicle crosses into or out of a limit.
+        """
+        level = LEVEL_CLEAR
+        reasons = []
+        altitudeMargin = self.altitudeMargin_
+        if self.floor_ is not None and altitude < self.floor_ + altitudeMargin:
+            breach = altitude < self.floor_
+            level = max(level, LEVEL_BREACH if breach else LEVEL_NEAR)
+            reasons.append("below floor" if breach else "near floor")
+        if self.ceiling_ is not None and altitude > self.ceiling_ - altitudeMargin:
+            breach = altitude > self.ceiling_
+            level = max(level, LEVEL_BREACH if breach else LEVEL_NEAR)
+            reasons.append("above ceiling" if breach else "near ceiling")
+
+        x, y = self.Project(lat, lon)
+        margin = self.nearMargin_
+        inside = False       # in the band of at least one inclusion polygon
+        clearInside = False  # ... and away from its edges and band limits
+        edges = []
+        for polygon in self.cells_.get((self.Cell(x), self.Cell(y)), ()):
+            minX, minY, maxX, maxY = polygon.bounds_
+            if x < minX - margin or x > maxX + margin or y < minY - margin or y > maxY + margin:
+                continue
+            contains = minX <= x <= maxX and minY <= y <= maxY and polygon.Contains(x, y)
+            if polygon.inclusion_:
+                if contains and polygon.InBand(altitude):
+                    inside = True
+                    if polygon.InBand(altitude, -altitudeMargin) and polygon.Distance(x, y) >= margin:
+                        clearInside = True
+                    else:
+                        edges.append(polygon.name_)
+            elif contains and polygon.InBand(altitude):
+                level = LEVEL_BREACH
+                reasons.append(f"inside {polygon.name_}")
+            elif polygon.InBand(altitude, altitudeMargin) and (contains or polygon.Distance(x, y) < margin):
+                level = max(level, LEVEL_NEAR)
+                reasons.append(f"near {polygon.name_}")
+        if self.hasInclusion_:
+            if not inside:
+                level = LEVEL_BREACH
+                reasons.append("outside inclusion area")
+            elif not clearInside:
+                level = max(level, LEVEL_NEAR)
+                reasons += [f"near edge of {name}" for name in edges]
+        return level, tuple(sorted(reasons))
+
+def LoadGeofence(path, floor=None, ceiling=None, nearMargin=20.0, altitudeMargin=5.0, cellSize=500.0):
+    """Geofence from a GeoJSON file (see the module description for the properties used)."""
+    with open(path, "r", encoding="utf-8") as f:
+        document = json.load(f)
+    features = document["features"] if document.get("type") == "FeatureCollection" else [document]
+    zones = []
+    for index, feature in enumerate(features):
+        geometry = feature.get("geometry") or {}
+        properties = feature.get("properties") or {}
+        name = str(properties.get("name", index))
+        kind = properties.get("fence", "exclusion")
+        if kind not in ("inclusion", "exclusion"):
+            raise ValueError(f"{path}: feature {name} has unknown fence type '{kind}'")
+        if geometry.get("type") == "Polygon":
+            polygons = [geometry["coordinates"]]
+        elif geometry.get("type") == "MultiPolygon":
+            polygons = geometry["coordinates"]
+        else:
+            raise ValueError(f"{path}: feature {name} is not a Polygon or MultiPolygon")
+        zoneFloor = properties.get("floor")
+        zoneCeiling = properties.get("ceiling")
+        for rings in polygons:
+            points = [(position[1], position[0]) for position in rings[0]]
+            zones.append((name, kind == "inclusion", points,
+                          None if zoneFloor is None else float(zoneFloor),
+                          None if zoneCeiling is None else float(zoneCeiling)))
+    return Geofence(zones, floor, ceiling, nearMargin, altitudeMargin, cellSize)
+
+class GeofenceMonitor:
+    """
+    Checks every GLOBAL_POSITION_INT on the shared connection against the
+    fence, inline in the receive loop, and raises a GeofenceEvent whenever a
+    vehicle's level or reasons change. Listeners are called with the event
+    on the receive thread, so they must not block.
+    """
+    def __init__(self, fence, connection, altitudeReference="relative"):
+        self.logger = logging.getLogger("Geofence")
+        self.fence_ = fence
+        self.relativeAltitude_ = altitudeReference == "relative"
+        self.status_ = {}  # sysid -> (level, reasons)
+        self.listeners_ = []
+        metrics = GetMetrics("Geofence")
+        self.breachCount_ = metrics.Counter("breaches")
+        self.nearCount_ = metrics.Counter("near_breaches")
+        self.evaluateTime_ = metrics.Histogram("evaluate_time")
+        metrics.Gauge("polygons", lambda: len(self.fence_))
+        metrics.Gauge("vehicles_in_breach",
+                      lambda: sum(1 for level, reasons in list(self.status_.values()) if level == LEVEL_BREACH))
+        self.logger.info(f"Geofence loaded: {len(fence)} polygons in {len(fence.cells_)} grid cells")
+        connection.Subscribe("GLOBAL_POSITION_INT", self.HandleGlobalPosition)
+
+    def AddListener(self, listener):
+        self.listeners_.append(listener)
+
+    def SetFence(self, fence):
+        """Swap in a new fence set; the next position update is checked against it."""
+        self.fence_ = fence
+        self.logger.info(f"Geofence replaced: {len(fence)} polygons in {len(fence.cells_)} grid cells")
+
+    def HandleGlobalPosition(self, msg):
+        # Autopilots send zeros until they have a position fix.
+        if msg.lat == 0 and msg.lon == 0:
+            return
+        start = time.perf_counter()
+        lat = msg.lat / 1e7
+        lon = msg.lon / 1e7
+        altitude = (msg.relative_alt if self.relativeAltitude_ else msg.alt) / 1000.0
+        level, reasons = self.fence_.Evaluate(lat, lon, altitude)
+        self.evaluateTime_.Record(time.perf_counter() - start)
+
+        sysid = msg.get_srcSystem()
+        previous = self.status_.get(sysid, (LEVEL_CLEAR, ()))
+        if (level, reasons) == previous:
+            return
+        self.status_[sysid] = (level, reasons)
+        self.Raise(GeofenceEvent(sysid, level, previous[0], reasons, lat, lon, altitude))
+
+    def Raise(self, event):
+        where = f"at {event.latitude:.6f}, {event.longitude:.6f}, {event.altitude:.1f} m"
+        if event.level == LEVEL_BREACH:
+            if event.previousLevel != LEVEL_BREACH:
+                self.breachCount_.Add()
+            self.logger.warning(f"Geofence breach by system {event.sysid} {where}: {', '.join(event.reasons)}")
+        elif event.level == LEVEL_NEAR:
+            if event.previousLevel == LEVEL_CLEAR:
+                self.nearCount_.Add()
+            self.logger.warning(f"System {event.sysid} near geofence {where}: {', '.join(event.reasons)}")
+        else:
+            self.logger.info(f"System {event.sysid} clear of geofence {where}")
+        for listener in self.listeners_:
+            try:
+                listener(event)
+            except Exception as e:
+                self.logger.error(f"Geofence listener error: {e}")
+
+    def Status(self, sysid):
+        """(level, reasons) of the last position of sysid."""
+        return self.status_.get(sysid, (LEVEL_CLEAR, ()))
@@ -0,0 +1,110 @@
+"""
+Module: GimbalController.py
+Description: Rate-commanded gimbal setpoint with position, rate and acceleration limits.
+
+Both joystick paths drive the gimbal through a GimbalController: the USB
+joystick in mount angles (MAV_CMD_DO_MOUNT_CONTROL, degrees) and the UDP
+joystick in RC override PWM. The caller passes the stick rate command and
+the measured time since its previous step, so the gimbal moves the same
+distance per second of stick however often the loop gets to run.
+
+Optionally the setpoint is held within maxLead of the gimbal's reported
+angle (MOUNT_STATUS, MOUNT_ORIENTATION or GIMBAL_DEVICE_ATTITUDE_STATUS,
+see MavlinkReaderInterface), so that a gimbal that is slower than the
+command, or stopped at a mechanical end, does not leave the setpoint
+running away from it.
+"""
+import threading
+from collections import namedtuple
+
+# Limits of one axis, in the controller's units (degrees or PWM counts).
+# maxRate and maxAccel may be inf for no limit.
+AxisLimits = namedtuple("AxisLimits", ("minimum", "maximum", "maxRate", "maxAccel"))
+
+# Longer steps are cut to this, so a loop resuming after a stall does not jump the gimbal.
+MAX_STEP = 0.5
+
+PITCH = 0
+YAW = 1
+
+class GimbalController:
+    def __init__(self, pitchLimits, yawLimits, maxLead=None, feedback=None, feedbackTimeout=0.5):
+        """
+        feedback is an optional callable returning the measured (pitch, yaw,
+        age in seconds), or None while nothing has been measured.
+        """
+        self.limits_ = [pitchLimits, yawLimits]
+        self.position_ = [0.0, 0.0]
+        self.velocity_ = [0.0, 0.0]
+        self.maxLead_ = maxLead
+        self.feedback_ = feedback
+        self.feedbackTimeout_ = feedbackTimeout
+        self.lock_ = threading.Lock()
+
+    def SetLimits(self, pitchLimits, yawLimits):
+        with self.lock_:
+            self.limits_ = [pitchLimits, yawLimits]
+            for axis in (PITCH, YAW):
+                self.position_[axis] = self.Clamp(axis, self.position_[axis])
+
+    def Reset(self, pitch, yaw):
+        """Jump to (pitch, yaw) and stop."""
+        with self.lock_:
+            self.position_ = [self.Clamp(PITCH, pitch), self.Clamp(YAW, yaw)]
+            self.velocity_ = [0.0, 0.0]
+        return tuple(self.position_)
+
+    def Position(self):
+        return tuple(self.position_)
+
+    def Moving(self):
+        """True while the setpoint is still moving, e.g. decelerating after the stick was released."""
+        return self.velocity_[PITCH] != 0.0 or self.velocity_[YAW] != 0.0
+
+    def Clamp(self, axis, value):
+        limits = self.limits_[axis]
+        return min(max(value, limits.minimum), limits.maximum)
+
+    def Step(self, pitchRate, yawRate, dt):
+        """Advance the setpoint by dt seconds of the commanded rates; returns (pitch, yaw)."""
+        dt = min(max(dt, 0.0), MAX_STEP)
+        measured = self.Measured()
+        with self.lock_:
+            for axis, rate in ((PITCH, pitchRate), (YAW, yawRate)):
+                self.StepAxis(axis, rate, dt, None if measured is None else measured[axis])
+            return tuple(self.position_)
+
+    def StepAxis(self, axis, rate, dt, measured):
+        limits = self.limits_[axis]
+        target = min(max(rate, -limits.maxRate), limits.maxRate)
+        velocity = self.velocity_[axis]
+        change = target - velocity
+        maxChange = limits.maxAccel * dt if dt > 0 else 0.0  # inf * 0 would be nan
+        newVelocity = velocity + min(max(change, -maxChange), maxChange)
+        # Trapezoidal integration of the velocity ramp.
+        position = self.position_[axis] + 0.5 * (velocity + newVelocity) * dt
+        lower = limits.minimum
+        upper = limits.maximum
+        if measured is not None:
+            lower = max(lower, measured - self.maxLead_)
+            upper = min(upper, measured + self.maxLead_)
+            if lower > upper:
+                # The gimbal reports an angle outside the limits: hold at the nearest limit.
+                lower = upper = self.Clamp(axis, measured)
+        if position <= lower:
+            position = lower
+            newVelocity = max(newVelocity, 0.0)
+        elif position >= upper:
+            position = upper
+            newVelocity = min(newVelocity, 0.0)
+        self.position_[axis] = position
+        self.velocity_[axis] = newVelocity
+
+    def Measured(self):
+        """Measured (pitch, yaw) when feedback is enabled and recent, else None."""
+        if self.feedback_ is None or self.maxLead_ is None:
+            return None
+        measured = self.feedback_()
+        if measured is None or measured[2] > self.feedbackTimeout_:
+            return None
+        return measured[0], measured[1]
@@ -0,0 +1,127 @@
+"""
+Module: LogPipeline.py
+Description: Queue-based logging with per-call-site rate limiting and a switchable packet log.
+
+Loggers on the hot threads only hand records to a QueueHandler; a listener
+thread does all formatting and file/console I/O. Per-packet messages go to
+children of the "Packets" logger, which stays disabled unless packet
+logging is switched on.
+"""
+import os
+import sys
+import atexit
+import time
+import queue
+import logging
+import logging.handlers
+
+PACKET_LOGGER = "Packets"
+
+def PacketLogger(name):
+    """Logger for per-packet messages. Guard calls with isEnabledFor(logging.DEBUG)."""
+    return logging.getLogger(f"{PACKET_LOGGER}.{name}")
+
+class RateLimitFilter(logging.Filter):
+    """
+    Lets through at most one record per `interval` seconds from each call
+    site (source file and line). The next record that passes carries the
+    number of records suppressed since the previous one. Warnings and
+    errors always pass: one call site can report different vehicles, loops
+    or settings, and none of those may be lost.
+    """
+    def __init__(self, interval=1.0, exempt=(PACKET_LOGGER,)):
+        super().__init__()
+        self.interval_ = interval
+        self.exempt_ = tuple(f"{name}." for name in exempt)
+        self.sites_ = {}  # (pathname, lineno) -> [next allowed time, suppressed count]
+        self.suppressedCount_ = 0
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING or record.name.startswith(self.exempt_):
+            return True
+        now = time.monotonic()
+        site = self.sites_.get((record.pathname, record.lineno))
+        if site is None:
+            self.sites_[(record.pathname, record.lineno)] = [now + self.interval_, 0]
+            return True
+        if now < site[0]:
+            site[1] += 1
+            self.suppressedCount_ += 1
+            return False
+        if site[1]:
+            record.msg = f"{record.getMessage()} ({site[1]} similar messages suppressed)"
+            record.args = None
+        site[0] = now + self.interval_
+        site[1] = 0
+        return True
+
+class LocalQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler for a listener in the same process: records are queued unformatted."""
+    def prepare(self, record):
+        return record
+
+class LogPipeline:
+    def __init__(self, logFile="mission_planner.log", level=logging.INFO, queued=True,
+                 rateLimitInterval=1.0, packetLogging=False):
+        self.logFile_ = logFile
+        self.level_ = level
+        self.queued_ = queued
+        self.rateLimitInterval_ = rateLimitInterval
+        self.packetLogging_ = packetLogging
+        self.handlers_ = []
+        self.queueHandler_ = None
+        self.listener_ = None
+        self.rateLimit_ = None
+
+    def Start(self):
+        """Replace the root logger's handlers with this pipeline."""
+        fileHandler = logging.FileHandler(self.logFile_)
+        fileHandler.setFormatter(logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s'))
+        streamHandler = logging.StreamHandler(sys.stdout)
+        streamHandler.setFormatter(logging.Formatter('%(name)s: %(levelname)s %(message)s'))
+        self.handlers_ = [fileHandler, streamHandler]
+
+        root = logging.getLogger()
+        for handler in list(root.handlers):
+            root.removeHandler(handler)
+        root.setLevel(self.level_)
+        logging.getLogger(PACKET_LOGGER).setLevel(logging.DEBUG if self.packetLogging_ else logging.WARNING)
+
+        if self.queued_:
+            self.queueHandler_ = LocalQueueHandler(queue.SimpleQueue())
+            entry = [self.queueHandler_]
+            self.StartListener()
+            # A forked worker inherits the queue but not the listener thread.
+            os.register_at_fork(after_in_child=self.AfterForkInChild)
+            # Also flush on exits that never reach main()'s Stop(), such as sys.exit() during startup.
+            atexit.register(self.Stop)
+        else:
+            entry = self.handlers_
+        if self.rateLimitInterval_ > 0:
+            self.rateLimit_ = RateLimitFilter(self.rateLimitInterval_)
+            for handler in entry:
+                handler.addFilter(self.rateLimit_)
+        for handler in entry:
+            root.addHandler(handler)
+        return self
+
+    def StartListener(self):
+        self.listener_ = logging.handlers.QueueListener(self.queueHandler_.queue, *self.handlers_,
+                                                        respect_handler_level=True)
+        self.listener_.start()
+
+    def AfterForkInChild(self):
+        if self.listener_ is not None:
+            self.queueHandler_.queue = queue.SimpleQueue()
+            self.StartListener()
+
+    def Stop(self):
+        """Flush queued records and stop the listener thread."""
+        if self.listener_ is not None:
+            self.listener_.stop()
+            self.listener_ = None
+        for handler in self.handlers_:
+            handler.flush()
+
+    def Stats(self):
+        return {"suppressed": self.rateLimit_.suppressedCount_ if self.rateLimit_ is not None else 0}
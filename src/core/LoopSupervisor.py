@@ -0,0 +1,233 @@
+"""
+Module: LoopSupervisor.py
+Description: Loop heartbeats, a stall watchdog, per-thread CPU accounting and stack sampling.
+
+Every long-running loop takes a heartbeat with GetHeartbeat() and calls
+Beat() once per iteration. The watchdog thread checks each heartbeat every
+checkInterval seconds: a loop whose last beat is older than stallFactor
+expected periods is reported as stalled, and one that uses more than
+busyCpu of a core is reported as busy; both reports carry a few stack
+samples of the loop's thread, showing where it is blocked or spinning.
+Stacks of all loops can also be logged on demand with SIGUSR1; the
+signal only sets a flag, and the watchdog logs them at its next check.
+"""
+import os
+import sys
+import time
+import signal
+import logging
+import threading
+import traceback
+from collections import Counter
+from core.Metrics import GetMetrics
+
+def ThreadCpuTime(ident):
+    """CPU seconds used so far by the thread with the given threading ident, or None."""
+    try:
+        return time.clock_gettime(time.pthread_getcpuclockid(ident))
+    except (AttributeError, OSError):
+        return None
+
+class LoopHeartbeat:
+    """
+    One supervised loop. expectedPeriod is the longest the loop normally goes
+    between iterations, or None for loops that block until input arrives and
+    so cannot stall detectably.
+    """
+    __slots__ = ("name_", "expectedPeriod_", "count_", "last_", "ident_", "pid_", "stalled_", "busy_",
+                 "stallCount_", "sampleCount_", "sampleCpu_", "sampleTime_", "rate_", "cpu_")
+
+    def __init__(self, name, expectedPeriod):
+        self.name_ = name
+        self.expectedPeriod_ = expectedPeriod
+        self.stallCount_ = 0
+        self.Reset()
+
+    def Reset(self):
+        self.count_ = 0
+        self.last_ = 0.0
+        self.ident_ = None
+        self.pid_ = None
+        self.stalled_ = False
+        self.busy_ = False
+        self.sampleCount_ = 0
+        self.sampleCpu_ = None
+        self.sampleTime_ = None
+        self.rate_ = 0.0
+        self.cpu_ = 0.0
+
+    def Beat(self):
+        if self.ident_ is None:
+            self.ident_ = threading.get_ident()
+            self.pid_ = os.getpid()
+        self.count_ += 1
+        self.last_ = time.monotonic()
+
+class LoopSupervisor:
+    def __init__(self, checkInterval=0.5, stallFactor=5.0, busyCpu=0.9):
+        self.logger = logging.getLogger("Loop Supervisor")
+        self.checkInterval_ = checkInterval
+        self.stallFactor_ = stallFactor
+        self.busyCpu_ = busyCpu
+        self.heartbeats_ = {}
+        self.lock_ = threading.Lock()
+        self.stopEvent_ = threading.Event()
+        self.thread_ = None
+        # Set by the SIGUSR1 handler. Sampling and logging in the handler could
+        # deadlock on a lock the interrupted main thread holds, so the watchdog does it.
+        self.stacksRequested_ = False
+        os.register_at_fork(after_in_child=self.AfterForkInChild)
+        GetMetrics("Loop Supervisor").Gauges("loops", self.Stats)
+
+    def Configure(self, checkInterval, stallFactor, busyCpu):
+        self.checkInterval_ = checkInterval
+        self.stallFactor_ = stallFactor
+        self.busyCpu_ = busyCpu
+
+    def Heartbeat(self, name, expectedPeriod=None):
+        with self.lock_:
+            heartbeat = self.heartbeats_.get(name)
+            if heartbeat is None:
+                heartbeat = self.heartbeats_[name] = LoopHeartbeat(name, expectedPeriod)
+            else:
+                heartbeat.expectedPeriod_ = expectedPeriod
+            return heartbeat
+
+    def Start(self):
+        if self.thread_ is None:
+            self.StartThread()
+            self.logger.info(f"Loop supervisor checking every {self.checkInterval_ * 1000:.0f} ms")
+            if threading.current_thread() is threading.main_thread() and hasattr(signal, "SIGUSR1"):
+                signal.signal(signal.SIGUSR1, lambda signum, frame: self.RequestStacks())
+        return self
+
+    def StartThread(self):
+        self.stopEvent_.clear()
+        self.thread_ = threading.Thread(target=self.Run, name="Loop Supervisor Thread", daemon=True)
+        self.thread_.start()
+
+    def Stop(self):
+        self.stopEvent_.set()
+
+    def AfterForkInChild(self):
+        # Loops of the parent do not run here; each one is picked up again
+        # when it beats in this process. The watchdog follows the parent, and
+        # only logs after its first interval, once logging is set up again.
+        for heartbeat in self.heartbeats_.values():
+            heartbeat.Reset()
+        running = self.thread_ is not None and not self.stopEvent_.is_set()
+        self.lock_ = threading.Lock()
+        self.thread_ = None
+        if running:
+            self.StartThread()
+
+    def Run(self):
+        while not self.stopEvent_.wait(self.checkInterval_):
+            try:
+                self.Check(time.monotonic())
+                if self.stacksRequested_:
+                    self.stacksRequested_ = False
+                    self.LogStacks()
+            except Exception as e:
+                self.logger.error(f"Loop supervisor error: {e}")
+
+    def Check(self, now):
+        pid = os.getpid()
+        with self.lock_:
+            heartbeats = list(self.heartbeats_.values())
+        threads = sys._current_frames().keys()
+        for heartbeat in heartbeats:
+            if heartbeat.ident_ is None or heartbeat.pid_ != pid:
+                continue
+            if heartbeat.ident_ not in threads:
+                # The loop ended; it is picked up again if it is restarted.
+                heartbeat.Reset()
+                continue
+            self.SampleUsage(heartbeat)
+            period = heartbeat.expectedPeriod_
+            # Fast loops are not held to less than one check interval, so scheduling
+            # noise between two checks is not reported as a stall.
+            stalled = (period is not None
+                       and now - heartbeat.last_ > max(self.stallFactor_ * period, self.checkInterval_))
+            if stalled and not heartbeat.stalled_:
+                heartbeat.stallCount_ += 1
+                self.logger.warning(f"Loop {heartbeat.name_} stalled: no iteration for "
+                                    f"{now - heartbeat.last_:.2f} s (expected every {period:.3f} s)\n"
+                                    + self.SampleStack(heartbeat.ident_))
+            elif heartbeat.stalled_ and not stalled:
+                self.logger.info(f"Loop {heartbeat.name_} recovered")
+            heartbeat.stalled_ = stalled
+            busy = heartbeat.cpu_ > self.busyCpu_
+            if busy and not heartbeat.busy_:
+                self.logger.warning(f"Loop {heartbeat.name_} is using {heartbeat.cpu_:.0%} CPU at "
+                                    f"{heartbeat.rate_:.0f} iterations/s\n" + self.SampleStack(heartbeat.ident_))
+            heartbeat.busy_ = busy
+
+    def SampleUsage(self, heartbeat):
+        """Update the loop's iteration rate and CPU share over the last check interval."""
+        # Read the clocks together: stack sampling of other loops may have taken a while.
+        cpu = ThreadCpuTime(heartbeat.ident_)
+        now = time.monotonic()
+        count = heartbeat.count_
+        if heartbeat.sampleTime_ is not None:
+            elapsed = now - heartbeat.sampleTime_
+            if elapsed > 0:
+                heartbeat.rate_ = (count - heartbeat.sampleCount_) / elapsed
+                if cpu is None or heartbeat.sampleCpu_ is None:
+                    heartbeat.cpu_ = 0.0
+                else:
+                    heartbeat.cpu_ = (cpu - heartbeat.sampleCpu_) / elapsed
+        heartbeat.sampleTime_ = now
+        heartbeat.sampleCount_ = count
+        heartbeat.sampleCpu_ = cpu
+
+    def SampleStack(self, ident, samples=5, interval=0.01):
+        """
+        Take a few stack samples of one thread. Returns the most recent stack
+        and how often each innermost line was seen across the samples.
+        """
+        lines = Counter()
+        stack = None
+        for i in range(samples):
+            frame = sys._current_frames().get(ident)
+            if frame is None:
+                return "  (thread has exited)"
+            stack = traceback.extract_stack(frame)
+            top = stack[-1]
+            lines[f"{top.filename}:{top.lineno} in {top.name}"] += 1
+            if i + 1 < samples:
+                time.sleep(interval)
+        summary = "\n".join(f"  {count}/{samples} at {line}" for line, count in lines.most_common())
+        return summary + "\n" + "".join(traceback.format_list(stack)).rstrip()
+
+    def RequestStacks(self):
+        """Have the watchdog log all stacks at its next check. Safe to call from a signal handler."""
+        self.stacksRequested_ = True
+
+    def LogStacks(self):
+        """Log a stack sample of every supervised loop in this process."""
+        pid = os.getpid()
+        # One record for all loops: the rate limiter would drop all but the first from one call site.
+        stacks = [f"Stack of loop {heartbeat.name_}:\n" + self.SampleStack(heartbeat.ident_, samples=1)
+                  for heartbeat in list(self.heartbeats_.values())
+                  if heartbeat.ident_ is not None and heartbeat.pid_ == pid]
+        if stacks:
+            self.logger.info("\n".join(stacks))
+
+    def Stats(self):
+        stats = {}
+        now = time.monotonic()
+        for heartbeat in list(self.heartbeats_.values()):
+            if heartbeat.ident_ is None:
+                continue
+            stats[f"{heartbeat.name_}.rate"] = heartbeat.rate_
+            stats[f"{heartbeat.name_}.cpu"] = heartbeat.cpu_
+            stats[f"{heartbeat.name_}.age"] = now - heartbeat.last_
+            stats[f"{heartbeat.name_}.stalls"] = heartbeat.stallCount_
+        return stats
+
+# Process-wide supervisor, like the metrics REGISTRY.
+SUPERVISOR = LoopSupervisor()
+
+def GetHeartbeat(name, expectedPeriod=None):
+    return SUPERVISOR.Heartbeat(name, expectedPeriod)
@@ -0,0 +1,170 @@
+"""
+Module: Metrics.py
+Description: Process-wide registry of counters, gauges and log-linear latency histograms.
+
+Metrics are named "<scope>.<metric>", where the scope is the interface that
+owns them, the same way loggers are named. Recording is a plain integer
+update with no lock: every metric has a single writer thread, and a reader
+taking a snapshot can at worst see a value that is one update old.
+"""
+import time
+import threading
+
+class Counter:
+    __slots__ = ("value_",)
+
+    def __init__(self):
+        self.value_ = 0
+
+    def Add(self, amount=1):
+        self.value_ += amount
+
+class Histogram:
+    """
+    HDR-style histogram of durations, stored as integer microseconds.
+
+    Values below 2 * 2**subBits are counted exactly; above that, every power
+    of two is split into 2**subBits linear sub-buckets, so any recorded value
+    is reported within 1 / 2**subBits of its true value (1.6 % by default).
+    Values above maxSeconds are counted in the top bucket.
+    """
+    __slots__ = ("subBits_", "subCount_", "maxValue_", "counts_", "count_", "total_", "max_")
+
+    def __init__(self, subBits=6, maxSeconds=60.0):
+        self.subBits_ = subBits
+        self.subCount_ = 1 << subBits
+        self.maxValue_ = int(maxSeconds * 1e6)
+        self.counts_ = [0] * (self.Index(self.maxValue_) + 1)
+        self.count_ = 0
+        self.total_ = 0
+        self.max_ = 0
+
+    def Index(self, value):
+        magnitude = value.bit_length() - self.subBits_ - 1
+        if magnitude <= 0:
+            return value
+        return (magnitude << self.subBits_) + (value >> magnitude)
+
+    def LowerBound(self, index):
+        magnitude = (index >> self.subBits_) - 1
+        if magnitude <= 0:
+            return index
+        return (index - (magnitude << self.subBits_)) << magnitude
+
+    def Record(self, seconds):
+        value = int(seconds * 1e6)
+        if value < 0:
+            value = 0
+        elif value > self.maxValue_:
+            value = self.maxValue_
+        self.counts_[self.Index(value)] += 1
+        self.count_ += 1
+        self.total_ += value
+        if value > self.max_:
+            self.max_ = value
+
+    def Percentiles(self, quantiles):
+        """Value in seconds at each quantile (0..1), in the order given."""
+        counts = list(self.counts_)
+        total = sum(counts)
+        if total == 0:
+            return [0.0] * len(quantiles)
+        targets = sorted((max(1, int(q * total + 0.5)), i) for i, q in enumerate(quantiles))
+        values = [0.0] * len(quantiles)
+        seen = 0
+        t = 0
+        for index, n in enumerate(counts):
+            seen += n
+            while t < len(targets) and seen >= targets[t][0]:
+                values[targets[t][1]] = self.LowerBound(index) / 1e6
+                t += 1
+            if t == len(targets):
+                break
+        return values
+
+    def Summary(self):
+        p50, p90, p99, p999 = self.Percentiles((0.5, 0.9, 0.99, 0.999))
+        count = self.count_
+        return {"count": count,
+                "mean": self.total_ / count / 1e6 if count else 0.0,
+                "p50": p50, "p90": p90, "p99": p99, "p999": p999,
+                "max": self.max_ / 1e6}
+
+class MetricsScope:
+    """Creates metrics named "<scope>.<name>" in a registry."""
+    def __init__(self, registry, scope):
+        self.registry_ = registry
+        self.scope_ = scope
+
+    def Counter(self, name):
+        return self.registry_.Counter(f"{self.scope_}.{name}")
+
+    def Histogram(self, name, **kwargs):
+        return self.registry_.Histogram(f"{self.scope_}.{name}", **kwargs)
+
+    def Gauge(self, name, function):
+        self.registry_.Gauge(f"{self.scope_}.{name}", function)
+
+    def Gauges(self, prefix, function):
+        """Register function(), returning a dict, as one gauge per key."""
+        self.registry_.Gauges(f"{self.scope_}.{prefix}", function)
+
+class MetricsRegistry:
+    def __init__(self):
+        self.lock_ = threading.Lock()
+        self.counters_ = {}
+        self.histograms_ = {}
+        self.gauges_ = {}
+        self.gaugeGroups_ = {}
+        self.startTime_ = time.monotonic()
+
+    def Scope(self, scope):
+        return MetricsScope(self, scope)
+
+    def Counter(self, name):
+        with self.lock_:
+            return self.counters_.setdefault(name, Counter())
+
+    def Histogram(self, name, **kwargs):
+        with self.lock_:
+            histogram = self.histograms_.get(name)
+            if histogram is None:
+                histogram = self.histograms_[name] = Histogram(**kwargs)
+            return histogram
+
+    def Gauge(self, name, function):
+        """function() is evaluated only when a snapshot is taken."""
+        with self.lock_:
+            self.gauges_[name] = function
+
+    def Gauges(self, prefix, function):
+        with self.lock_:
+            self.gaugeGroups_[prefix] = function
+
+    def Snapshot(self):
+        with self.lock_:
+            counters = dict(self.counters_)
+            histograms = dict(self.histograms_)
+            gauges = dict(self.gauges_)
+            gaugeGroups = dict(self.gaugeGroups_)
+        values = {name: counter.value_ for name, counter in counters.items()}
+        for name, function in gauges.items():
+            try:
+                values[name] = function()
+            except Exception as e:
+                values[name] = f"error: {e}"
+        for prefix, function in gaugeGroups.items():
+            try:
+                for key, value in function().items():
+                    values[f"{prefix}.{key}"] = value
+            except Exception as e:
+                values[prefix] = f"error: {e}"
+        return {"uptime": time.monotonic() - self.startTime_,
+                "values": dict(sorted(values.items())),
+                "histograms": {name: histogram.Summary() for name, histogram in sorted(histograms.items())}}
+
+# Default registry for the process, like the logging module's root logger.
+REGISTRY = MetricsRegistry()
+
+def GetMetrics(scope):
+    return REGISTRY.Scope(scope)
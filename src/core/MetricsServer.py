@@ -0,0 +1,46 @@
+"""
+Module: MetricsServer.py
+Description: Serves metrics registry snapshots as JSON over a local HTTP endpoint.
+"""
+import json
+import logging
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from core.Metrics import REGISTRY
+
+class MetricsRequestHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] not in ("/", "/metrics"):
+            self.send_error(404)
+            return
+        body = json.dumps(self.server.registry_.Snapshot(), indent=1, default=str).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass  # polled every second or so; not worth a log line each time
+
+class MetricsServer:
+    """
+    GET http://host:port/metrics returns the registry snapshot. Runs in a
+    daemon thread and only does work when it is polled.
+    """
+    def __init__(self, host="127.0.0.1", port=8765, registry=REGISTRY):
+        self.logger = logging.getLogger("Metrics Server")
+        self.server_ = ThreadingHTTPServer((host, port), MetricsRequestHandler)
+        self.server_.daemon_threads = True
+        self.server_.registry_ = registry
+        self.thread_ = threading.Thread(target=self.server_.serve_forever, name="Metrics Server Thread", daemon=True)
+
+    def Start(self):
+        self.thread_.start()
+        host, port = self.server_.server_address[:2]
+        self.logger.info(f"Metrics available at http://{host}:{port}/metrics")
+        return self
+
+    def Stop(self):
+        self.server_.shutdown()
+        self.server_.server_close()
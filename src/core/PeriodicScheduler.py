@@ -0,0 +1,108 @@
+"""
+Module: PeriodicScheduler.py
+Description: Runs a callback at a fixed rate on the monotonic clock and records timing statistics.
+"""
+import time
+import asyncio
+import logging
+import threading
+from core.Metrics import GetMetrics
+from core.LoopSupervisor import GetHeartbeat
+
+class PeriodicScheduler:
+    """
+    Calls a tick callback every 1/rateHz seconds.
+
+    Ticks are scheduled against absolute deadlines on time.monotonic(), so the
+    rate does not drift with the callback's processing time. The callback gets
+    the measured time since the previous tick. When a tick runs late enough to
+    miss one or more following deadlines, those ticks are skipped (not run
+    back to back) and counted as missed deadlines.
+    """
+    def __init__(self, name, rateHz):
+        if rateHz <= 0:
+            raise ValueError(f"{name}: rate must be positive, got {rateHz}")
+        self.logger = logging.getLogger(name)
+        self.name_ = name
+        self.period_ = 1.0 / rateHz
+        self.stopEvent_ = threading.Event()
+        self.tickCount_ = 0
+        self.overrunCount_ = 0
+        self.missedDeadlineCount_ = 0
+        self.jitterSum_ = 0.0
+        self.jitterMax_ = 0.0
+        self.lastStart_ = 0.0
+        metrics = GetMetrics(name)
+        self.tickTime_ = metrics.Histogram("tick_time")
+        self.heartbeat_ = GetHeartbeat(name, self.period_)
+        metrics.Gauges("scheduler", self.Stats)
+
+    def Stop(self):
+        self.stopEvent_.set()
+
+    def SetRate(self, rateHz):
+        """Takes effect from the next tick."""
+        if rateHz <= 0:
+            raise ValueError(f"{self.name_}: rate must be positive, got {rateHz}")
+        self.period_ = 1.0 / rateHz
+        self.heartbeat_.expectedPeriod_ = self.period_
+
+    def Run(self, callback):
+        self.logger.info(f"{self.name_} scheduler running at {1.0 / self.period_:.1f} Hz")
+        nextDeadline = time.monotonic()
+        self.lastStart_ = nextDeadline
+        while not self.stopEvent_.is_set():
+            delay = nextDeadline - time.monotonic()
+            if delay > 0 and self.stopEvent_.wait(delay):
+                break
+            nextDeadline = self.Tick(callback, nextDeadline)
+
+    async def RunAsync(self, callback):
+        """Same schedule as Run(), as a task on the running event loop."""
+        self.logger.info(f"{self.name_} scheduler task running at {1.0 / self.period_:.1f} Hz")
+        nextDeadline = time.monotonic()
+        self.lastStart_ = nextDeadline
+        while not self.stopEvent_.is_set():
+            delay = nextDeadline - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+                if self.stopEvent_.is_set():
+                    break
+            nextDeadline = self.Tick(callback, nextDeadline)
+
+    def Tick(self, callback, deadline):
+        """Run one tick due at deadline and return the next deadline."""
+        period = self.period_
+        start = time.monotonic()
+        jitter = start - deadline
+        self.jitterSum_ += jitter
+        if jitter > self.jitterMax_:
+            self.jitterMax_ = jitter
+        self.tickCount_ += 1
+        self.heartbeat_.Beat()
+        try:
+            callback(start - self.lastStart_)
+        except Exception as e:
+            self.logger.error(f"{self.name_} tick error: {e}")
+        self.lastStart_ = start
+
+        end = time.monotonic()
+        self.tickTime_.Record(end - start)
+        if end - start > period:
+            self.overrunCount_ += 1
+        deadline += period
+        if end > deadline:
+            missed = int((end - deadline) / period) + 1
+            self.missedDeadlineCount_ += missed
+            deadline += missed * period
+        return deadline
+
+    def Stats(self):
+        ticks = self.tickCount_
+        return {
+            "ticks": ticks,
+            "overruns": self.overrunCount_,
+            "missedDeadlines": self.missedDeadlineCount_,
+            "jitterMean": self.jitterSum_ / ticks if ticks else 0.0,
+            "jitterMax": self.jitterMax_,
+        }
@@ -0,0 +1,109 @@
+"""
+Module: ProcessRuntime.py
+Description: Runs selected loops in forked worker processes that share state through shared memory.
+"""
+import os
+import signal
+import logging
+import threading
+import multiprocessing
+
+class ProcessRuntime:
+    """
+    Worker processes plus the threads that stay in the main process.
+
+    Workers are forked, so they start with the interfaces and state that the
+    main process already built, and nothing is pickled. State written in one
+    process reaches the others only through a SharedStateBlock attached to
+    the DroneState before Run() is called.
+
+    Every worker gets a watcher thread that calls its stop callback when the
+    runtime stops, so loops finish their current write section instead of
+    being killed inside it while holding a shared lock.
+    """
+    def __init__(self, shutdownTimeout=2.0):
+        self.logger = logging.getLogger("Process Runtime")
+        self.context_ = multiprocessing.get_context("fork")
+        self.stopEvent_ = self.context_.Event()
+        self.localStop_ = threading.Event()
+        self.processes_ = []
+        self.threads_ = []
+        self.stopCallbacks_ = []
+        self.shutdownTimeout_ = shutdownTimeout
+
+    def AddProcess(self, name, function, stop=None):
+        process = self.context_.Process(target=self.WorkerMain, args=(name, function, stop),
+                                        name=name, daemon=False)
+        self.processes_.append(process)
+
+    def AddThread(self, name, function, stop=None):
+        # Loops without a stop callback cannot be joined and must not keep the process alive.
+        thread = threading.Thread(target=function, name=f"{name} Thread", daemon=stop is None)
+        self.threads_.append(thread)
+        if stop is not None:
+            self.stopCallbacks_.append(stop)
+
+    def WorkerMain(self, name, function, stop):
+        # Shutdown is coordinated by the main process through stopEvent_.
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        signal.signal(signal.SIGTERM, lambda signum, frame: self.stopEvent_.set())
+        logger = logging.getLogger(name)
+        if stop is not None:
+            def watcher():
+                self.stopEvent_.wait()
+                stop()
+            threading.Thread(target=watcher, name=f"{name} Stop Watcher", daemon=True).start()
+        logger.info(f"Worker process started (pid {os.getpid()}).")
+        try:
+            function()
+        except Exception as e:
+            logger.error(f"Worker process failed: {e}")
+            raise
+
+    def Stop(self):
+        """Request shutdown. Safe to call from any thread of the main process."""
+        self.localStop_.set()
+
+    def Run(self, onStarted=None):
+        """onStarted() is called once every worker process and thread has been launched."""
+        previous = {sig: signal.signal(sig, lambda signum, frame: self.Stop())
+                    for sig in (signal.SIGINT, signal.SIGTERM)}
+        try:
+            for process in self.processes_:
+                process.start()
+            for thread in self.threads_:
+                thread.start()
+            self.logger.info(f"Process runtime started: {len(self.processes_)} processes, "
+                             f"{len(self.threads_)} threads.")
+            if onStarted is not None:
+                onStarted()
+            while not self.localStop_.wait(0.5) and not self.stopEvent_.is_set():
+                for process in self.processes_:
+                    if process.exitcode not in (None, 0):
+                        self.logger.error(f"Worker {process.name} exited with code {process.exitcode}")
+                        self.Stop()
+        finally:
+            self.Shutdown()
+            for sig, handler in previous.items():
+                signal.signal(sig, handler)
+
+    def Shutdown(self):
+        self.logger.info("Process runtime shutting down...")
+        self.stopEvent_.set()
+        for stop in self.stopCallbacks_:
+            try:
+                stop()
+            except Exception as e:
+                self.logger.error(f"Error during shutdown: {e}")
+        for process in self.processes_:
+            if process.pid is None:
+                continue
+            process.join(self.shutdownTimeout_)
+            if process.is_alive():
+                self.logger.warning(f"Worker {process.name} did not stop within {self.shutdownTimeout_}s; terminating")
+                process.terminate()
+                process.join()
+        for thread in self.threads_:
+            if not thread.daemon and thread.ident is not None:
+                thread.join(self.shutdownTimeout_)
+        self.logger.info("Process runtime stopped.")
@@ -0,0 +1,37 @@
+"""
+Module: StartupProfile.py
+Description: Phase-by-phase wall-clock timing of the planner's cold start.
+"""
+import time
+import logging
+
+class StartupProfile:
+    """
+    Splits startup into consecutive phases: Mark(name) ends the phase
+    called name, which began at the previous mark (or at start).
+    """
+    def __init__(self, start=None):
+        self.logger = logging.getLogger("Startup")
+        self.start_ = time.perf_counter() if start is None else start
+        self.last_ = self.start_
+        self.phases_ = []  # (name, seconds)
+        self.reported_ = False
+
+    def Mark(self, name):
+        now = time.perf_counter()
+        self.phases_.append((name, now - self.last_))
+        self.last_ = now
+
+    def Elapsed(self):
+        return time.perf_counter() - self.start_
+
+    def Report(self):
+        """Log the phase table (once) and return it as a dict of seconds."""
+        total = self.last_ - self.start_
+        phases = dict(self.phases_, total=total)
+        if not self.reported_:
+            self.reported_ = True
+            width = max(len(name) for name in phases)
+            lines = [f"  {name:<{width}} {seconds * 1000:8.1f} ms" for name, seconds in phases.items()]
+            self.logger.info("Startup profile:\n" + "\n".join(lines))
+        return phases
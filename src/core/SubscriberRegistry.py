@@ -0,0 +1,104 @@
+"""
+Module: SubscriberRegistry.py
+Description: Destinations of one outbound packet stream, static from config.xml or leased by subscribe datagrams.
+"""
+import threading
+import time
+import logging
+from core.Metrics import GetMetrics
+
+class SubscriberRegistry:
+    """
+    The set of (ip, port) destinations a publisher sends each packet to.
+
+    Static destinations come from config.xml and never expire. Dynamic ones
+    are added by Subscribe() and expire timeout seconds after the last
+    Subscribe() from the same address, so a consumer that goes away without
+    unsubscribing stops costing a send per packet.
+
+    The publisher calls Destinations() on every packet; it returns a cached
+    tuple that is only rebuilt when the set changes, so the send path does
+    not take the lock.
+    """
+    def __init__(self, name, static=(), timeout=10.0, maxSubscribers=8):
+        self.logger = logging.getLogger(f"{name} Subscribers")
+        self.name_ = name
+        self.static_ = tuple(static)
+        self.timeout_ = timeout
+        self.maxSubscribers_ = maxSubscribers
+        self.leases_ = {}  # address -> expiry (monotonic)
+        self.nextExpiry_ = float("inf")
+        self.destinations_ = self.static_
+        self.listeners_ = []
+        self.lock_ = threading.Lock()
+        self.rejectedCount_ = 0
+        self.expiredCount_ = 0
+        GetMetrics(f"{name} Subscribers").Gauges("subscribers", self.Stats)
+
+    def AddListener(self, listener):
+        """listener() is called after a new destination is added, e.g. to resend the latest packet."""
+        self.listeners_.append(listener)
+
+    def SetStatic(self, static):
+        with self.lock_:
+            self.static_ = tuple(static)
+            self.Rebuild()
+
+    def SetLimits(self, timeout, maxSubscribers):
+        self.timeout_ = timeout
+        self.maxSubscribers_ = maxSubscribers
+
+    def Subscribe(self, address):
+        """Add or renew a lease for address. Returns False if the registry is full."""
+        now = time.monotonic()
+        with self.lock_:
+            isNew = address not in self.leases_
+            if isNew and len(self.leases_) >= self.maxSubscribers_:
+                self.rejectedCount_ += 1
+                return False
+            expiry = now + self.timeout_
+            self.leases_[address] = expiry
+            self.nextExpiry_ = min(self.nextExpiry_, expiry)
+            if isNew:
+                self.Rebuild()
+        if isNew:
+            self.logger.info(f"{address[0]}:{address[1]} subscribed to {self.name_}")
+            for listener in self.listeners_:
+                listener()
+        return True
+
+    def Unsubscribe(self, address):
+        with self.lock_:
+            if self.leases_.pop(address, None) is None:
+                return False
+            self.Rebuild()
+        self.logger.info(f"{address[0]}:{address[1]} unsubscribed from {self.name_}")
+        return True
+
+    def Destinations(self):
+        """The current destinations, static ones first."""
+        if time.monotonic() >= self.nextExpiry_:
+            self.Expire()
+        return self.destinations_
+
+    def Expire(self):
+        now = time.monotonic()
+        with self.lock_:
+            expired = [address for address, expiry in self.leases_.items() if expiry <= now]
+            for address in expired:
+                del self.leases_[address]
+            self.nextExpiry_ = min(self.leases_.values(), default=float("inf"))
+            if expired:
+                self.expiredCount_ += len(expired)
+                self.Rebuild()
+        for address in expired:
+            self.logger.info(f"{address[0]}:{address[1]} subscription to {self.name_} expired")
+
+    def Rebuild(self):
+        # Called with lock_ held. A dynamic subscriber that is also static is only sent to once.
+        dynamic = tuple(address for address in self.leases_ if address not in self.static_)
+        self.destinations_ = self.static_ + dynamic
+
+    def Stats(self):
+        return {"static": len(self.static_), "dynamic": len(self.leases_),
+                "rejected": self.rejectedCount_, "expired": self.expiredCount_}
@@ -0,0 +1,303 @@
+"""
+Module: TelemetryEstimator.py
+Description: Constant-velocity Kalman filters that smooth, latency-correct and extrapolate telemetry.
+
+The MAVLink reader feeds every GLOBAL_POSITION_INT and ATTITUDE into a
+TelemetryEstimator, which keeps per vehicle:
+  - a position filter over north/east/up in metres (measured: position and
+    the vx/vy/vz velocity of the same message),
+  - an attitude filter over roll/pitch/yaw (measured: angles and rates),
+  - a LinkLatency that dates each message on the local clock from its
+    time_boot_ms, so the filters run on measurement time, not arrival time.
+Each axis is a [value, rate] constant-velocity model driven by white-noise
+acceleration; the axes of a filter are independent and updated together
+with vectorised NumPy math.
+
+The posterior goes to the vehicle's estimate_ state group, which is in
+shared memory in the processes runtime. TelemetryPredictor extrapolates it
+to any query time for the publishers, so their output is smooth at their
+own rate and already accounts for the link latency.
+"""
+import math
+import time
+import logging
+import numpy as np
+from core.Metrics import GetMetrics
+
+METRES_PER_DEG_LAT = math.radians(6371000.0)
+
+# Measurement noise (standard deviations) of the autopilot's estimates.
+VELOCITY_NOISE = 0.3       # m/s
+CLIMB_RATE_NOISE = 0.5     # m/s
+ALTITUDE_NOISE = 1.0       # m
+ANGLE_NOISE = 0.01         # rad
+ANGLE_RATE_NOISE = 0.05    # rad/s
+
+# A filter restarts from the next measurement after a gap this long (s).
+RESET_GAP = 5.0
+# How fast the smoothed vertical acceleration follows the climb rate (s).
+ACCEL_TIME_CONSTANT = 0.5
+# Fastest relative drift assumed between the autopilot's clock and ours.
+CLOCK_DRIFT = 1e-4
+# A time_boot_ms step back by more than this is an autopilot reboot (s); smaller
+# steps are messages stamped at sample time arriving slightly out of order.
+REBOOT_JUMP = 5.0
+
+class ConstantVelocityFilter:
+    """
+    Kalman filter for n independent [value, rate] axes. wrapped marks angle
+    axes whose value is kept in [-pi, pi).
+    """
+    def __init__(self, accelNoise, wrapped=None):
+        self.q_ = np.square(np.asarray(accelNoise, dtype=float))
+        count = len(self.q_)
+        self.wrapped_ = np.zeros(count, dtype=bool) if wrapped is None else np.asarray(wrapped, dtype=bool)
+        self.x_ = np.zeros((count, 2))
+        self.p_ = np.zeros((count, 2, 2))
+        self.time_ = None
+
+    def Reset(self, values, rates, valueNoise, rateNoise, t):
+        self.x_[:, 0] = values
+        self.x_[:, 1] = rates
+        self.p_[:] = 0.0
+        self.p_[:, 0, 0] = np.square(valueNoise)
+        self.p_[:, 1, 1] = np.square(rateNoise)
+        self.time_ = t
+
+    def Predict(self, t):
+        dt = t - self.time_
+        if dt <= 0:
+            return
+        x = self.x_
+        x[:, 0] += x[:, 1] * dt
+        p = self.p_
+        # P = F P F' + Q with F = [[1, dt], [0, 1]] and the white-noise acceleration Q.
+        p00 = p[:, 0, 0] + dt * (p[:, 0, 1] + p[:, 1, 0]) + dt * dt * p[:, 1, 1] + self.q_ * dt ** 3 / 3
+        p01 = p[:, 0, 1] + dt * p[:, 1, 1] + self.q_ * dt * dt / 2
+        p[:, 1, 1] += self.q_ * dt
+        p[:, 0, 0] = p00
+        p[:, 0, 1] = p01
+        p[:, 1, 0] = p01
+        self.time_ = t
+
+    def Update(self, values, rates, valueNoise, rateNoise, t):
+        """Fold in one measurement of every axis taken at time t."""
+        if self.time_ is None or t - self.time_ > RESET_GAP:
+            self.Reset(values, rates, valueNoise, rateNoise, t)
+            return True
+        self.Predict(t)
+        innovation = np.stack((np.asarray(values, dtype=float) - self.x_[:, 0],
+                               np.asarray(rates, dtype=float) - self.x_[:, 1]), axis=1)
+        innovation[:, 0] = np.where(self.wrapped_, WrapAngle(innovation[:, 0]), innovation[:, 0])
+        s = self.p_.copy()
+        s[:, 0, 0] += np.square(valueNoise)
+        s[:, 1, 1] += np.square(rateNoise)
+        gain = self.p_ @ np.linalg.inv(s)
+        self.x_ += (gain @ innovation[:, :, None])[:, :, 0]
+        self.x_[:, 0] = np.where(self.wrapped_, WrapAngle(self.x_[:, 0]), self.x_[:, 0])
+        self.p_ -= gain @ self.p_
+        return False
+
+def WrapAngle(angle):
+    return (angle + np.pi) % (2 * np.pi) - np.pi
+
+class LinkLatency:
+    """
+    Dates messages on the local clock from the autopilot's time_boot_ms.
+
+    The smallest arrival-minus-boot-time offset seen marks the fastest
+    delivery; every message's latency is its offset above that floor plus
+    the floor's own latency, taken as half the TIMESYNC round trip (0 until
+    one has been measured). The floor rises slowly to follow clock drift
+    and starts over when time_boot_ms jumps back by more than REBOOT_JUMP,
+    i.e. when the autopilot reboots.
+    """
+    def __init__(self):
+        self.minOffset_ = None
+        self.lastBoot_ = None
+        self.lastRx_ = None
+        self.roundTrip_ = None
+        self.latency_ = 0.0
+
+    def Sample(self, bootMs, rxTime):
+        """Local time at which a message stamped bootMs and received at rxTime was taken."""
+        boot = bootMs / 1000.0
+        offset = rxTime - boot
+        if self.minOffset_ is None or boot < self.lastBoot_ - REBOOT_JUMP:
+            self.minOffset_ = offset
+            self.lastBoot_ = boot
+        else:
+            self.minOffset_ = min(offset, self.minOffset_ + CLOCK_DRIFT * (rxTime - self.lastRx_))
+            self.lastBoot_ = max(self.lastBoot_, boot)
+        self.lastRx_ = rxTime
+        floor = self.roundTrip_ / 2 if self.roundTrip_ is not None else 0.0
+        self.latency_ = offset - self.minOffset_ + floor
+        return rxTime - self.latency_
+
+class VehicleEstimator:
+    """Filters and link clock of one vehicle."""
+    def __init__(self, accelNoise, angularAccelNoise, positionNoise):
+        self.position_ = ConstantVelocityFilter((accelNoise, accelNoise, accelNoise))
+        self.attitude_ = ConstantVelocityFilter((angularAccelNoise,) * 3, wrapped=(False, False, True))
+        self.positionNoise_ = np.array((positionNoise, positionNoise, ALTITUDE_NOISE))
+        self.rateNoise_ = np.array((VELOCITY_NOISE, VELOCITY_NOISE, CLIMB_RATE_NOISE))
+        self.link_ = LinkLatency()
+        self.originLat_ = None
+        self.originLon_ = None
+        self.metresPerDegLon_ = None
+        self.lastClimb_ = None
+        self.accelZ_ = 0.0
+
+class TelemetryEstimator:
+    def __init__(self, connection, accelNoise=2.0, angularAccelNoise=1.0, positionNoise=2.0,
+                 timesyncInterval=1.0):
+        self.logger = logging.getLogger("Telemetry Estimator")
+        self.connection_ = connection
+        self.accelNoise_ = accelNoise
+        self.angularAccelNoise_ = angularAccelNoise
+        self.positionNoise_ = positionNoise
+        self.timesyncInterval_ = timesyncInterval
+        self.vehicles_ = {}   # sysid -> VehicleEstimator
+        self.lastTimesync_ = -float("inf")
+        metrics = GetMetrics("Telemetry Estimator")
+        self.updateTime_ = metrics.Histogram("update_time")
+        self.resetCount_ = metrics.Counter("filter_resets")
+        self.roundTripTime_ = metrics.Histogram("timesync_round_trip")
+        metrics.Gauges("latency", lambda: {str(sysid): vehicle.link_.latency_
+                                           for sysid, vehicle in list(self.vehicles_.items())})
+        if timesyncInterval > 0:
+            connection.Subscribe("HEARTBEAT", self.HandleHeartbeat)
+            connection.Subscribe("TIMESYNC", self.HandleTimesync)
+
+    def Vehicle(self, sysid):
+        vehicle = self.vehicles_.get(sysid)
+        if vehicle is None:
+            vehicle = self.vehicles_[sysid] = VehicleEstimator(self.accelNoise_, self.angularAccelNoise_,
+                                                               self.positionNoise_)
+        return vehicle
+
+    def HandleHeartbeat(self, msg):
+        # Heartbeats pace the TIMESYNC requests; every vehicle on the link answers them.
+        now = time.monotonic()
+        if now - self.lastTimesync_ < self.timesyncInterval_ or self.connection_.Target()[0] == 0:
+            return
+        self.lastTimesync_ = now
+        try:
+            self.connection_.Send(self.connection_.Mav().timesync_encode(0, time.monotonic_ns()))
+        except Exception as e:
+            self.logger.error(f"Could not send TIMESYNC: {e}")
+
+    def HandleTimesync(self, msg):
+        # Requests from the vehicle have tc1 == 0; replies echo our ts1.
+        if msg.tc1 == 0:
+            return
+        roundTrip = (time.monotonic_ns() - msg.ts1) / 1e9
+        if 0 < roundTrip < 10.0:
+            self.roundTripTime_.Record(roundTrip)
+            link = self.Vehicle(msg.get_srcSystem()).link_
+            link.roundTrip_ = roundTrip if link.roundTrip_ is None else 0.8 * link.roundTrip_ + 0.2 * roundTrip
+
+    def UpdatePosition(self, state, msg, rxTime):
+        """Fold in a GLOBAL_POSITION_INT; returns the filtered (climb rate, vertical acceleration)."""
+        start = time.perf_counter()
+        vehicle = self.Vehicle(msg.get_srcSystem())
+        t = vehicle.link_.Sample(msg.time_boot_ms, rxTime)
+        lat = msg.lat / 1e7
+        lon = msg.lon / 1e7
+        if vehicle.originLat_ is None:
+            vehicle.originLat_ = lat
+            vehicle.originLon_ = lon
+            vehicle.metresPerDegLon_ = METRES_PER_DEG_LAT * math.cos(math.radians(lat))
+        values = ((lat - vehicle.originLat_) * METRES_PER_DEG_LAT,
+                  (lon - vehicle.originLon_) * vehicle.metresPerDegLon_,
+                  msg.alt / 1000.0)
+        # vx/vy/vz are north/east/down in cm/s.
+        rates = (msg.vx / 100.0, msg.vy / 100.0, -msg.vz / 100.0)
+        position = vehicle.position_
+        previousTime = position.time_
+        if position.Update(values, rates, vehicle.positionNoise_, vehicle.rateNoise_, t):
+            self.resetCount_.Add()
+            vehicle.lastClimb_ = None
+            vehicle.accelZ_ = 0.0
+        north, east, altitude = position.x_[:, 0]
+        northSpeed, eastSpeed, climbRate = position.x_[:, 1]
+        if vehicle.lastClimb_ is not None and t > previousTime:
+            dt = t - previousTime
+            alpha = dt / (ACCEL_TIME_CONSTANT + dt)
+            vehicle.accelZ_ += alpha * ((climbRate - vehicle.lastClimb_) / dt - vehicle.accelZ_)
+        vehicle.lastClimb_ = climbRate
+
+        with state.estimate_.WriteSection() as estimate:
+            estimate.positionTime_ = t
+            estimate.latitude_ = vehicle.originLat_ + north / METRES_PER_DEG_LAT
+            estimate.longitude_ = vehicle.originLon_ + east / vehicle.metresPerDegLon_
+            estimate.altitude_ = altitude
+            estimate.northSpeed_ = northSpeed
+            estimate.eastSpeed_ = eastSpeed
+            estimate.climbRate_ = climbRate
+            estimate.accelZ_ = vehicle.accelZ_
+            estimate.latency_ = vehicle.link_.latency_
+        self.updateTime_.Record(time.perf_counter() - start)
+        return float(climbRate), vehicle.accelZ_
+
+    def UpdateAttitude(self, state, msg, rxTime):
+        """Fold in an ATTITUDE message."""
+        start = time.perf_counter()
+        vehicle = self.Vehicle(msg.get_srcSystem())
+        t = vehicle.link_.Sample(msg.time_boot_ms, rxTime)
+        attitude = vehicle.attitude_
+        if attitude.Update((msg.roll, msg.pitch, msg.yaw), (msg.rollspeed, msg.pitchspeed, msg.yawspeed),
+                           ANGLE_NOISE, ANGLE_RATE_NOISE, t):
+            self.resetCount_.Add()
+        roll, pitch, yaw = attitude.x_[:, 0]
+        rollRate, pitchRate, yawRate = attitude.x_[:, 1]
+        with state.estimate_.WriteSection() as estimate:
+            estimate.attitudeTime_ = t
+            estimate.roll_ = roll
+            estimate.pitch_ = pitch
+            estimate.yaw_ = yaw
+            estimate.rollRate_ = rollRate
+            estimate.pitchRate_ = pitchRate
+            estimate.yawRate_ = yawRate
+            estimate.latency_ = vehicle.link_.latency_
+        self.updateTime_.Record(time.perf_counter() - start)
+
+class TelemetryPredictor:
+    """
+    Telemetry snapshots with position and attitude extrapolated from the
+    vehicle's estimate to the time of the call plus lead (the latency still
+    ahead of the packet, e.g. the receiver's display delay). Extrapolation
+    stops at maxHorizon past the last measurement, so a lost link freezes
+    the values instead of letting them run off. Vehicles without an
+    estimate get their plain telemetry.
+    """
+    def __init__(self, lead=0.0, maxHorizon=1.0, clock=time.monotonic):
+        self.lead_ = lead
+        self.maxHorizon_ = maxHorizon
+        self.clock_ = clock
+
+    def Telemetry(self, state):
+        telemetry = state.telemetry_.Snapshot()
+        estimate = state.estimate_.Snapshot()
+        t = self.clock_() + self.lead_
+        fields = {}
+        if estimate.positionTime_ > 0:
+            h = min(max(t - estimate.positionTime_, 0.0), self.maxHorizon_)
+            latitude = estimate.latitude_ + estimate.northSpeed_ * h / METRES_PER_DEG_LAT
+            fields.update(
+                latitude_=latitude,
+                longitude_=estimate.longitude_ + estimate.eastSpeed_ * h
+                / (METRES_PER_DEG_LAT * math.cos(math.radians(latitude))),
+                altitude_=estimate.altitude_ + estimate.climbRate_ * h,
+                groundspeed_=math.hypot(estimate.northSpeed_, estimate.eastSpeed_),
+                verticalSpeed_=estimate.climbRate_,
+                accelZ_=estimate.accelZ_)
+        if estimate.attitudeTime_ > 0:
+            h = min(max(t - estimate.attitudeTime_, 0.0), self.maxHorizon_)
+            yaw = estimate.yaw_ + estimate.yawRate_ * h
+            fields.update(
+                roll_=estimate.roll_ + estimate.rollRate_ * h,
+                pitch_=estimate.pitch_ + estimate.pitchRate_ * h,
+                yaw_=yaw,
+                heading_=math.degrees(yaw) % 360.0)
+        return telemetry._replace(**fields) if fields else telemetry
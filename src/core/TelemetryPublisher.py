@@ -0,0 +1,68 @@
+"""
+Module: TelemetryPublisher.py
+Description: Rate-limited, change-driven send decision shared by the outbound telemetry links.
+"""
+import time
+from core.PeriodicScheduler import PeriodicScheduler
+from core.Metrics import GetMetrics
+
+class TelemetryPublisher:
+    """
+    Samples a link's outgoing values at up to maxRateHz and only transmits
+    when a watched field moved past its threshold, or when keepaliveHz says
+    the receiver has not heard from us for too long.
+
+    thresholds is aligned with the values tuple passed to Offer(); None marks
+    a field that is sent but never triggers a transmission on its own. A link
+    that carries several streams (one per vehicle) passes a key to Offer() so
+    each stream gets its own change and keepalive tracking.
+    """
+    def __init__(self, name, maxRateHz, keepaliveHz, thresholds):
+        self.scheduler_ = PeriodicScheduler(name, maxRateHz)
+        self.keepalivePeriod_ = 1.0 / keepaliveHz if keepaliveHz > 0 else float("inf")
+        self.watched_ = tuple((i, t) for i, t in enumerate(thresholds) if t is not None)
+        self.lastSent_ = {}  # key -> (values, send time)
+        self.sentCount_ = 0
+        self.suppressedCount_ = 0
+        GetMetrics(name).Gauges("publisher", self.Stats)
+
+    def Run(self, tick):
+        """Call tick() at the link's maximum rate; tick() offers values with Offer()."""
+        self.scheduler_.Run(lambda dt: tick())
+
+    async def RunAsync(self, tick):
+        await self.scheduler_.RunAsync(lambda dt: tick())
+
+    def Stop(self):
+        self.scheduler_.Stop()
+
+    def SetRates(self, maxRateHz, keepaliveHz):
+        self.scheduler_.SetRate(maxRateHz)
+        self.keepalivePeriod_ = 1.0 / keepaliveHz if keepaliveHz > 0 else float("inf")
+
+    def Resend(self):
+        """Make every stream due on the next Offer(), e.g. for a receiver that just joined."""
+        self.lastSent_ = {}
+
+    def Offer(self, values, send, key=None):
+        """Call send(values) if the stream is due. Returns True if it was sent."""
+        now = time.monotonic()
+        last = self.lastSent_.get(key)
+        if (last is None
+                or now - last[1] >= self.keepalivePeriod_
+                or self.HasChanged(values, last[0])):
+            send(values)
+            self.lastSent_[key] = (values, now)
+            self.sentCount_ += 1
+            return True
+        self.suppressedCount_ += 1
+        return False
+
+    def HasChanged(self, values, last):
+        for i, threshold in self.watched_:
+            if abs(values[i] - last[i]) > threshold:
+                return True
+        return False
+
+    def Stats(self):
+        return {"sent": self.sentCount_, "suppressed": self.suppressedCount_, "streams": len(self.lastSent_)}
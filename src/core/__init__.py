@@ -0,0 +1,6 @@
+"""
+Package: core
+-------------------
+This package contains runtime building blocks shared by the Mission Planner interfaces,
+such as the periodic scheduler used by the control and publishing loops.
+"""
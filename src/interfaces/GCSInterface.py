@@ -1,59 +1,133 @@
 import time
-import struct
 import logging
 from interfaces.UDPChannel import UDPChannel
+from interfaces.LatestValueMailbox import LatestValueMailbox
+from interfaces.PacketFormats import TOUCH_PACKET, unpack_exact
+from core.PeriodicScheduler import PeriodicScheduler
+from core.LogPipeline import PacketLogger
+from core.Metrics import GetMetrics
+from core.LoopSupervisor import GetHeartbeat
+from core.GimbalController import GimbalController, AxisLimits
+
+# The gimbal gain was tuned as PWM counts per full-stick step of the old
+# 200 ms command loop; increments are scaled by dt relative to this period.
+GAIN_REFERENCE_PERIOD = 0.2
 
 class GCSInterface:
-    def __init__(self, udpIpRec, portRecMeta, portRecTouch):
+    def __init__(self, udpIpRec, portRecMeta, portRecTouch, controlRateHz=50.0,
+                 latestValueMode=True, maxInputAge=0.2, useTouchSequence=False, pwmMaxAccel=float("inf")):
         self.logger = logging.getLogger("GSC Interface")
+        self.packetLogger_ = PacketLogger("GSC Interface")
         self.metaChannel_ = UDPChannel(udpIpRec, portRecMeta, isReceiver=True)
         self.touchChannel_ = UDPChannel(udpIpRec, portRecTouch, isReceiver=True)
-    
+        self.controlScheduler_ = PeriodicScheduler("GCS Control Scheduler", controlRateHz)
+        self.latestValueMode_ = latestValueMode
+        self.useTouchSequence_ = useTouchSequence
+        self.touchMailbox_ = LatestValueMailbox(maxInputAge)
+        # PWM setpoint of the gimbal channels while the UDP joystick is in control.
+        self.pwmMaxAccel_ = pwmMaxAccel
+        self.pwmGimbal_ = GimbalController(AxisLimits(0, 0, 0, 0), AxisLimits(0, 0, 0, 0))
+        metrics = GetMetrics("GCS Interface")
+        metrics.Gauges("touch_channel", self.touchChannel_.Stats)
+        metrics.Gauges("touch_mailbox", self.touchMailbox_.Stats)
+        self.receiveErrors_ = metrics.Counter("receive_errors")
+        self.commandsSent_ = metrics.Counter("commands_sent")
+        # Time from the touch packet reaching the host to it being applied to the state.
+        self.touchLatency_ = metrics.Histogram("touch_latency")
+
     def TouchAppReceiver(self, state):
         self.logger.info("GCS interface started.")
+        if self.latestValueMode_:
+            # Drain the socket, then act only on the newest valid packet.
+            channel = self.touchChannel_
+            handler = lambda data, address: self.OfferTouchPacket(data, channel.lastRxTime_)
+        else:
+            handler = lambda data, address: self.ApplyTouch(state, unpack_exact(TOUCH_PACKET, data))
+        # Blocks until a packet arrives, so only the rate and CPU use are supervised.
+        heartbeat = GetHeartbeat("GCS Touch Receiver")
         while True:
+            heartbeat.Beat()
             try:
-                data, address = self.touchChannel_.Receive(1024)
-                unpacked = struct.unpack('=iiiiiii', data)
-                state.control_.activeControl_ = unpacked[1]
-                state.control_.gcsCamera_ = unpacked[2]
-                state.control_.nn_ = unpacked[3]
-                state.control_.smartDeploy_ = unpacked[4]
-                state.control_.gcsCommand1_ = unpacked[5]
-                state.control_.gcsCommand2_ = unpacked[6]
-                self.logger.debug(f"GCS active control: {state.control_.activeControl_}")
+                self.touchChannel_.ReceiveBatch(handler)
+                if self.latestValueMode_:
+                    self.ApplyLatestTouch(state)
             except Exception as e:
+                self.receiveErrors_.Add()
                 self.logger.error(f"GCS receiver error: {e}")
-    
+
+    def HandleTouchPacket(self, state, data):
+        if self.latestValueMode_:
+            self.OfferTouchPacket(data, time.time())
+            self.ApplyLatestTouch(state)
+        else:
+            self.ApplyTouch(state, unpack_exact(TOUCH_PACKET, data))
+
+    def OfferTouchPacket(self, data, rxTime):
+        unpacked = unpack_exact(TOUCH_PACKET, data)
+        sequence = unpacked[0] if self.useTouchSequence_ else None
+        self.touchMailbox_.Offer(unpacked, sequence, rxTime)
+
+    def ApplyLatestTouch(self, state):
+        rxTime = self.touchMailbox_.pendingRxTime_
+        unpacked = self.touchMailbox_.Take()
+        if unpacked is not None:
+            self.ApplyTouch(state, unpacked)
+            self.touchLatency_.Record(time.time() - rxTime)
+
+    def ApplyTouch(self, state, unpacked):
+        with state.control_.WriteSection() as control:
+            control.activeControl_ = unpacked[1]
+            control.gcsCamera_ = unpacked[2]
+            control.nn_ = unpacked[3]
+            control.smartDeploy_ = unpacked[4]
+            control.gcsCommand1_ = unpacked[5]
+            control.gcsCommand2_ = unpacked[6]
+        if self.packetLogger_.isEnabledFor(logging.DEBUG):
+            self.packetLogger_.debug(f"GCS active control: {unpacked[1]}")
+
     def GCSControlHandler(self, state, mavlinkInterface):
-        while True:
-            if state.control_.activeControl_ != 0:
-                if state.control_.activeControl_ == 1:
-                    state.rc_channels_.cameraValue_ = state.control_.metaCamera_
-                    state.gimbal_.deploy12_ = state.control_.metaCommand1_
-                    state.gimbal_.deploy34_ = state.control_.metaCommand2_
-                    self.GCSCommandsToDrone(state, mavlinkInterface)
-                if state.control_.activeControl_ == 2:
-                    if state.control_.activeControlPrev_ != 2:
-                        state.control_.activeControlPrev_ = state.control_.activeControl_
-                        state.gimbal_.pwmPitch_ = state.gimbal_.gimbalPitchNeutral_
-                        state.gimbal_.pwmYaw_ = state.gimbal_.gimbalYawNeutral_
-                    if state.joystick_.joystickButton_ == 1:
-                        state.gimbal_.pwmPitch_ = state.gimbal_.gimbalPitchNeutral_
-                        state.gimbal_.pwmYaw_ = state.gimbal_.gimbalYawNeutral_
-                    state.rc_channels_.cameraValue_ = state.control_.gcsCamera_
-                    state.gimbal_.deploy12_ = state.control_.gcsCommand1_
-                    state.gimbal_.deploy34_ = state.control_.gcsCommand2_
-                    state.gimbal_.pwmPitch_ += int(state.joystick_.joystickY_ * state.gimbal_.gimbalGain_)
-                    state.gimbal_.pwmYaw_ += int(state.joystick_.joystickX_ * state.gimbal_.gimbalGain_)
-                    self.GCSCommandsToDrone(state, mavlinkInterface)
-            else:
-                state.rc_channels_.cameraValue_ = 0
-                state.gimbal_.deploy12_ = 0
-                state.gimbal_.deploy34_ = 0
-                state.gimbal_.pwmPitch_ = 0
-                state.gimbal_.pwmYaw_ = 0
-    
+        self.controlScheduler_.Run(lambda dt: self.ControlStep(state, mavlinkInterface, dt))
+
+    async def GCSControlHandlerAsync(self, state, mavlinkInterface):
+        await self.controlScheduler_.RunAsync(lambda dt: self.ControlStep(state, mavlinkInterface, dt))
+
+    def Stop(self):
+        self.controlScheduler_.Stop()
+
+    def ControlStep(self, state, mavlinkInterface, dt):
+        control = state.control_.Snapshot()
+        joystick = state.joystick_.Snapshot()
+        activeControl = control.activeControl_
+        with state.gimbal_.WriteSection() as gimbal, state.rc_channels_.WriteSection() as rc:
+            if activeControl == 1:
+                rc.cameraValue_ = control.metaCamera_
+                gimbal.deploy12_ = control.metaCommand1_
+                gimbal.deploy34_ = control.metaCommand2_
+                self.GCSCommandsToDrone(state, mavlinkInterface)
+            elif activeControl == 2:
+                # The limits come from the vehicle state, so reloaded settings apply at once.
+                rate = gimbal.gimbalGain_ / GAIN_REFERENCE_PERIOD
+                self.pwmGimbal_.SetLimits(
+                    AxisLimits(gimbal.pwmPitchMin_, gimbal.pwmPitchMax_, rate, self.pwmMaxAccel_),
+                    AxisLimits(gimbal.pwmYawMin_, gimbal.pwmYawMax_, rate, self.pwmMaxAccel_))
+                if control.activeControlPrev_ != 2 or joystick.joystickButton_ == 1:
+                    self.pwmGimbal_.Reset(gimbal.gimbalPitchNeutral_, gimbal.gimbalYawNeutral_)
+                rc.cameraValue_ = control.gcsCamera_
+                gimbal.deploy12_ = control.gcsCommand1_
+                gimbal.deploy34_ = control.gcsCommand2_
+                gimbal.pwmPitch_, gimbal.pwmYaw_ = self.pwmGimbal_.Step(joystick.joystickY_ * rate,
+                                                                        joystick.joystickX_ * rate, dt)
+                self.GCSCommandsToDrone(state, mavlinkInterface)
+            elif control.activeControlPrev_ != 0:
+                # Control released: clear the outputs once rather than on every tick.
+                rc.cameraValue_ = 0
+                gimbal.deploy12_ = 0
+                gimbal.deploy34_ = 0
+                gimbal.pwmPitch_ = 0
+                gimbal.pwmYaw_ = 0
+        with state.control_.WriteSection() as controlWrite:
+            controlWrite.activeControlPrev_ = activeControl
+
     def GCSCommandsToDrone(self, state, mavlinkInterface):
         if state.control_.activeControl_ != 0:
             if state.gimbal_.pwmPitch_ > state.gimbal_.pwmPitchMax_:
@@ -68,10 +142,10 @@ class GCSInterface:
                 state.rc_channels_.cameraValue_ = 1095
             if state.rc_channels_.cameraValue_ == 2:
                 state.rc_channels_.cameraValue_ = 1535
+            self.commandsSent_.Add()
             mavlinkInterface.SendRCChannelPWM(state.gimbal_.deploy12_,
                                               state.gimbal_.deploy34_,
                                               state.rc_channels_.cameraValue_,
-                                              state.gimbal_.pwmPitch_,
-                                              state.gimbal_.pwmYaw_)
+                                              int(round(state.gimbal_.pwmPitch_)),
+                                              int(round(state.gimbal_.pwmYaw_)))
             state.gimbal_.pitchPrev_ = state.gimbal_.pwmPitch_
-            time.sleep(0.2)
\ No newline at end of file
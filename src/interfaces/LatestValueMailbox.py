@@ -0,0 +1,75 @@
+"""
+Module: LatestValueMailbox.py
+Description: Keeps only the newest valid control packet of a receive batch.
+"""
+import time
+
+SEQUENCE_MODULO = 1 << 32
+
+class LatestValueMailbox:
+    """
+    Holds the newest decoded packet offered since the last Take().
+
+    Packets carrying a sequence number behind the newest one seen are
+    dropped as reordered. A packet repeating the newest sequence number is
+    accepted: control packets carry the whole latest state, so a repeat is
+    harmless. A packet that is replaced by a newer one before it was taken
+    counts as superseded. A packet whose receive time is older than maxAge
+    seconds when taken counts as stale; reordered and stale packets are the
+    dropped ones.
+    If the sender restarts its counter, the mailbox resynchronises after
+    resyncAfter seconds without an accepted packet, or immediately on a
+    backwards jump larger than reorderWindow.
+    """
+    def __init__(self, maxAge=0.2, reorderWindow=256, resyncAfter=1.0):
+        self.maxAge_ = maxAge
+        self.reorderWindow_ = reorderWindow
+        self.resyncAfter_ = resyncAfter
+        self.pending_ = None
+        self.pendingRxTime_ = 0.0
+        self.lastSequence_ = None
+        self.lastAcceptTime_ = 0.0
+        self.acceptedCount_ = 0
+        self.reorderedCount_ = 0
+        self.supersededCount_ = 0
+        self.staleCount_ = 0
+
+    def Offer(self, values, sequence=None, rxTime=None):
+        """Offer a decoded packet. Returns False if it was dropped."""
+        if rxTime is None:
+            rxTime = time.time()
+        if sequence is not None and self.lastSequence_ is not None:
+            behind = (self.lastSequence_ - sequence) % SEQUENCE_MODULO
+            if (0 < behind <= SEQUENCE_MODULO // 2 and behind <= self.reorderWindow_
+                    and rxTime - self.lastAcceptTime_ < self.resyncAfter_):
+                self.reorderedCount_ += 1
+                return False
+        if sequence is not None:
+            self.lastSequence_ = sequence
+        if self.pending_ is not None:
+            self.supersededCount_ += 1
+        self.pending_ = values
+        self.pendingRxTime_ = rxTime
+        self.lastAcceptTime_ = rxTime
+        return True
+
+    def Take(self):
+        """Return the newest pending packet, or None if there is none or it is stale."""
+        values = self.pending_
+        if values is None:
+            return None
+        self.pending_ = None
+        if time.time() - self.pendingRxTime_ > self.maxAge_:
+            self.staleCount_ += 1
+            return None
+        self.acceptedCount_ += 1
+        return values
+
+    def Stats(self):
+        return {
+            "accepted": self.acceptedCount_,
+            "dropped": self.reorderedCount_ + self.staleCount_,
+            "reordered": self.reorderedCount_,
+            "superseded": self.supersededCount_,
+            "stale": self.staleCount_,
+        }
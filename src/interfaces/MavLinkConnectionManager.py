@@ -0,0 +1,321 @@
+"""
+Module: MavLinkConnectionManager.py
+Description: The one MAVLink connection: owns the link, runs the receive loop, fans messages out and sends.
+
+Readers subscribe handlers by message type; writers pass encoded messages
+to Send(). The peer address and target ids are learned on the receiving
+side and shared with forked processes that only send.
+
+On a UDP link the receive loop reads the datagrams itself and looks at the
+raw frame headers first: only frames whose message id has a subscriber (and
+HEARTBEAT, which the link bookkeeping needs) are handed to pymavlink's
+decoder. Frame header layouts:
+    v1: 0xFE, len, seq, sysid, compid, msgid                         + payload + crc16
+    v2: 0xFD, len, incompat, compat, seq, sysid, compid, msgid[3] LE + payload + crc16 (+ 13-byte signature)
+"""
+import time
+import socket
+import logging
+import selectors
+import threading
+import multiprocessing
+from pymavlink import mavutil
+from core.FlightRecorder import CHANNEL_MAVLINK
+from core.Metrics import GetMetrics
+from core.LoopSupervisor import GetHeartbeat
+
+MAVLINK_STX_V1 = 0xFE
+MAVLINK_STX_V2 = 0xFD
+V1_HEADER_LEN = 6
+V2_HEADER_LEN = 10
+CRC_LEN = 2
+# Frames from SiK radios are not counted towards packet loss, as in mavutil.
+RADIO_SOURCE = (ord('3'), ord('D'))
+
+# Message type name -> id, for the subscription filter.
+MESSAGE_IDS = {cls.msgname: msgId for msgId, cls in mavutil.mavlink.mavlink_map.items()}
+
+# Layout of the peer array shared with forked senders.
+PEER_VERSION, PEER_TARGET_SYSTEM, PEER_TARGET_COMPONENT, PEER_HOST, PEER_PORT, PEER_MAVLINK2 = range(6)
+
+class MavlinkConnectionManager:
+
+    def __init__(self, ip, port, waitTimeout=0.5, headerFilter=True):
+        self.logger = logging.getLogger("MavLink Connection Manager")
+        self.waitTimeout_ = waitTimeout
+        self.running_ = True
+        self.recorder_ = None
+        if ip is None:
+            # Offline: messages only arrive through Dispatch (journal replay).
+            self.master_ = None
+        else:
+            connection_string = f"udp:{ip}:{port}"
+            self.logger.info(f"Initializing MAVLink connection on {connection_string}...")
+            self.master_ = mavutil.mavlink_connection(connection_string)
+
+        # Block on the link file descriptor instead of polling recv_match.
+        # Links without a selectable fd fall back to mavutil's own select().
+        self.selector_ = None
+        if self.master_ is not None and getattr(self.master_, "fd", None) is not None:
+            self.selector_ = selectors.DefaultSelector()
+            self.selector_.register(self.master_.fd, selectors.EVENT_READ)
+
+        # Header filtering needs the raw datagrams, which only a UDP link exposes.
+        self.headerFilter_ = headerFilter and isinstance(self.master_, mavutil.mavudp)
+
+        # A UDP server link only sends to clients it has received from, and the
+        # receive loop may run in another process than the senders.
+        self.peer_ = multiprocessing.Array("q", 6)
+        self.peerVersion_ = 0
+        self.knownClients_ = 0
+        self.knownProtocol_ = None
+        self.sendLock_ = threading.Lock()
+
+        metrics = GetMetrics("MavLink Connection Manager")
+        metrics.Gauges("link", self.LinkStats)
+        self.messagesHandled_ = metrics.Counter("messages_handled")
+        self.handlerErrors_ = metrics.Counter("handler_errors")
+        self.messagesSent_ = metrics.Counter("messages_sent")
+        self.sendErrors_ = metrics.Counter("send_errors")
+        self.framesDecoded_ = metrics.Counter("frames_decoded")
+        self.framesSkipped_ = metrics.Counter("frames_skipped")
+        self.dispatchTime_ = metrics.Histogram("dispatch_time")
+
+        # Message type -> tuple of handlers. Tuples are replaced, never mutated,
+        # so the receive loop can dispatch without taking the lock.
+        self.handlers_ = {}
+        self.handlersLock_ = threading.Lock()
+        self.wantedIds_ = frozenset((MESSAGE_IDS["HEARTBEAT"],))
+
+    def Subscribe(self, msgType, handler):
+        """Call handler(msg) for every received message of type msgType."""
+        with self.handlersLock_:
+            self.handlers_[msgType] = self.handlers_.get(msgType, ()) + (handler,)
+            self.UpdateWantedIds()
+
+    def Unsubscribe(self, msgType, handler):
+        with self.handlersLock_:
+            handlers = tuple(h for h in self.handlers_.get(msgType, ()) if h != handler)
+            if handlers:
+                self.handlers_[msgType] = handlers
+            else:
+                self.handlers_.pop(msgType, None)
+            self.UpdateWantedIds()
+
+    def UpdateWantedIds(self):
+        """Called with handlersLock_ held. Like handlers_, the set is replaced, never mutated."""
+        wanted = {MESSAGE_IDS["HEARTBEAT"]}
+        for msgType in self.handlers_:
+            msgId = MESSAGE_IDS.get(msgType)
+            if msgId is None:
+                self.logger.warning(f"Subscribed to unknown MAVLink message {msgType}")
+            else:
+                wanted.add(msgId)
+        self.wantedIds_ = frozenset(wanted)
+
+    def Dispatch(self, msg):
+        handlers = self.handlers_.get(msg.get_type())
+        if handlers is None:
+            return
+        start = time.perf_counter()
+        for handler in handlers:
+            try:
+                handler(msg)
+            except Exception as e:
+                self.handlerErrors_.Add()
+                self.logger.error(f"Error handling {msg.get_type()}: {e}")
+        self.messagesHandled_.Add()
+        self.dispatchTime_.Record(time.perf_counter() - start)
+
+    def Target(self):
+        """(system, component) the commands are addressed to; 0 until the vehicle is heard."""
+        if self.master_ is None:
+            return (0, 0)
+        self.SyncPeer()
+        return (self.master_.target_system, self.master_.target_component)
+
+    def Mav(self):
+        """The link's MAVLink encoder; mavutil replaces it when the vehicle turns out to speak MAVLink 2."""
+        self.SyncPeer()
+        return self.master_.mav
+
+    def Send(self, msg):
+        """Pack and send a message built with one of the Mav().*_encode methods."""
+        with self.sendLock_:
+            self.SyncPeer()
+            try:
+                self.master_.mav.send(msg)
+            except Exception:
+                self.sendErrors_.Add()
+                raise
+            self.messagesSent_.Add()
+
+    def LearnPeer(self, msg):
+        """Receive side: adopt the first vehicle heard as the target and share the peer address."""
+        master = self.master_
+        changed = False
+        # mavutil locks target_system onto the first vehicle heartbeat but leaves the component at 0.
+        if (master.target_component == 0 and msg.get_type() == "HEARTBEAT"
+                and msg.get_srcSystem() == master.target_system and master.probably_vehicle_heartbeat(msg)):
+            master.target_component = msg.get_srcComponent()
+            self.logger.info(f"Targeting vehicle {master.target_system}:{master.target_component}")
+            changed = True
+        clients = getattr(master, "clients", None)
+        if clients and len(clients) != self.knownClients_:
+            self.knownClients_ = len(clients)
+            changed = True
+        if master.WIRE_PROTOCOL_VERSION != self.knownProtocol_:
+            self.knownProtocol_ = master.WIRE_PROTOCOL_VERSION
+            changed = True
+        if changed:
+            self.PublishPeer()
+
+    def PublishPeer(self):
+        master = self.master_
+        clients = getattr(master, "clients", None)
+        host, port = 0, 0
+        if clients:
+            # The most recently heard client.
+            address = max(clients, key=lambda a: master.clients_last_alive.get(a, 0))
+            host = int.from_bytes(socket.inet_aton(address[0]), "big")
+            port = address[1]
+        with self.peer_.get_lock():
+            self.peer_[PEER_TARGET_SYSTEM] = master.target_system
+            self.peer_[PEER_TARGET_COMPONENT] = master.target_component
+            self.peer_[PEER_HOST] = host
+            self.peer_[PEER_PORT] = port
+            self.peer_[PEER_MAVLINK2] = master.WIRE_PROTOCOL_VERSION == "2.0"
+            self.peer_[PEER_VERSION] += 1
+            self.peerVersion_ = self.peer_[PEER_VERSION]
+
+    def SyncPeer(self):
+        """Send side: pick up a peer learned by the receive loop, possibly in another process."""
+        if self.peer_[PEER_VERSION] == self.peerVersion_:
+            return
+        with self.peer_.get_lock():
+            self.peerVersion_, targetSystem, targetComponent, host, port, mavlink2 = self.peer_[:]
+        master = self.master_
+        if mavlink2 and master.WIRE_PROTOCOL_VERSION != "2.0":
+            # Switch the encoder the same way mavutil does on the first MAVLink 2 frame it receives.
+            master.auto_mavlink_version(bytes((253,)))
+        master.target_system = targetSystem
+        master.target_component = targetComponent
+        clients = getattr(master, "clients", None)
+        if clients is not None and port:
+            address = (socket.inet_ntoa(host.to_bytes(4, "big")), port)
+            if address not in clients:
+                clients.add(address)
+                master.clients_last_alive[address] = time.time()
+
+    def LinkStats(self):
+        """Counters kept by pymavlink for the link: frames, bytes, CRC errors and sequence gaps."""
+        if self.master_ is None:
+            return {}
+        mav = self.master_.mav
+        return {"packetsReceived": mav.total_packets_received,
+                "bytesReceived": mav.total_bytes_received,
+                "receiveErrors": mav.total_receive_errors,
+                "lost": self.master_.mav_loss}
+
+    def WaitForData(self):
+        """Block until the link is readable or waitTimeout_ expires."""
+        if self.selector_ is None:
+            return self.master_.select(self.waitTimeout_)
+        return len(self.selector_.select(self.waitTimeout_)) > 0
+
+    def Stop(self):
+        self.running_ = False
+
+    def ReceiveLoop(self):
+        self.logger.info(f"Initiating MAVLink receive loop (header filter {'on' if self.headerFilter_ else 'off'})...")
+        heartbeat = GetHeartbeat("MavLink Connection Manager", self.waitTimeout_)
+        while self.running_:
+            heartbeat.Beat()
+            try:
+                if not self.WaitForData():
+                    continue
+                if self.headerFilter_:
+                    self.ReceiveDatagrams()
+                    continue
+                # One readable event may carry several frames; drain them all.
+                msg = self.master_.recv_match(blocking=False)
+                while msg is not None:
+                    if self.recorder_ is not None:
+                        self.recorder_.Record(CHANNEL_MAVLINK, msg.get_msgbuf())
+                    self.LearnPeer(msg)
+                    self.Dispatch(msg)
+                    msg = self.master_.recv_match(blocking=False)
+            except Exception as e:
+                self.logger.error(f"Error in MAVLink receive loop: {e}")
+
+    def ReceiveDatagrams(self):
+        """Drain the UDP socket, doing the client bookkeeping of mavudp.recv()."""
+        master = self.master_
+        while True:
+            try:
+                data, address = master.port.recvfrom(mavutil.UDP_MAX_PACKET_LEN)
+            except (BlockingIOError, ConnectionRefusedError):
+                return
+            if master.udp_server:
+                master.clients.add(address)
+                master.clients_last_alive[address] = time.time()
+            elif master.broadcast:
+                master.last_address = address
+            if master.first_byte:
+                master.auto_mavlink_version(data)
+            self.FilterFrames(data)
+
+    def FilterFrames(self, data):
+        """Decode the wanted frames of a datagram and only account for the others."""
+        wanted = self.wantedIds_
+        offset = 0
+        size = len(data)
+        while offset < size:
+            stx = data[offset]
+            end = size + 1
+            if stx == MAVLINK_STX_V2 and offset + V2_HEADER_LEN <= size:
+                end = offset + V2_HEADER_LEN + data[offset + 1] + CRC_LEN
+                if data[offset + 2] & mavutil.mavlink.MAVLINK_IFLAG_SIGNED:
+                    end += mavutil.mavlink.MAVLINK_SIGNATURE_BLOCK_LEN
+                seq, sysid, compid = data[offset + 4], data[offset + 5], data[offset + 6]
+                msgId = data[offset + 7] | data[offset + 8] << 8 | data[offset + 9] << 16
+            elif stx == MAVLINK_STX_V1 and offset + V1_HEADER_LEN <= size:
+                end = offset + V1_HEADER_LEN + data[offset + 1] + CRC_LEN
+                seq, sysid, compid, msgId = data[offset + 2], data[offset + 3], data[offset + 4], data[offset + 5]
+            if end > size:
+                # Not a whole frame where one should start: let pymavlink resynchronise on the rest.
+                self.Decode(data[offset:])
+                return
+            if msgId in wanted:
+                self.Decode(data[offset:end])
+            else:
+                self.SkipFrame(seq, sysid, compid, end - offset)
+                if self.recorder_ is not None:
+                    self.recorder_.Record(CHANNEL_MAVLINK, data[offset:end])
+            offset = end
+
+    def Decode(self, buf):
+        master = self.master_
+        for msg in master.mav.parse_buffer(buf) or ():
+            # What recv_msg() would have done with the message.
+            master.post_message(msg)
+            self.framesDecoded_.Add()
+            if self.recorder_ is not None:
+                self.recorder_.Record(CHANNEL_MAVLINK, msg.get_msgbuf())
+            self.LearnPeer(msg)
+            self.Dispatch(msg)
+
+    def SkipFrame(self, seq, sysid, compid, length):
+        """Keep the link statistics that post_message() would have updated for the frame."""
+        master = self.master_
+        mav = master.mav
+        mav.total_packets_received += 1
+        mav.total_bytes_received += length
+        source = (sysid, compid)
+        if source != RADIO_SOURCE:
+            last = master.last_seq.get(source)
+            if last is not None:
+                master.mav_loss += (seq - last - 1) % 256
+            master.last_seq[source] = seq
+            master.mav_count += 1
+        self.framesSkipped_.Add()
@@ -1,62 +1,130 @@
+import math
+import time
 import logging
-from pymavlink import mavutil
+from interfaces.MavLinkConnectionManager import MESSAGE_IDS
+
+# Window over which the altitude history is differentiated into climb rate.
+CLIMB_RATE_WINDOW = 1.0
 
 class MavlinkReaderInterface:
+    """Writes the telemetry messages received on the shared MAVLink connection into the drone state."""
 
-    def __init__(self, state, ip,port):
+    def __init__(self, state, connection, fleet=None, estimator=None):
         self.state_ = state
-        connection_string = f"udp:{ip}:{port}"
+        # With a FleetRegistry, messages are routed to the state of their source system.
+        self.fleet_ = fleet
+        # Optional TelemetryEstimator fed with the position and attitude messages.
+        self.estimator_ = estimator
         self.logger = logging.getLogger("MavLink Reader Interface")
-        self.logger.info("Initializing MAVLink connection...")
-        self.master_ = mavutil.mavlink_connection(connection_string)
+        # Timestamps history rows; journal replay substitutes the journal clock.
+        self.clock_ = time.monotonic
+        self.connection_ = connection
+        connection.Subscribe('RC_CHANNELS', self.ReadRCChannelsRaw)
+        connection.Subscribe('VFR_HUD', self.HandleVfrHud)
+        connection.Subscribe('ATTITUDE', self.HandleAttitude)
+        connection.Subscribe('GLOBAL_POSITION_INT', self.HandleGlobalPosition)
+        connection.Subscribe('SYS_STATUS', self.HandleSysStatus)
+        # Gimbal angle feedback, whichever of these the autopilot sends. The last two
+        # only exist in MAVLink 2 dialects, so they are skipped when the dialect lacks them.
+        for msgType, handler in (('MOUNT_STATUS', self.HandleMountStatus),
+                                 ('MOUNT_ORIENTATION', self.HandleMountOrientation),
+                                 ('GIMBAL_DEVICE_ATTITUDE_STATUS', self.HandleGimbalAttitude)):
+            if msgType in MESSAGE_IDS:
+                connection.Subscribe(msgType, handler)
+
+    def StateFor(self, msg):
+        """DroneState a message belongs to, or None if it should be ignored."""
+        if self.fleet_ is None:
+            return self.state_
+        return self.fleet_.Get(msg.get_srcSystem())
 
     def ReadRCChannelsRaw(self, msg):
-        self.state_.rc_channels_.deploy12Value_ = int(msg.chan6_raw)
-        self.state_.rc_channels_.deploy34Value_ = int(msg.chan7_raw)
-        self.state_.rc_channels_.safetyValue_ = int(msg.chan8_raw)
-        self.state_.rc_channels_.cameraValue_ = int(msg.chan12_raw)
+        state = self.StateFor(msg)
+        if state is None:
+            return
+        with state.rc_channels_.WriteSection() as rc:
+            rc.deploy12Value_ = int(msg.chan6_raw)
+            rc.deploy34Value_ = int(msg.chan7_raw)
+            rc.safetyValue_ = int(msg.chan8_raw)
+            rc.cameraValue_ = int(msg.chan12_raw)
        # self.logger.info(f"Received MAVLink RC_CHANNELS: {msg.get_type()}")
 
     def HandleVfrHud(self, msg):
-        self.state_.telemetry_.groundspeed_ = msg.groundspeed
-        self.state_.telemetry_.altitude_ = msg.alt
-        self.state_.telemetry_.heading_ = msg.heading
+        state = self.StateFor(msg)
+        if state is None:
+            return
+        with state.telemetry_.WriteSection() as telemetry:
+            telemetry.groundspeed_ = msg.groundspeed
+            telemetry.altitude_ = msg.alt
+            telemetry.heading_ = msg.heading
+            state.history_.Append(telemetry, state.battery_, self.clock_())
        # self.logger.info( f"Received MAVLink VFR_HUD: Altitude={msg.alt}, Heading={msg.heading}")
-    
+
     def HandleAttitude(self, msg):
-        self.state_.telemetry_.pitch_ = msg.pitch
-        self.state_.telemetry_.roll_ = msg.roll
+        state = self.StateFor(msg)
+        if state is None:
+            return
+        now = self.clock_()
+        if self.estimator_ is not None:
+            self.estimator_.UpdateAttitude(state, msg, now)
+        with state.telemetry_.WriteSection() as telemetry:
+            telemetry.pitch_ = msg.pitch
+            telemetry.roll_ = msg.roll
+            telemetry.yaw_ = msg.yaw
+            state.history_.Append(telemetry, state.battery_, now)
         #self.logger.info(f"Received MAVLink ATTITUDE: Pitch={msg.pitch}, Roll={msg.roll}")
 
     def HandleGlobalPosition(self, msg):
-        self.state_.telemetry_.latitude_ = msg.lat / 1e7
-        self.state_.telemetry_.longitude_ = msg.lon / 1e7
-        self.state_.telemetry_.altitude_ = msg.alt
-        #self.logger.info( f"Received MAVLink GLOBAL_POSITION_INT: Lat={self.state_.telemetry_.latitude_}, Lon={self.state_.telemetry_.longitude_}")
-    
+        state = self.StateFor(msg)
+        if state is None:
+            return
+        now = self.clock_()
+        filtered = None
+        if self.estimator_ is not None:
+            filtered = self.estimator_.UpdatePosition(state, msg, now)
+        with state.telemetry_.WriteSection() as telemetry:
+            telemetry.latitude_ = msg.lat / 1e7
+            telemetry.longitude_ = msg.lon / 1e7
+            telemetry.altitude_ = msg.alt / 1000.0
+            history = state.history_
+            history.Append(telemetry, state.battery_, now)
+            if filtered is not None:
+                telemetry.verticalSpeed_, telemetry.accelZ_ = filtered
+            else:
+                climbRate = history.Rate("altitude", CLIMB_RATE_WINDOW, now)
+                if climbRate is not None:
+                    telemetry.verticalSpeed_ = climbRate
+        #self.logger.info( f"Received MAVLink GLOBAL_POSITION_INT: Lat={state.telemetry_.latitude_}, Lon={state.telemetry_.longitude_}")
+
     def HandleSysStatus(self, msg):
-        self.state_.battery_.voltageValue_ = msg.voltage_battery / 1000.0
-        self.state_.battery_.currentValue_ = msg.current_battery / 100.0
-       # self.logger.info( f"Received MAVLink SYS_STATUS: Voltage={self.state_.battery_.voltageValue_}V")
-    
-    def MavlinkReader(self):
-        self.logger.info("Initiating MAVLink Read loop...")
-        while True:
-            msg = self.master_.recv_match(blocking=False)
-            if msg is not None:
-                try:
-                    msgType = msg.get_type()
-                    if msgType == 'RC_CHANNELS':
-                        #self.logger.debug("Received RC_CHANNELS message.")
-                        self.ReadRCChannelsRaw(msg)
-                    if msgType == 'VFR_HUD':
-                       # self.logger.debug("Received VFR_HUD message.")
-                        self.HandleVfrHud(msg)
-                    if msgType == 'ATTITUDE':
-                        #self.logger.debug("Received ATTITUDE message.")
-                        self.HandleAttitude(msg)
-                    if msgType == 'GLOBAL_POSITION_INT':
-                        #self.logger.debug("Received GLOBAL_POSITION_INT message.")
-                        self.HandleGlobalPosition(msg)
-                except Exception as e:
-                    self.logger.error(f"Error in PymavlinkRead: {e}")
\ No newline at end of file
+        state = self.StateFor(msg)
+        if state is None:
+            return
+        with state.battery_.WriteSection() as battery:
+            battery.voltageValue_ = msg.voltage_battery / 1000.0
+            battery.currentValue_ = msg.current_battery / 100.0
+            battery.batteryRemaining_ = msg.battery_remaining
+            state.history_.Append(state.telemetry_, battery, self.clock_())
+       # self.logger.info( f"Received MAVLink SYS_STATUS: Voltage={state.battery_.voltageValue_}V")
+
+    def HandleMountStatus(self, msg):
+        # pointing_a is pitch and pointing_c yaw, in centidegrees.
+        self.StoreMountAngles(msg, msg.pointing_a / 100.0, msg.pointing_c / 100.0)
+
+    def HandleMountOrientation(self, msg):
+        self.StoreMountAngles(msg, msg.pitch, msg.yaw)
+
+    def HandleGimbalAttitude(self, msg):
+        w, x, y, z = msg.q
+        pitch = math.degrees(math.asin(max(-1.0, min(1.0, 2.0 * (w * y - z * x)))))
+        yaw = math.degrees(math.atan2(2.0 * (w * z + x * y), 1.0 - 2.0 * (y * y + z * z)))
+        self.StoreMountAngles(msg, pitch, yaw)
+
+    def StoreMountAngles(self, msg, pitch, yaw):
+        state = self.StateFor(msg)
+        if state is None:
+            return
+        with state.gimbal_.WriteSection() as gimbal:
+            gimbal.mountPitch_ = pitch
+            gimbal.mountYaw_ = yaw
+            gimbal.mountTime_ = self.clock_()
@@ -2,69 +2,120 @@ import time
 import logging
 from pymavlink import mavutil
 import threading
+from core.LogPipeline import PacketLogger
+from core.GimbalController import GimbalController, AxisLimits, PITCH, YAW
+from core.Metrics import GetMetrics
+from core.CommandQueue import (CommandQueue, CommandKind, PRIORITY_CRITICAL, PRIORITY_COMMAND,
+                               PRIORITY_STREAM)
 
 class MavlinkWriterInterface:
+    """
+    Outbound MAVLink commands. The public methods only queue the command;
+    the command queue's writer thread encodes and sends it, so callers never
+    block on the socket. Pending RC overrides and mount commands are
+    coalesced to the newest one, and servo (deploy) commands go first.
+    """
 
-    def __init__(self, state, ip, port):
+    def __init__(self, connection, rcOverrideMaxRateHz=25.0, rcOverrideKeepaliveHz=2.0,
+                 mountMaxRateHz=25.0, mountKeepaliveHz=1.0, gimbal=None):
         self.lockSend = threading.Lock()
-        connection_string_ = f"udp:{ip}:{port}"
-        self.state_ = state
+        self.connection_ = connection
         self.logger = logging.getLogger("MavLink Writer Interface")
-        self.logger.info("Initializing MAVLink connection...")
-        self.master_ = mavutil.mavlink_connection(connection_string_)
-        self.current_pitch_ = 0.0  # Current pitch angle in degrees.
-        self.current_yaw_ = 0.0  # Current yaw angle in degrees.
-        self.max_rate_pitch_ = 10.0
-        self.max_rate_yaw_ = 10.0
+        self.packetLogger_ = PacketLogger("MavLink Writer Interface")
+        # Mount angle setpoint in degrees; a full stick moves it at the axis' maxRate.
+        self.gimbal_ = gimbal or GimbalController(AxisLimits(-90.0, 90.0, 10.0, float("inf")),
+                                                  AxisLimits(-180.0, 180.0, 10.0, float("inf")))
+        self.lastDeploy_ = None
+        self.queue_ = CommandQueue("MavLink Command Queue", {
+            # The autopilot drops RC overrides it has not heard again within
+            # RC_OVERRIDE_TIME (3 s by default), so unchanged ones are still repeated.
+            "rc_override": CommandKind(rcOverrideMaxRateHz, rcOverrideKeepaliveHz),
+            "mount": CommandKind(mountMaxRateHz, mountKeepaliveHz),
+            "servo": CommandKind(suppressRepeats=False),
+        })
+        metrics = GetMetrics("MavLink Writer Interface")
+        self.commandsSent_ = metrics.Counter("commands_sent")
+        self.sendTime_ = metrics.Histogram("send_time")
 
-    def set_gimbal_speed(self, joystick_azimuth, joystick_elevation,dt):
-        with self.lockSend:
+    def Stop(self):
+        self.queue_.Stop()
 
-            delta_pitch = joystick_elevation * self.max_rate_pitch_ * dt
-            delta_yaw = joystick_azimuth * self.max_rate_yaw_ * dt
-            mount_mode = 2
+    def SetRates(self, rcOverrideMaxRateHz, rcOverrideKeepaliveHz, mountMaxRateHz, mountKeepaliveHz):
+        self.queue_.kinds_["rc_override"].SetRates(rcOverrideMaxRateHz, rcOverrideKeepaliveHz)
+        self.queue_.kinds_["mount"].SetRates(mountMaxRateHz, mountKeepaliveHz)
 
-            self.current_pitch_ += delta_pitch
-            self.current_yaw_ += delta_yaw
+    def Target(self):
+        return self.connection_.Target()
 
+    def set_gimbal_speed(self, joystick_azimuth, joystick_elevation,dt):
+        """Move the mount by dt seconds (measured by the caller) of stick deflection."""
+        with self.lockSend:
+            limits = self.gimbal_.limits_
+            angles = self.gimbal_.Step(joystick_elevation * limits[PITCH].maxRate,
+                                       joystick_azimuth * limits[YAW].maxRate, dt)
+        # Mount control carries absolute angles, so only the newest one matters.
+        self.queue_.Submit(("mount",) + self.Target(), "mount", angles,
+                           self.TransmitMountControl, PRIORITY_STREAM)
 
-            self.master_.mav.command_long_send(
-                self.master_.target_system,  # target_system
-                self.master_.target_component,  # target_component
-                mavutil.mavlink.MAV_CMD_DO_MOUNT_CONTROL,  # command
-                0,  # confirmation
-                self.current_pitch_,  # param1: pitch angle in degrees
-                0,  # param2: roll angle (set to 0)
-                self.current_yaw_,  # param3: yaw angle in degrees
-                0, 0, 0,  # param4, param5, param6 (unused)
-                mount_mode  # param7: mount mode (typically 2)
-            )
+    def GimbalMoving(self):
+        return self.gimbal_.Moving()
 
     def SendRCChannelPWM(self, deploy1, deploy2, camera, pitch, yaw):
-        with self.lockSend:
-            self.master_.mav.rc_channels_override_send(
-                self.master_.target_system,
-                self.master_.target_component,
-                0, 0, 0, 0, 0,
-                deploy1, deploy2, 0, pitch, 0, yaw, camera, 0, 0, 0, 0
-            )
-            self.logger.info( f"Sent MAVLink PWM: deploy1={deploy1}, deploy2={deploy2}, camera={camera}, pitch={pitch}, yaw={yaw}")
-    
-    def HandleVfrHud(self, msg):
-        with self.lockSend:
-            self.state_.telemetry_.groundspeed_ = msg.groundspeed
-            self.state_.telemetry_.altitude_ = msg.alt
-            self.state_.telemetry_.heading_ = msg.heading
-            self.logger.info( f"Received MAVLink VFR_HUD: Altitude={msg.alt}, Heading={msg.heading}")
+        deploy = (deploy1, deploy2)
+        priority = PRIORITY_COMMAND
+        if deploy != self.lastDeploy_:
+            # A change on the deploy channels must not wait behind the rate cap.
+            priority = PRIORITY_CRITICAL
+            self.lastDeploy_ = deploy
+        self.queue_.Submit(("rc_override",) + self.Target(), "rc_override",
+                           (deploy1, deploy2, camera, pitch, yaw), self.TransmitRCChannelPWM, priority)
 
-    
     def SetServoValue(self, channel, value):
-        with self.lockSend:
-            self.master_.mav.command_long_send(
-                self.master_.target_system,
-                self.master_.target_component,
-                mavutil.mavlink.MAV_CMD_DO_SET_SERVO, 0,
-                channel, value, 0, 0, 0, 0, 0
-            )
-            self.logger.info( f"Sent MAVLink SET SERVO: channel={channel}, value={value}")
+        self.queue_.Submit(("servo", channel) + self.Target(), "servo", (channel, value),
+                           self.TransmitServoValue, PRIORITY_CRITICAL)
+
+    def TransmitMountControl(self, pitch, yaw):
+        start = time.perf_counter()
+        mount_mode = 2
+        target_system, target_component = self.Target()
+        self.connection_.Send(self.connection_.Mav().command_long_encode(
+            target_system,  # target_system
+            target_component,  # target_component
+            mavutil.mavlink.MAV_CMD_DO_MOUNT_CONTROL,  # command
+            0,  # confirmation
+            pitch,  # param1: pitch angle in degrees
+            0,  # param2: roll angle (set to 0)
+            yaw,  # param3: yaw angle in degrees
+            0, 0, 0,  # param4, param5, param6 (unused)
+            mount_mode  # param7: mount mode (typically 2)
+        ))
+        self.commandsSent_.Add()
+        self.sendTime_.Record(time.perf_counter() - start)
+
+    def TransmitRCChannelPWM(self, deploy1, deploy2, camera, pitch, yaw):
+        start = time.perf_counter()
+        target_system, target_component = self.Target()
+        self.connection_.Send(self.connection_.Mav().rc_channels_override_encode(
+            target_system,
+            target_component,
+            0, 0, 0, 0, 0,
+            deploy1, deploy2, 0, pitch, 0, yaw, camera, 0, 0, 0, 0
+        ))
+        self.commandsSent_.Add()
+        self.sendTime_.Record(time.perf_counter() - start)
+        if self.packetLogger_.isEnabledFor(logging.DEBUG):
+            self.packetLogger_.debug(f"Sent MAVLink PWM: deploy1={deploy1}, deploy2={deploy2}, camera={camera}, pitch={pitch}, yaw={yaw}")
 
+    def TransmitServoValue(self, channel, value):
+        start = time.perf_counter()
+        target_system, target_component = self.Target()
+        self.connection_.Send(self.connection_.Mav().command_long_encode(
+            target_system,
+            target_component,
+            mavutil.mavlink.MAV_CMD_DO_SET_SERVO, 0,
+            channel, value, 0, 0, 0, 0, 0
+        ))
+        self.commandsSent_.Add()
+        self.sendTime_.Record(time.perf_counter() - start)
+        if self.packetLogger_.isEnabledFor(logging.DEBUG):
+            self.packetLogger_.debug(f"Sent MAVLink SET SERVO: channel={channel}, value={value}")
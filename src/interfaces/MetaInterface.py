@@ -1,41 +1,106 @@
-import struct
 import logging
 from interfaces.UDPChannel import UDPChannel
+from interfaces.PacketFormats import META_PACKET
+from core.TelemetryPublisher import TelemetryPublisher
+from core.SubscriberRegistry import SubscriberRegistry
+from core.Metrics import GetMetrics
+from core.LoopSupervisor import GetHeartbeat
+
+# Change thresholds for the fields of the Meta packet, in packing order.
+META_THRESHOLDS = (
+    0,        # id
+    0.01,     # roll (rad)
+    0.01,     # pitch (rad)
+    1,        # heading (deg)
+    1e-6,     # latitude (deg)
+    1e-6,     # longitude (deg)
+    0.1,      # altitude (m)
+    0.1,      # groundspeed (m/s)
+    0.1,      # vertical speed (m/s)
+    0.05,     # battery voltage (V)
+    0,        # deploy12
+    0,        # deploy34
+    0,        # safety
+    0,        # camera
+)
 
 class MetaInterface:
     """
     Manages communication with a Meta device via UDP.
+
+    Each Meta packet is packed once and sent to every destination in
+    subscribers_, which by default only holds udpIpMeta:portSendMeta.
     """
-    def __init__(self, udpIpMeta, udpIpRec, portSendMeta, portRecMeta):
+    def __init__(self, udpIpMeta, udpIpRec, portSendMeta, portRecMeta, maxRateHz=20.0, keepaliveHz=1.0,
+                 predictor=None, subscribers=None):
         self.logger = logging.getLogger("Meta Interface")
         self.senderChannel_ = UDPChannel(udpIpRec, portSendMeta, isReceiver=False)
         self.receiverChannel_ = UDPChannel(udpIpRec, portRecMeta, isReceiver=True)
-        self.udpIpMeta_ = udpIpMeta
-        self.portSendMeta_ = portSendMeta
+        self.packet_ = bytearray(META_PACKET.size)
+        self.publisher_ = TelemetryPublisher("Meta Publisher", maxRateHz, keepaliveHz, META_THRESHOLDS)
+        if subscribers is None:
+            subscribers = SubscriberRegistry("Meta", ((udpIpMeta, portSendMeta),))
+        self.subscribers_ = subscribers
+        # A new subscriber gets the current values right away instead of at the next change or keepalive.
+        subscribers.AddListener(self.publisher_.Resend)
+        # Optional TelemetryPredictor: send extrapolated instead of last received telemetry.
+        self.predictor_ = predictor
+        metrics = GetMetrics("Meta Interface")
+        metrics.Gauges("send_channel", self.senderChannel_.Stats)
+        metrics.Gauges("receive_channel", self.receiverChannel_.Stats)
+        self.receiveErrors_ = metrics.Counter("receive_errors")
+
+    def Stop(self):
+        self.publisher_.Stop()
 
     def ReceiveFromMeta(self):
         self.logger.info("Meta interface started.")
+        handler = lambda data, address: self.HandleMetaPacket(data)
+        heartbeat = GetHeartbeat("Meta Receiver")
         while True:
+            heartbeat.Beat()
             try:
-                data, address = self.receiverChannel_.Receive(1024)
+                self.receiverChannel_.ReceiveBatch(handler)
             except Exception as e:
+                self.receiveErrors_.Add()
                 self.logger.error(f"Meta receive error: {e}")
-    
-    def GCSToMeta(self, state):
-        while True:
-            coordStruct = struct.pack('ifffffffffiiii',
-                                       state.id_,
-                                       state.telemetry_.roll_,
-                                       state.telemetry_.pitch_,
-                                       state.telemetry_.heading_,
-                                       state.telemetry_.latitude_,
-                                       state.telemetry_.longitude_,
-                                       state.telemetry_.altitude_,
-                                       state.telemetry_.groundspeed_,
-                                       state.telemetry_.verticalSpeed_,
-                                       state.battery_.voltageValue_,
-                                       state.rc_channels_.deploy12Value_,
-                                       state.rc_channels_.deploy34Value_,
-                                       state.rc_channels_.safetyValue_,
-                                       state.rc_channels_.cameraValue_)
-            self.senderChannel_.Send(coordStruct, self.udpIpMeta_, self.portSendMeta_)
\ No newline at end of file
+
+    def HandleMetaPacket(self, data):
+        # Inbound Meta traffic is not interpreted yet.
+        pass
+
+    def BuildMetaValues(self, state):
+        telemetry = state.telemetry_.Snapshot() if self.predictor_ is None else self.predictor_.Telemetry(state)
+        battery = state.battery_.Snapshot()
+        rc = state.rc_channels_.Snapshot()
+        return (state.id_,
+                telemetry.roll_,
+                telemetry.pitch_,
+                telemetry.heading_,
+                telemetry.latitude_,
+                telemetry.longitude_,
+                telemetry.altitude_,
+                telemetry.groundspeed_,
+                telemetry.verticalSpeed_,
+                battery.voltageValue_,
+                rc.deploy12Value_,
+                rc.deploy34Value_,
+                rc.safetyValue_,
+                rc.cameraValue_)
+
+    def SendMetaValues(self, values):
+        META_PACKET.pack_into(self.packet_, 0, *values)
+        self.senderChannel_.SendAll(self.packet_, self.subscribers_.Destinations())
+
+    def PublishTick(self, state, fleet=None):
+        # In fleet mode every vehicle goes to the same Meta link; the id field tells them apart.
+        for vehicle in (fleet.States() if fleet is not None else (state,)):
+            self.publisher_.Offer(self.BuildMetaValues(vehicle), self.SendMetaValues, vehicle.id_)
+
+    def GCSToMeta(self, state, fleet=None):
+        self.logger.info("Meta publisher started.")
+        self.publisher_.Run(lambda: self.PublishTick(state, fleet))
+
+    async def GCSToMetaAsync(self, state, fleet=None):
+        self.logger.info("Meta publisher task started.")
+        await self.publisher_.RunAsync(lambda: self.PublishTick(state, fleet))
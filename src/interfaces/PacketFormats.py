@@ -0,0 +1,20 @@
+"""
+Module: PacketFormats.py
+Description: Precompiled struct layouts for every UDP packet the interfaces send or receive.
+"""
+import struct
+
+# Inbound
+TOUCH_PACKET = struct.Struct('=iiiiiii')
+JOYSTICK_PACKET = struct.Struct('ffff')
+TEMPERATURE_PACKET = struct.Struct('=f')
+
+# Outbound
+META_PACKET = struct.Struct('ifffffffffiiii')
+VIDEOAPP_PACKET = struct.Struct('ffiff')
+
+def unpack_exact(layout, data):
+    """Unpack data (bytes or memoryview) that must be exactly one layout record."""
+    if len(data) != layout.size:
+        raise struct.error(f"expected {layout.size} bytes, got {len(data)}")
+    return layout.unpack_from(data)
@@ -1,38 +1,94 @@
-import struct
+import time
 import logging
 from interfaces.UDPChannel import UDPChannel
+from interfaces.LatestValueMailbox import LatestValueMailbox
+from interfaces.PacketFormats import JOYSTICK_PACKET, TEMPERATURE_PACKET, unpack_exact
+from core.LogPipeline import PacketLogger
+from core.Metrics import GetMetrics
+from core.LoopSupervisor import GetHeartbeat
 
 class RaspiInterface:
 
-    def __init__(self, udpIpRec, portRecJoystick, portRecTemperature, exponentialFactor):
+    def __init__(self, udpIpRec, portRecJoystick, portRecTemperature, exponentialFactor,
+                 latestValueMode=True, maxInputAge=0.2):
         self.logger = logging.getLogger("Rasberry Interface")
+        self.packetLogger_ = PacketLogger("Rasberry Interface")
         self.joystickChannel_ = UDPChannel(udpIpRec, portRecJoystick, isReceiver=True)
         self.tempChannel_ = UDPChannel(udpIpRec, portRecTemperature, isReceiver=True)
         self.message_queue = None
         self.joystickMessageCount_ = 0
         self.temperatureMessageCount_ = 0
         self.exponential_factor_ = exponentialFactor
+        self.latestValueMode_ = latestValueMode
+        self.joystickMailbox_ = LatestValueMailbox(maxInputAge)
+        metrics = GetMetrics("Rasberry Interface")
+        metrics.Gauges("joystick_channel", self.joystickChannel_.Stats)
+        metrics.Gauges("temperature_channel", self.tempChannel_.Stats)
+        metrics.Gauges("joystick_mailbox", self.joystickMailbox_.Stats)
+        metrics.Gauge("joystick_messages", lambda: self.joystickMessageCount_)
+        metrics.Gauge("temperature_messages", lambda: self.temperatureMessageCount_)
+        self.receiveErrors_ = metrics.Counter("receive_errors")
+        self.joystickLatency_ = metrics.Histogram("joystick_latency")
 
     def ReceiveJoystick(self, state):
+        if self.latestValueMode_:
+            # Drain the socket, then act only on the newest fresh packet.
+            # The joystick packet has no sequence field, so only arrival order counts.
+            channel = self.joystickChannel_
+            handler = lambda data, address: self.joystickMailbox_.Offer(unpack_exact(JOYSTICK_PACKET, data), None, channel.lastRxTime_)
+        else:
+            handler = lambda data, address: self.ApplyJoystick(state, unpack_exact(JOYSTICK_PACKET, data))
+        heartbeat = GetHeartbeat("Raspberry Joystick Receiver")
         while True:
+            heartbeat.Beat()
             try:
-                data, address = self.joystickChannel_.Receive(1024)
-                rawX, rawY, rawZ, rawButton = struct.unpack('ffff', data)
-                state.joystick_.joystickX_ = rawX
-                state.joystick_.joystickY_ = rawY
-                state.joystick_.joystickZ_ = rawZ
-                state.joystick_.joystickButton_ = rawButton
-                self.joystickMessageCount_ += 1
-                self.logger.info( f"Reveived JOYSTICK: {data}")
+                self.joystickChannel_.ReceiveBatch(handler)
+                if self.latestValueMode_:
+                    self.ApplyLatestJoystick(state)
             except Exception as e:
+                self.receiveErrors_.Add()
                 self.logger.error(f"Raspberry interface joystick error: {e}")
 
+    def HandleJoystickPacket(self, state, data):
+        if self.latestValueMode_:
+            self.joystickMailbox_.Offer(unpack_exact(JOYSTICK_PACKET, data), None, time.time())
+            self.ApplyLatestJoystick(state)
+        else:
+            self.ApplyJoystick(state, unpack_exact(JOYSTICK_PACKET, data))
+
+    def ApplyLatestJoystick(self, state):
+        rxTime = self.joystickMailbox_.pendingRxTime_
+        values = self.joystickMailbox_.Take()
+        if values is not None:
+            self.ApplyJoystick(state, values)
+            self.joystickLatency_.Record(time.time() - rxTime)
+
+    def ApplyJoystick(self, state, values):
+        rawX, rawY, rawZ, rawButton = values
+        with state.joystick_.WriteSection() as joystick:
+            joystick.joystickX_ = rawX
+            joystick.joystickY_ = rawY
+            joystick.joystickZ_ = rawZ
+            joystick.joystickButton_ = rawButton
+        self.joystickMessageCount_ += 1
+        if self.packetLogger_.isEnabledFor(logging.DEBUG):
+            self.packetLogger_.debug(f"Received JOYSTICK: x={rawX}, y={rawY}, z={rawZ}, button={rawButton}")
+
     def ReceiveTemperature(self, state):
+        handler = lambda data, address: self.HandleTemperaturePacket(state, data)
+        heartbeat = GetHeartbeat("Raspberry Temperature Receiver")
         while True:
+            heartbeat.Beat()
             try:
-                data, address = self.tempChannel_.Receive(1024)
-                state.joystick_.temperature_ = struct.unpack('=f', data)[0]
-                self.temperatureMessageCount_ += 1
-                self.logger.info( f"Received TEMP: {data}")
+                self.tempChannel_.ReceiveBatch(handler)
             except Exception as e:
-                self.logger.error(f"Raspi temperature error: {e}")
\ No newline at end of file
+                self.receiveErrors_.Add()
+                self.logger.error(f"Raspi temperature error: {e}")
+
+    def HandleTemperaturePacket(self, state, data):
+        temperature = unpack_exact(TEMPERATURE_PACKET, data)[0]
+        with state.joystick_.WriteSection() as joystick:
+            joystick.temperature_ = temperature
+        self.temperatureMessageCount_ += 1
+        if self.packetLogger_.isEnabledFor(logging.DEBUG):
+            self.packetLogger_.debug(f"Received TEMP: {temperature}")
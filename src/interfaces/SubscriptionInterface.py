@@ -0,0 +1,70 @@
+"""
+Module: SubscriptionInterface.py
+Description: UDP endpoint where consumers subscribe to the outbound packet streams.
+
+A consumer sends one ASCII datagram to the subscribe port:
+
+    SUBSCRIBE <stream> <token>
+    UNSUBSCRIBE <stream> <token>
+
+where <stream> is a key of the registries dict (e.g. meta, videoapp) and
+<token> is the rest of the datagram, which must equal the configured
+<Token>. Packets go to the datagram's source address, so a consumer
+subscribes from the socket it receives on. An accepted request is answered
+at that address with "OK <stream> <lease seconds>" or "FULL <stream>";
+malformed or unauthenticated requests are counted and get no answer, so
+without the token nothing can be made to send traffic anywhere. A
+subscription lasts for the lease, so consumers resend SUBSCRIBE well
+within it to stay subscribed.
+"""
+import hmac
+import logging
+from interfaces.UDPChannel import UDPChannel
+from core.Metrics import GetMetrics
+from core.LoopSupervisor import GetHeartbeat
+
+class SubscriptionInterface:
+    def __init__(self, udpIpRec, portSubscribe, registries, token):
+        self.logger = logging.getLogger("Subscription Interface")
+        self.channel_ = UDPChannel(udpIpRec, portSubscribe, isReceiver=True)
+        self.registries_ = registries
+        self.token_ = token.encode()
+        metrics = GetMetrics("Subscription Interface")
+        metrics.Gauges("channel", self.channel_.Stats)
+        self.receiveErrors_ = metrics.Counter("receive_errors")
+        self.rejected_ = metrics.Counter("rejected_requests")
+
+    def ReceiveSubscriptions(self):
+        self.logger.info(f"Accepting subscriptions on port {self.channel_.port_}.")
+        heartbeat = GetHeartbeat("Subscription Receiver")
+        while True:
+            heartbeat.Beat()
+            try:
+                self.channel_.ReceiveBatch(self.HandleSubscribePacket)
+            except Exception as e:
+                self.receiveErrors_.Add()
+                self.logger.error(f"Subscription receive error: {e}")
+
+    def HandleSubscribePacket(self, data, address):
+        answer = self.Answer(bytes(data), address)
+        if answer is None:
+            self.rejected_.Add()
+            return
+        self.channel_.Send(answer.encode("ascii"), *address)
+
+    def Answer(self, data, address):
+        """Answer to a request, or None if it is malformed or does not carry the token."""
+        fields = data.strip().split(None, 2)
+        if len(fields) != 3 or not hmac.compare_digest(fields[2], self.token_):
+            return None
+        command = fields[0].upper()
+        registry = self.registries_.get(fields[1].lower().decode("ascii", "replace"))
+        if registry is None or command not in (b"SUBSCRIBE", b"UNSUBSCRIBE"):
+            return None
+        stream = registry.name_.lower()
+        if command == b"UNSUBSCRIBE":
+            registry.Unsubscribe(address)
+            return f"OK {stream} 0"
+        if not registry.Subscribe(address):
+            return f"FULL {stream}"
+        return f"OK {stream} {registry.timeout_:g}"
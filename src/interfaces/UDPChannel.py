@@ -1,17 +1,159 @@
+import sys
 import socket
+import struct
+import time
+
+# Non-blocking receive flag, where the platform has one (not on Windows).
+MSG_DONTWAIT = getattr(socket, "MSG_DONTWAIT", 0)
+# Kernel receive timestamps, where the platform has them. The socket module
+# does not export the option, so use the Linux asm-generic value (x86, ARM).
+SO_TIMESTAMPNS = getattr(socket, "SO_TIMESTAMPNS", 35 if sys.platform.startswith("linux") else None)
+TIMESPEC_LAYOUTS = {16: struct.Struct("@qq"), 8: struct.Struct("@ii")}
 
 class UDPChannel:
 
-    def __init__(self, ip, port, isReceiver=True):
+    def __init__(self, ip, port, isReceiver=True, bufferSize=1024):
         self.ip_ = ip
         self.port_ = port
-        self.socket_ = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-        if isReceiver:
-            self.socket_.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-            self.socket_.bind((ip, port))
-    
+        self.isReceiver_ = isReceiver
+        self.kernelTimestamps_ = isReceiver and SO_TIMESTAMPNS is not None and hasattr(socket.socket, "recvmsg_into")
+        self.socket_ = self.OpenSocket(ip, port)
+        # Receive buffer reused for every datagram by ReceiveInto/ReceiveBatch.
+        self.buffer_ = bytearray(bufferSize)
+        self.view_ = memoryview(self.buffer_)
+        self.buffers_ = [self.buffer_]
+        self.ancillarySize_ = socket.CMSG_SPACE(16) if self.kernelTimestamps_ else 0
+        # Wall-clock time the last datagram reached the host.
+        self.lastRxTime_ = 0.0
+        self.recorder_ = None
+        self.recordChannel_ = 0
+        self.rxPacketCount_ = 0
+        self.rxByteCount_ = 0
+        self.txPacketCount_ = 0
+        self.txByteCount_ = 0
+        self.txErrorCount_ = 0
+
+    def OpenSocket(self, ip, port):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        if self.isReceiver_:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            sock.bind((ip, port))
+            if self.kernelTimestamps_:
+                sock.setsockopt(socket.SOL_SOCKET, SO_TIMESTAMPNS, 1)
+        return sock
+
+    def Rebind(self, ip, port):
+        """
+        Move a receiving channel to another address. The new socket is bound
+        before the old one is closed, so a bind error leaves the channel as it
+        was; a thread blocked on the old socket wakes up and continues on the new one.
+        """
+        sock = self.OpenSocket(ip, port)
+        old = self.socket_
+        self.socket_ = sock
+        self.ip_ = ip
+        self.port_ = port
+        try:
+            old.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        old.close()
+
+    def AttachRecorder(self, recorder, channel):
+        """Copy every received datagram into recorder under the given channel id."""
+        self.recordChannel_ = channel
+        self.recorder_ = recorder
+
     def Send(self, data, targetIp, targetPort):
         self.socket_.sendto(data, (targetIp, targetPort))
-    
+        self.txPacketCount_ += 1
+        self.txByteCount_ += len(data)
+
+    def SendAll(self, data, addresses):
+        """
+        Send the same datagram to every (ip, port) in addresses. A failed send
+        is counted and skipped so one bad destination does not starve the rest.
+        Returns the number of datagrams sent.
+        """
+        sendto = self.socket_.sendto
+        sent = 0
+        for address in addresses:
+            try:
+                sendto(data, address)
+                sent += 1
+            except OSError:
+                self.txErrorCount_ += 1
+        self.txPacketCount_ += sent
+        self.txByteCount_ += sent * len(data)
+        return sent
+
     def Receive(self, bufsize=1024):
-        return self.socket_.recvfrom(bufsize)
\ No newline at end of file
+        return self.socket_.recvfrom(bufsize)
+
+    def ReadOne(self, flags=0):
+        """Read one datagram into the channel buffer and set lastRxTime_."""
+        while True:
+            sock = self.socket_
+            try:
+                if self.kernelTimestamps_:
+                    nbytes, ancdata, msgFlags, address = sock.recvmsg_into(self.buffers_, self.ancillarySize_, flags)
+                else:
+                    nbytes, address = sock.recvfrom_into(self.buffer_, 0, flags)
+            except OSError:
+                if sock is self.socket_:
+                    raise
+                continue  # Rebind() closed the socket under us
+            if sock is self.socket_:
+                break
+        self.lastRxTime_ = self.AncillaryTime(ancdata) if self.kernelTimestamps_ else time.time()
+        self.rxPacketCount_ += 1
+        self.rxByteCount_ += nbytes
+        if self.recorder_ is not None:
+            self.recorder_.Record(self.recordChannel_, self.view_[:nbytes])
+        return nbytes, address
+
+    def Stats(self):
+        return {"rxPackets": self.rxPacketCount_, "rxBytes": self.rxByteCount_,
+                "txPackets": self.txPacketCount_, "txBytes": self.txByteCount_,
+                "txErrors": self.txErrorCount_}
+
+    def AncillaryTime(self, ancdata):
+        for level, kind, data in ancdata:
+            if level == socket.SOL_SOCKET and kind == SO_TIMESTAMPNS:
+                layout = TIMESPEC_LAYOUTS.get(len(data))
+                if layout is not None:
+                    seconds, nanoseconds = layout.unpack(data)
+                    return seconds + nanoseconds * 1e-9
+        return time.time()
+
+    def ReceiveInto(self):
+        """
+        Block for one datagram and read it into the channel buffer.
+        Returns (view, address); view is only valid until the next receive.
+        """
+        nbytes, address = self.ReadOne()
+        return self.view_[:nbytes], address
+
+    def ReceiveBatch(self, handler, maxPackets=64):
+        """
+        Block for one datagram, then drain whatever else is already queued
+        without blocking, calling handler(view, address) for each in arrival
+        order. Returns the number of datagrams handled.
+        """
+        nbytes, address = self.ReadOne()
+        handler(self.view_[:nbytes], address)
+        count = 1
+        if not MSG_DONTWAIT:
+            self.socket_.setblocking(False)
+        try:
+            while count < maxPackets:
+                try:
+                    nbytes, address = self.ReadOne(MSG_DONTWAIT)
+                except BlockingIOError:
+                    break
+                handler(self.view_[:nbytes], address)
+                count += 1
+        finally:
+            if not MSG_DONTWAIT:
+                self.socket_.setblocking(True)
+        return count
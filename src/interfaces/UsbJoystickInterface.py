@@ -1,20 +1,89 @@
-import pygame
 import logging
+import math
 import time
+import numpy as np
+from core.Metrics import GetMetrics
+from core.LoopSupervisor import GetHeartbeat
+from core.PeriodicScheduler import PeriodicScheduler
 
+# Imported by Run(), so setups without a USB joystick never load pygame.
+pygame = None
 
+def ImportPygame():
+    global pygame
+    if pygame is None:
+        import pygame as module
+        pygame = module
+    return pygame
 
+# Samples of the deadzone/exponential curve over [-1, 1]; pygame axes are 16 bit,
+# so this keeps the shaping error below 0.05 % of full stick.
+SHAPING_TABLE_SIZE = 4097
+# Smoothed values this close to a centred stick are treated as centred.
+SETTLE_THRESHOLD = 1e-3
+# How long the event loop sleeps when the stick is centred and nothing happens.
+IDLE_WAIT = 0.1
+
+def BuildShapingTable(deadZone, exponent, size=SHAPING_TABLE_SIZE):
+    """Deadzone plus sign-preserving power curve, sampled over [-1, 1]."""
+    x = np.linspace(-1.0, 1.0, size)
+    shaped = np.where(np.abs(x) < deadZone, 0.0, np.sign(x) * np.abs(x) ** exponent)
+    return shaped.tolist()  # list indexing is much faster than NumPy scalar access
 
 class USBJoystickInterface:
-    def __init__(self, state, exponential_factor,dead_zone,mavlinWriter):
+    """
+    Drives the gimbal from a USB joystick.
+
+    In "events" mode the loop sleeps in pygame.event.wait() and reacts to
+    axis and button events as they arrive; in "poll" mode it reads the two
+    gimbal axes at pollRateHz. Either way, raw axis values are shaped through
+    a precomputed table, optionally low-pass filtered with time constant
+    smoothingTime, and while the stick is deflected the gimbal rate command
+    is integrated and sent at up to sendRateHz using the measured time
+    since the previous command.
+    """
+    def __init__(self, state, exponential_factor,dead_zone,mavlinWriter,
+                 mode="events", pollRateHz=500.0, sendRateHz=100.0, smoothingTime=0.0):
         self.logger = logging.getLogger("USB Joystick Interface")
         self.mavlinkWriter = mavlinWriter
         self.state = state
         self.exponential_factor = exponential_factor
         self.deadzone = dead_zone
+        self.running_ = True
+        if mode not in ("events", "poll"):
+            raise ValueError(f"Unknown USB joystick mode '{mode}'")
+        self.mode_ = mode
+        self.pollScheduler_ = PeriodicScheduler("USB Joystick Poller", pollRateHz)
+        self.sendPeriod_ = 1.0 / sendRateHz
+        self.smoothingTime_ = smoothingTime
+        self.table_ = BuildShapingTable(dead_zone, exponential_factor)
+        self.tableScale_ = (len(self.table_) - 1) / 2.0
+
+        self.rawAxes_ = [0.0, 0.0]       # azimuth, elevation as read
+        self.axes_ = [0.0, 0.0]          # after shaping and smoothing
+        self.buttons_ = {}
+        self.lastUpdate_ = None
+        self.integrateFrom_ = None       # start of the interval not yet sent; None while centred and at rest
+
+        metrics = GetMetrics("USB Joystick Interface")
+        self.pollCount_ = metrics.Counter("polls")
+        self.pollErrors_ = metrics.Counter("poll_errors")
+        self.eventCount_ = metrics.Counter("events")
+        self.commandCount_ = metrics.Counter("commands")
+        self.pollTime_ = metrics.Histogram("poll_time")
+
+    def Stop(self):
+        self.running_ = False
+        self.pollScheduler_.Stop()
+
+    def SetShaping(self, exponential_factor, dead_zone):
+        """Swap in a new shaping table; the loop picks it up on its next update."""
+        self.exponential_factor = exponential_factor
+        self.deadzone = dead_zone
+        self.table_ = BuildShapingTable(dead_zone, exponential_factor)
 
     def Run(self):
-        delta_time = 0.05
+        ImportPygame()
         pygame.init()
         pygame.joystick.init()
 
@@ -24,25 +93,107 @@ class USBJoystickInterface:
 
         joystick = pygame.joystick.Joystick(0)
         joystick.init()
+        self.logger.info(f"USB joystick '{joystick.get_name()}' running in {self.mode_} mode.")
 
-        num_axes = joystick.get_numaxes()
-        num_buttons = joystick.get_numbuttons()
+        if self.mode_ == "events":
+            self.RunEvents(joystick)
+        else:
+            self.pollScheduler_.Run(lambda dt: self.PollStep(joystick))
 
-
-        while True:
+    def RunEvents(self, joystick):
+        pygame.event.set_blocked(None)
+        pygame.event.set_allowed([pygame.JOYAXISMOTION, pygame.JOYBUTTONDOWN, pygame.JOYBUTTONUP])
+        instanceId = joystick.get_instance_id()
+        heartbeat = GetHeartbeat("USB Joystick Events", IDLE_WAIT)
+        while self.running_:
+            heartbeat.Beat()
+            # While deflected, wake up in time for the next command.
+            if self.integrateFrom_ is None:
+                timeout = IDLE_WAIT
+            else:
+                timeout = max(0.0, self.integrateFrom_ + self.sendPeriod_ - time.monotonic())
+            # pygame treats a 0 ms timeout as "wait forever".
+            event = pygame.event.wait(max(1, math.ceil(timeout * 1000)))
+            start = time.perf_counter()
             try:
-                pygame.event.pump()  # Procesa eventos
-                axes =  [self.apply_exponential_curve(joystick.get_axis(i)) for i in range(num_axes)]
-                buttons = [joystick.get_button(i) for i in range(num_buttons)]
-                #self.logger.debug(f"Ejes: {[round(a, 4) for a in axes]}, Botones: {buttons}")
-                self.mavlinkWriter.set_gimbal_speed(axes[0], axes[1],delta_time)
+                while event.type != pygame.NOEVENT:
+                    if getattr(event, "instance_id", instanceId) == instanceId:
+                        self.HandleEvent(event)
+                    event = pygame.event.poll()
+                self.Update(time.monotonic())
             except Exception as e:
+                self.pollErrors_.Add()
                 self.logger.error("Error reading USB joystick: %s", e)
-            time.sleep(delta_time)
+            self.pollCount_.Add()
+            self.pollTime_.Record(time.perf_counter() - start)
+
+    def HandleEvent(self, event):
+        self.eventCount_.Add()
+        if event.type == pygame.JOYAXISMOTION:
+            if event.axis < 2:
+                self.rawAxes_[event.axis] = event.value
+        elif event.type == pygame.JOYBUTTONDOWN:
+            self.buttons_[event.button] = 1
+        elif event.type == pygame.JOYBUTTONUP:
+            self.buttons_[event.button] = 0
+
+    def PollStep(self, joystick):
+        start = time.perf_counter()
+        try:
+            pygame.event.pump()
+            self.rawAxes_[0] = joystick.get_axis(0)
+            self.rawAxes_[1] = joystick.get_axis(1)
+            self.Update(time.monotonic())
+        except Exception as e:
+            self.pollErrors_.Add()
+            self.logger.error("Error reading USB joystick: %s", e)
+        self.pollCount_.Add()
+        self.pollTime_.Record(time.perf_counter() - start)
+
+    def Update(self, now):
+        """Shape and filter the latest axis values, then send a command if one is due."""
+        dt = 0.0 if self.lastUpdate_ is None else now - self.lastUpdate_
+        self.lastUpdate_ = now
+        azimuth = self.apply_exponential_curve(self.rawAxes_[0])
+        elevation = self.apply_exponential_curve(self.rawAxes_[1])
+        if self.smoothingTime_ > 0:
+            alpha = 1.0 - math.exp(-dt / self.smoothingTime_)
+            azimuth = self.Smooth(self.axes_[0], azimuth, alpha)
+            elevation = self.Smooth(self.axes_[1], elevation, alpha)
+
+        previous = self.axes_
+        self.axes_ = [azimuth, elevation]
+        deflected = azimuth != 0.0 or elevation != 0.0
+        if self.integrateFrom_ is None:
+            if deflected:
+                self.integrateFrom_ = now
+            return
+        elapsed = now - self.integrateFrom_
+        if not deflected and (previous[0] != 0.0 or previous[1] != 0.0):
+            # Released: integrate the last interval with the values held during it.
+            self.SendGimbalRate(previous[0], previous[1], elapsed)
+        elif elapsed >= self.sendPeriod_:
+            self.SendGimbalRate(azimuth, elevation, elapsed)
+        else:
+            return
+        # After a release the gimbal may still be decelerating; keep stepping it until it stops.
+        self.integrateFrom_ = now if deflected or self.mavlinkWriter.GimbalMoving() else None
+
+    def Smooth(self, current, target, alpha):
+        value = current + alpha * (target - current)
+        # Settle exactly on zero, so a centred stick stops sending commands.
+        if target == 0.0 and abs(value) < SETTLE_THRESHOLD:
+            return 0.0
+        return value
 
+    def SendGimbalRate(self, azimuth, elevation, dt):
+        self.commandCount_.Add()
+        self.mavlinkWriter.set_gimbal_speed(azimuth, elevation, dt)
 
     def apply_exponential_curve(self, value):
-        if abs(value) < self.deadzone:
-            return 0.0  # Elimina ruido en la zona muerta
-        sign = 1 if value > 0 else -1
-        return sign * (abs(value) ** self.exponential_factor)  # Aplica la curva exponencial manteniendo el signo
\ No newline at end of file
+        index = int((value + 1.0) * self.tableScale_ + 0.5)
+        if index < 0:
+            index = 0
+        elif index >= len(self.table_):
+            index = len(self.table_) - 1
+        return self.table_[index]
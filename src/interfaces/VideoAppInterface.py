@@ -1,23 +1,73 @@
 
-import struct
 from interfaces.UDPChannel import UDPChannel
-import time
+from interfaces.PacketFormats import VIDEOAPP_PACKET
+from core.TelemetryPublisher import TelemetryPublisher
+from core.SubscriberRegistry import SubscriberRegistry
+from core.Metrics import GetMetrics
 import logging
 
+# Change thresholds for the fields of the VideoApp packet, in packing order.
+VIDEOAPP_THRESHOLDS = (
+    0.1,      # altitude (m)
+    1,        # battery remaining (%)
+    0,        # NN toggle
+    0.1,      # vertical acceleration
+    0.5,      # temperature
+)
+
 class VideoAppInterface:
-    def __init__(self, udpIpRec, txPortVideoApp):
+    def __init__(self, udpIpRec, txPortVideoApp, maxRateHz=20.0, keepaliveHz=1.0, fleetPortBase=15500,
+                 predictor=None, subscribers=None):
         self.logger = logging.getLogger("Video Interface")
         self.txChannel_ = UDPChannel(udpIpRec, txPortVideoApp, isReceiver=False)
         self.udpIpRec_ = udpIpRec
-        self.txPortVideoApp_ = txPortVideoApp
-
-    def MissionPlannerToVideoApp(self, state):
-        while True:
-            videoappData = struct.pack('ffiff',
-                                       state.telemetry_.altitude_,
-                                       state.battery_.batteryRemaining_,
-                                       state.control_.nnToggle_,
-                                       state.telemetry_.accelZ_,
-                                       state.joystick_.temperature_)
-            self.txChannel_.Send(videoappData, self.udpIpRec_, self.txPortVideoApp_)
-            time.sleep(0.05)
\ No newline at end of file
+        # The primary vehicle's packet is packed once and sent to every destination in
+        # subscribers_, which by default only holds udpIpRec:txPortVideoApp.
+        if subscribers is None:
+            subscribers = SubscriberRegistry("VideoApp", ((udpIpRec, txPortVideoApp),))
+        self.subscribers_ = subscribers
+        # Fleet mode: vehicle N (other than the primary one) is sent to udpIpRec:fleetPortBase + N.
+        self.fleetPortBase_ = fleetPortBase
+        self.packet_ = bytearray(VIDEOAPP_PACKET.size)
+        self.publisher_ = TelemetryPublisher("VideoApp Publisher", maxRateHz, keepaliveHz, VIDEOAPP_THRESHOLDS)
+        # Optional TelemetryPredictor: send extrapolated instead of last received telemetry.
+        self.predictor_ = predictor
+        subscribers.AddListener(self.publisher_.Resend)
+        GetMetrics("Video Interface").Gauges("send_channel", self.txChannel_.Stats)
+
+    def Stop(self):
+        self.publisher_.Stop()
+
+    def BuildVideoAppValues(self, state):
+        telemetry = state.telemetry_.Snapshot() if self.predictor_ is None else self.predictor_.Telemetry(state)
+        return (telemetry.altitude_,
+                state.battery_.Snapshot().batteryRemaining_,
+                state.control_.Snapshot().nnToggle_,
+                telemetry.accelZ_,
+                state.joystick_.Snapshot().temperature_)
+
+    def SendVideoAppValues(self, values, port=None):
+        VIDEOAPP_PACKET.pack_into(self.packet_, 0, *values)
+        if port is None:
+            self.txChannel_.SendAll(self.packet_, self.subscribers_.Destinations())
+        else:
+            self.txChannel_.Send(self.packet_, self.udpIpRec_, port)
+
+    def PublishTick(self, state, fleet=None):
+        self.publisher_.Offer(self.BuildVideoAppValues(state), self.SendVideoAppValues, state.id_)
+        if fleet is None:
+            return
+        for vehicle in fleet.States():
+            if vehicle is state:
+                continue
+            port = self.fleetPortBase_ + vehicle.id_
+            self.publisher_.Offer(self.BuildVideoAppValues(vehicle),
+                                  lambda values: self.SendVideoAppValues(values, port), vehicle.id_)
+
+    def MissionPlannerToVideoApp(self, state, fleet=None):
+        self.logger.info("VideoApp publisher started.")
+        self.publisher_.Run(lambda: self.PublishTick(state, fleet))
+
+    async def MissionPlannerToVideoAppAsync(self, state, fleet=None):
+        self.logger.info("VideoApp publisher task started.")
+        await self.publisher_.RunAsync(lambda: self.PublishTick(state, fleet))
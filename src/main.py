@@ -1,32 +1,20 @@
-from MissionPlannerIntegrator import MissionPlannerIntegrator
-import logging
-import sys
 import time
+STARTED = time.perf_counter()
 
-# Set up the global logger for Mission Planner
-logger = logging.getLogger("MissionPlanner")
-logger.setLevel(logging.INFO)
-
-# File handler: write logs to "mission_planner.log"
-file_handler = logging.FileHandler("mission_planner.log")
-file_handler.setLevel(logging.INFO)
-file_formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
-file_handler.setFormatter(file_formatter)
-logger.addHandler(file_handler)
-
-# Stream handler: output logs to the console (stdout)
-stream_handler = logging.StreamHandler(sys.stdout)
-stream_handler.setLevel(logging.INFO)
-stream_formatter = logging.Formatter('%(name)s: %(levelname)s %(message)s')
-stream_handler.setFormatter(stream_formatter)
-logger.addHandler(stream_handler)
-
-logger.info("Logger configured: output to console and file 'mission_planner.log'.")
+from core.StartupProfile import StartupProfile
+PROFILE = StartupProfile(STARTED)
+from MissionPlannerIntegrator import MissionPlannerIntegrator
+PROFILE.Mark("imports")
 
+# Logging (file and console handlers, queueing, rate limiting, packet logs) is
+# configured by MissionPlannerIntegrator from the <Logging> section of config.xml.
 
 def Main():
-    mp = MissionPlannerIntegrator()
-    mp.Start()
+    mp = MissionPlannerIntegrator(PROFILE)
+    try:
+        mp.Start()
+    finally:
+        mp.logPipeline_.Stop()
 
 if __name__ == "__main__":
     Main()
\ No newline at end of file
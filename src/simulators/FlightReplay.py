@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+"""
+Flight Journal Replay
+----------------------------------------------------------------------
+Feeds a journal written by core.FlightRecorder back into the Mission Planner
+at 1x, at N-times speed, or as fast as possible (--speed 0).
+
+Targets:
+  udp        Send every frame to the ports in config.xml, so a running
+             planner consumes it exactly as live traffic.
+  inprocess  Decode the frames straight into MavlinkReaderInterface and the
+             UDP interfaces' packet handlers, on a DroneState owned by this
+             process. With --control, the GCS control step also runs on the
+             journal clock and the resulting RC overrides are captured, which
+             makes the run deterministic and suitable for regression tests.
+
+Usage:
+  python src/simulators/FlightReplay.py flight.mpj --speed 4
+  python src/simulators/FlightReplay.py flight.mpj --target inprocess --speed 0 --control --commands-out out.csv
+"""
+
+import os
+import sys
+import csv
+import time
+import socket
+import logging
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pymavlink import mavutil
+from ConfigLoader import ConfigLoader
+from core.FlightRecorder import (ReadJournal, CHANNEL_NAMES, CHANNEL_MAVLINK, CHANNEL_TOUCH,
+                                 CHANNEL_JOYSTICK, CHANNEL_TEMPERATURE, CHANNEL_META)
+
+class CommandCapture:
+    """Stands in for MavlinkWriterInterface and keeps the commands it is asked to send."""
+    def __init__(self):
+        self.now_ = 0.0
+        self.commands_ = []
+
+    def SendRCChannelPWM(self, deploy1, deploy2, camera, pitch, yaw):
+        self.commands_.append((self.now_, deploy1, deploy2, camera, pitch, yaw))
+
+class FlightReplay:
+    def __init__(self, journalPath, speed=1.0):
+        self.logger = logging.getLogger("Flight Replay")
+        self.journalPath_ = journalPath
+        self.speed_ = speed
+        # Journal time of the frame being delivered, for consumers that need a clock.
+        self.now_ = 0.0
+
+    def Run(self, sinks, tickPeriod=None, onTick=None):
+        """
+        Deliver every journal frame to sinks[channel](payload). If onTick is
+        given it is called as onTick(t, dt) every tickPeriod seconds of journal
+        time, interleaved with the frames. Returns frame counts per channel.
+        """
+        counts = {}
+        wallStart = time.monotonic()
+        journalStart = None
+        nextTick = None
+        for timestamp, channel, payload in ReadJournal(self.journalPath_):
+            if journalStart is None:
+                journalStart = timestamp
+                nextTick = timestamp
+            if onTick is not None:
+                while nextTick <= timestamp:
+                    onTick(nextTick - journalStart, tickPeriod)
+                    nextTick += tickPeriod
+            self.now_ = timestamp
+            if self.speed_ > 0:
+                delay = wallStart + (timestamp - journalStart) / self.speed_ - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+            sink = sinks.get(channel)
+            if sink is not None:
+                try:
+                    sink(payload)
+                except Exception as e:
+                    self.logger.error(f"Replay error on {CHANNEL_NAMES.get(channel, channel)} frame: {e}")
+            counts[channel] = counts.get(channel, 0) + 1
+        return counts
+
+def UdpSinks(config):
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    def sendTo(ip, port):
+        return lambda payload: sock.sendto(payload, (ip, port))
+    return {
+        CHANNEL_MAVLINK: sendTo(config.udpIpMavlink_, config.portSendMavlink_),
+        CHANNEL_TOUCH: sendTo(config.udpIpRec_, config.portRecTouch_),
+        CHANNEL_JOYSTICK: sendTo(config.udpIpRec_, config.portRecJoystick_),
+        CHANNEL_TEMPERATURE: sendTo(config.udpIpRec_, config.portRecTemperature_),
+        CHANNEL_META: sendTo(config.udpIpRec_, config.portRecMeta_),
+    }
+
+def InProcessSinks(config, state, replay):
+    from interfaces.MavLinkConnectionManager import MavlinkConnectionManager
+    from interfaces.MavLinkReaderInterface import MavlinkReaderInterface
+    from interfaces.GCSInterface import GCSInterface
+    from interfaces.Raspinterface import RaspiInterface
+
+    connection = MavlinkConnectionManager(None, None)
+    reader = MavlinkReaderInterface(state, connection)
+    reader.clock_ = lambda: replay.now_
+    # Port 0: the interfaces bind throwaway ports and only their handlers are used.
+    gcs = GCSInterface("127.0.0.1", 0, 0, config.controlRateHz_,
+                       config.latestValueMode_, float("inf"), config.touchSequence_)
+    raspi = RaspiInterface("127.0.0.1", 0, 0, config.exponentialFactor_,
+                           config.latestValueMode_, float("inf"))
+    decoder = mavutil.mavlink.MAVLink(None)
+
+    def dispatchMavlink(payload):
+        for msg in decoder.parse_buffer(payload) or ():
+            connection.Dispatch(msg)
+
+    sinks = {
+        CHANNEL_MAVLINK: dispatchMavlink,
+        CHANNEL_TOUCH: lambda payload: gcs.HandleTouchPacket(state, payload),
+        CHANNEL_JOYSTICK: lambda payload: raspi.HandleJoystickPacket(state, payload),
+        CHANNEL_TEMPERATURE: lambda payload: raspi.HandleTemperaturePacket(state, payload),
+    }
+    return sinks, gcs
+
+def Main():
+    parser = argparse.ArgumentParser(description="Replay a Mission Planner flight journal.")
+    parser.add_argument("journal")
+    parser.add_argument("--speed", type=float, default=1.0, help="replay speed factor; 0 = as fast as possible")
+    parser.add_argument("--target", choices=("udp", "inprocess"), default="udp")
+    parser.add_argument("--config", default=os.path.abspath(os.path.join(os.path.dirname(__file__), "../../config.xml")))
+    parser.add_argument("--control", action="store_true", help="inprocess: run the GCS control step on the journal clock")
+    parser.add_argument("--commands-out", help="inprocess --control: write captured RC overrides to this CSV file")
+    args = parser.parse_args()
+
+    config = ConfigLoader(args.config)
+    replay = FlightReplay(args.journal, args.speed)
+    started = time.monotonic()
+
+    if args.target == "udp":
+        counts = replay.Run(UdpSinks(config))
+    else:
+        from state.DroneState import DroneState
+        state = DroneState(config.historyCapacity_)
+        state.id_ = config.id_
+        sinks, gcs = InProcessSinks(config, state, replay)
+        capture = CommandCapture()
+        onTick = None
+        if args.control:
+            def onTick(t, dt):
+                capture.now_ = t
+                gcs.ControlStep(state, capture, dt)
+        counts = replay.Run(sinks, 1.0 / config.controlRateHz_, onTick)
+        logging.info("Final state: %s", state.Snapshot())
+        if args.control:
+            logging.info("Captured %d RC overrides", len(capture.commands_))
+            if args.commands_out:
+                with open(args.commands_out, "w", newline="") as f:
+                    writer = csv.writer(f)
+                    writer.writerow(("t", "deploy1", "deploy2", "camera", "pitch", "yaw"))
+                    writer.writerows(capture.commands_)
+
+    elapsed = time.monotonic() - started
+    summary = ", ".join(f"{CHANNEL_NAMES.get(c, c)}={n}" for c, n in sorted(counts.items()))
+    logging.info("Replayed %s in %.2fs: %s", args.journal, elapsed, summary)
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO,
+                        format="%(asctime)s [%(levelname)s] %(message)s",
+                        datefmt="%Y-%m-%d %H:%M:%S")
+    try:
+        Main()
+    except KeyboardInterrupt:
+        logging.info("Replay interrupted.")
+        sys.exit(0)
@@ -4,56 +4,213 @@ MAVLink Server Emulator using shared configuration (relative imports)
 ----------------------------------------------------------------------
 This script is located in the "src/simulators" folder and uses relative imports
 to load the configuration from the XML file located in the project root.
-It creates a MAVLink connection and sends a heartbeat message every second.
+
+It simulates a fleet of N vehicles whose kinematics are advanced together as
+NumPy arrays, and streams HEARTBEAT, ATTITUDE, VFR_HUD, GLOBAL_POSITION_INT,
+SYS_STATUS and RC_CHANNELS for every vehicle at configurable per-type rates
+to the planner's MAVLink port. It is meant as a load generator: it reports
+what it sent per message type, and every vehicle numbers its frames with the
+normal MAVLink sequence counter, so the planner's loss counters and lag can
+be compared against the report.
+
+Run from the project root:
+    python -m src.simulators.MavlinkServerEmulator --vehicles 20 --rates ATTITUDE=200,GLOBAL_POSITION_INT=100
 """
 
 import time
 import logging
 import sys
 import os
+import socket
+import argparse
+import numpy as np
 from pymavlink import mavutil
 
 # Use relative import to load the configuration manager from the main package.
 from ..ConfigLoader import ConfigLoader
 
+# Messages per second, per vehicle.
+DEFAULT_RATES = {
+    "HEARTBEAT": 1.0,
+    "ATTITUDE": 10.0,
+    "VFR_HUD": 4.0,
+    "GLOBAL_POSITION_INT": 5.0,
+    "SYS_STATUS": 2.0,
+    "RC_CHANNELS": 5.0,
+}
+EARTH_RADIUS = 6378137.0
+
+class FleetKinematics:
+    """Position, attitude and battery of N vehicles, advanced with array math."""
+    def __init__(self, count, baseLat, baseLon, seed=0):
+        rng = np.random.default_rng(seed)
+        self.count_ = count
+        self.lat_ = baseLat + rng.uniform(-0.01, 0.01, count)
+        self.lon_ = baseLon + rng.uniform(-0.01, 0.01, count)
+        self.alt_ = rng.uniform(50.0, 150.0, count)
+        self.heading_ = rng.uniform(0.0, 2 * np.pi, count)
+        self.speed_ = rng.uniform(5.0, 15.0, count)
+        self.turnRate_ = rng.uniform(-0.2, 0.2, count)
+        self.climbPhase_ = rng.uniform(0.0, 2 * np.pi, count)
+        self.climb_ = np.zeros(count)
+        self.roll_ = np.zeros(count)
+        self.pitch_ = np.zeros(count)
+        self.voltage_ = rng.uniform(15.8, 16.8, count)
+        self.time_ = 0.0
+
+    def Step(self, dt):
+        self.time_ += dt
+        self.heading_ = (self.heading_ + self.turnRate_ * dt) % (2 * np.pi)
+        self.climb_ = 2.0 * np.sin(0.1 * self.time_ + self.climbPhase_)
+        north = self.speed_ * np.cos(self.heading_) * dt
+        east = self.speed_ * np.sin(self.heading_) * dt
+        self.lat_ += np.degrees(north / EARTH_RADIUS)
+        self.lon_ += np.degrees(east / (EARTH_RADIUS * np.cos(np.radians(self.lat_))))
+        self.alt_ += self.climb_ * dt
+        self.roll_ = np.arctan(self.speed_ * self.turnRate_ / 9.81)
+        self.pitch_ = np.arctan2(self.climb_, self.speed_)
+        self.voltage_ -= 0.0005 * dt
+
 class MavlinkServerEmulator:
-    def __init__(self):
+    def __init__(self, vehicles=1, rates=None, firstSysid=None, batch=1, seed=0):
         # Compute the absolute path to the configuration file.
         config_path = os.path.abspath(os.path.join(os.path.dirname(__file__), "../../config.xml"))
         logging.debug("Computed config path: %s", config_path)
         # Load the configuration using the shared configuration manager.
         self.config = ConfigLoader(config_path)
-        
-        # Retrieve the MAVLink connection string from the configuration.
-        self.connection_string = self.config.mavlinkConnection_
-        logging.debug("Using MAVLink connection string: %s", self.connection_string)
-        
-        # Create the MAVLink connection using the connection string.
-        self.connection = mavutil.mavlink_connection(self.connection_string)
-    
-    def run(self):
-        # Wait for a heartbeat from a client to ensure the connection is active.
-        logging.debug("Waiting for client heartbeat...")
-        self.connection.wait_heartbeat(timeout=30)
-        logging.debug("Heartbeat received. Starting MAVLink server emulation.")
-        
-        while True:
-            # Send a heartbeat message.
-            self.connection.mav.heartbeat_send(
-                mavutil.mavlink.MAV_TYPE_GCS,         # Emulate a Ground Control Station
-                mavutil.mavlink.MAV_AUTOPILOT_INVALID,  # Indicate an invalid autopilot
-                0, 0, 0
-            )
-            logging.debug("Heartbeat sent.")
-            time.sleep(1)
+
+        # Stream to the port the planner's MAVLink reader listens on.
+        self.destination_ = (self.config.udpIpMavlink_, self.config.portSendMavlink_)
+        logging.debug("Streaming MAVLink to %s:%d", *self.destination_)
+        self.socket_ = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+
+        self.rates_ = dict(DEFAULT_RATES if rates is None else rates)
+        self.batch_ = max(1, batch)
+        firstSysid = self.config.id_ if firstSysid is None else firstSysid
+        self.sysids_ = [(firstSysid + i - 1) % 255 + 1 for i in range(vehicles)]
+        self.encoders_ = [mavutil.mavlink.MAVLink(None, srcSystem=sysid, srcComponent=1)
+                          for sysid in self.sysids_]
+        self.fleet_ = FleetKinematics(vehicles, 40.4168, -3.7038, seed)
+        self.sentCounts_ = {msgType: 0 for msgType in self.rates_}
+        self.bytesSent_ = 0
+        self.pending_ = []
+
+    def Emit(self, frame):
+        self.pending_.append(frame)
+        if len(self.pending_) >= self.batch_:
+            self.Flush()
+
+    def Flush(self):
+        if self.pending_:
+            datagram = b"".join(self.pending_)
+            self.socket_.sendto(datagram, self.destination_)
+            self.bytesSent_ += len(datagram)
+            self.pending_ = []
+
+    def SendRound(self, msgType, bootMs):
+        """Encode and send one msgType message for every vehicle."""
+        fleet = self.fleet_
+        mavlink = mavutil.mavlink
+        if msgType == "HEARTBEAT":
+            for mav in self.encoders_:
+                self.Emit(mav.heartbeat_encode(mavlink.MAV_TYPE_QUADROTOR, mavlink.MAV_AUTOPILOT_ARDUPILOTMEGA,
+                                               mavlink.MAV_MODE_FLAG_CUSTOM_MODE_ENABLED, 0,
+                                               mavlink.MAV_STATE_ACTIVE).pack(mav))
+        elif msgType == "ATTITUDE":
+            rows = zip(fleet.roll_.tolist(), fleet.pitch_.tolist(), fleet.heading_.tolist())
+            for mav, (roll, pitch, yaw) in zip(self.encoders_, rows):
+                self.Emit(mav.attitude_encode(bootMs, roll, pitch, yaw, 0.0, 0.0, 0.0).pack(mav))
+        elif msgType == "VFR_HUD":
+            headings = np.degrees(fleet.heading_).astype(np.int32).tolist()
+            rows = zip(fleet.speed_.tolist(), headings, fleet.alt_.tolist(), fleet.climb_.tolist())
+            for mav, (speed, heading, alt, climb) in zip(self.encoders_, rows):
+                self.Emit(mav.vfr_hud_encode(speed, speed, heading, 50, alt, climb).pack(mav))
+        elif msgType == "GLOBAL_POSITION_INT":
+            lat = (fleet.lat_ * 1e7).astype(np.int32).tolist()
+            lon = (fleet.lon_ * 1e7).astype(np.int32).tolist()
+            alt = (fleet.alt_ * 1000).astype(np.int32).tolist()
+            vx = (fleet.speed_ * np.cos(fleet.heading_) * 100).astype(np.int16).tolist()
+            vy = (fleet.speed_ * np.sin(fleet.heading_) * 100).astype(np.int16).tolist()
+            vz = (-fleet.climb_ * 100).astype(np.int16).tolist()
+            hdg = (np.degrees(fleet.heading_) * 100).astype(np.uint16).tolist()
+            for i, mav in enumerate(self.encoders_):
+                self.Emit(mav.global_position_int_encode(bootMs, lat[i], lon[i], alt[i], alt[i],
+                                                         vx[i], vy[i], vz[i], hdg[i]).pack(mav))
+        elif msgType == "SYS_STATUS":
+            voltage = (fleet.voltage_ * 1000).astype(np.uint16).tolist()
+            remaining = np.clip((fleet.voltage_ - 14.0) / 2.8 * 100, 0, 100).astype(np.int8).tolist()
+            for mav, mv, pct in zip(self.encoders_, voltage, remaining):
+                self.Emit(mav.sys_status_encode(0, 0, 0, 500, mv, 1500, pct, 0, 0, 0, 0, 0, 0).pack(mav))
+        elif msgType == "RC_CHANNELS":
+            for mav in self.encoders_:
+                self.Emit(mav.rc_channels_encode(bootMs, 16, *([1500] * 18), 255).pack(mav))
+        else:
+            raise ValueError(f"Unsupported message type {msgType}")
+        self.sentCounts_[msgType] += len(self.encoders_)
+
+    def Report(self, elapsed):
+        total = sum(self.sentCounts_.values())
+        perType = ", ".join(f"{t}={n}" for t, n in self.sentCounts_.items())
+        logging.info("Sent %d messages (%.0f msg/s, %.1f kB/s) from %d vehicles in %.1fs: %s",
+                     total, total / elapsed if elapsed > 0 else 0.0,
+                     self.bytesSent_ / 1024.0 / elapsed if elapsed > 0 else 0.0,
+                     len(self.encoders_), elapsed, perType)
+
+    def run(self, duration=None, reportInterval=5.0):
+        logging.debug("Starting MAVLink load generation.")
+        start = time.monotonic()
+        lastStep = start
+        nextReport = start + reportInterval
+        roundsSent = {msgType: 0 for msgType in self.rates_}
+        # Wake often enough for the fastest stream, but no faster than 1 kHz.
+        idle = min(0.01, max(0.001, 1.0 / max(self.rates_.values())))
+        try:
+            while duration is None or time.monotonic() - start < duration:
+                now = time.monotonic()
+                self.fleet_.Step(now - lastStep)
+                lastStep = now
+                elapsed = now - start
+                bootMs = int(elapsed * 1000)
+                for msgType, rate in self.rates_.items():
+                    due = int(elapsed * rate) + 1 - roundsSent[msgType]
+                    for _ in range(due):
+                        self.SendRound(msgType, bootMs)
+                    roundsSent[msgType] += max(0, due)
+                self.Flush()
+                if now >= nextReport:
+                    self.Report(elapsed)
+                    nextReport += reportInterval
+                time.sleep(idle)
+        finally:
+            self.Flush()
+            self.Report(time.monotonic() - start)
+
+def ParseRates(text):
+    rates = dict(DEFAULT_RATES)
+    if text:
+        for item in text.split(","):
+            msgType, rate = item.split("=")
+            msgType = msgType.strip().upper()
+            if msgType not in DEFAULT_RATES:
+                raise ValueError(f"Unsupported message type {msgType}")
+            rates[msgType] = float(rate)
+    return {t: r for t, r in rates.items() if r > 0}
 
 if __name__ == "__main__":
-    logging.basicConfig(level=logging.DEBUG,
+    logging.basicConfig(level=logging.INFO,
                         format="%(asctime)s [%(levelname)s] %(message)s",
                         datefmt="%Y-%m-%d %H:%M:%S")
+    parser = argparse.ArgumentParser(description="MAVLink multi-vehicle load generator.")
+    parser.add_argument("--vehicles", type=int, default=1)
+    parser.add_argument("--rates", default="", help="per-vehicle rates, e.g. ATTITUDE=50,VFR_HUD=10 (0 disables a type)")
+    parser.add_argument("--first-sysid", type=int, default=None, help="system id of the first vehicle (default: <Drone><ID>)")
+    parser.add_argument("--batch", type=int, default=1, help="MAVLink frames per UDP datagram")
+    parser.add_argument("--duration", type=float, default=None, help="seconds to run (default: until interrupted)")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
     try:
-        emulator = MavlinkServerEmulator()
-        emulator.run()
+        emulator = MavlinkServerEmulator(args.vehicles, ParseRates(args.rates), args.first_sysid, args.batch, args.seed)
+        emulator.run(args.duration)
     except KeyboardInterrupt:
         logging.debug("MAVLink Server Emulator terminated.")
         sys.exit(0)
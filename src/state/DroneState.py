@@ -1,11 +1,78 @@
 """
 Module: DroneState.py
 Description: Defines the DroneState class and its sub-classes to hold the drone's state.
+
+Each state group keeps its fields in __slots__ and is guarded by a seqlock:
+writers wrap all updates from one message in WriteSection(), and readers
+call Snapshot() to get an internally consistent, immutable copy without
+taking a lock.
+
+A DroneState can also be backed by a SharedStateBlock so that several
+processes see the same values (see state/SharedStateBlock.py). Each group's
+sharedFormat_ gives the struct layout of its fields in that block.
 """
+import time
+import operator
+import threading
+from collections import namedtuple
+from state.TelemetryHistory import TelemetryHistory
+
+class VersionedState:
+    """Base class for state groups: slotted fields, seqlock version and snapshots."""
+    __slots__ = ("version_", "writeLock_", "shared_")
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls.snapshotType_ = namedtuple(cls.__name__.replace("State", "") + "Snapshot", cls.__slots__)
+        cls.fieldGetter_ = operator.attrgetter(*cls.__slots__)
+
+    def __init__(self):
+        self.version_ = 0
+        self.writeLock_ = threading.Lock()
+        self.shared_ = None  # SharedGroup when backed by shared memory
 
-class ControlState:
+    def WriteSection(self):
+        """Use as `with group.WriteSection():` around one batch of field updates."""
+        return self
+
+    def __enter__(self):
+        self.writeLock_.acquire()
+        if self.shared_ is not None:
+            self.shared_.BeginWrite(self)
+        self.version_ += 1  # odd: write in progress
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        self.version_ += 1  # even: committed
+        try:
+            if self.shared_ is not None:
+                self.shared_.EndWrite(self)
+        finally:
+            self.writeLock_.release()
+        return False
+
+    def Snapshot(self):
+        """Return a consistent namedtuple copy of all fields."""
+        if self.shared_ is not None:
+            return self.snapshotType_._make(self.shared_.Read())
+        while True:
+            version = self.version_
+            if not version & 1:
+                values = self.fieldGetter_(self)
+                if self.version_ == version:
+                    return self.snapshotType_._make(values)
+            time.sleep(0)  # let the writer finish
+
+class ControlState(VersionedState):
     """Holds control-related state data."""
+    __slots__ = ("arm_", "deploy1_", "deploy2_", "activeControl_", "activeControlPrev_",
+                 "metaCamera_", "metaCommand1_", "metaCommand2_", "gcsCamera_",
+                 "gcsCommand1_", "gcsCommand2_", "camControl_", "nnToggle_", "nn_",
+                 "smartDeploy_")
+    sharedFormat_ = "<???12q"
+
     def __init__(self):
+        super().__init__()
         self.arm_ = False
         self.deploy1_ = False
         self.deploy2_ = False
@@ -22,9 +89,15 @@ class ControlState:
         self.nn_ = 0
         self.smartDeploy_ = 0
 
-class RCChannelsState:
+class RCChannelsState(VersionedState):
     """Holds RC channel data."""
+    __slots__ = ("rcChannelPitch_", "rcChannelYaw_", "rcChannelCam_", "rcChannelDeploy1_",
+                 "rcChannelDeploy2_", "deploy12Value_", "deploy34Value_", "safetyValue_",
+                 "cameraValue_")
+    sharedFormat_ = "<9q"
+
     def __init__(self):
+        super().__init__()
         self.rcChannelPitch_ = 13
         self.rcChannelYaw_ = 14
         self.rcChannelCam_ = 12
@@ -35,9 +108,14 @@ class RCChannelsState:
         self.safetyValue_ = 0
         self.cameraValue_ = 5
 
-class TelemetryState:
+class TelemetryState(VersionedState):
     """Holds telemetry data."""
+    __slots__ = ("pitch_", "roll_", "yaw_", "groundspeed_", "verticalSpeed_", "latitude_",
+                 "longitude_", "altitude_", "heading_", "accelZ_")
+    sharedFormat_ = "<10d"
+
     def __init__(self):
+        super().__init__()
         self.pitch_ = 0
         self.roll_ = 0
         self.yaw_ = 0
@@ -49,16 +127,57 @@ class TelemetryState:
         self.heading_ = 0
         self.accelZ_ = 0
 
-class BatteryState:
+class EstimateState(VersionedState):
+    """
+    Latest filtered position and attitude with their rates, as of the time the
+    measurements were taken (local monotonic clock, latency removed). Times
+    are 0 until the first estimate. See core/TelemetryEstimator.py.
+    """
+    __slots__ = ("positionTime_", "latitude_", "longitude_", "altitude_", "northSpeed_", "eastSpeed_",
+                 "climbRate_", "accelZ_", "attitudeTime_", "roll_", "pitch_", "yaw_", "rollRate_",
+                 "pitchRate_", "yawRate_", "latency_")
+    sharedFormat_ = "<16d"
+
+    def __init__(self):
+        super().__init__()
+        self.positionTime_ = 0.0
+        self.latitude_ = 0.0
+        self.longitude_ = 0.0
+        self.altitude_ = 0.0
+        self.northSpeed_ = 0.0
+        self.eastSpeed_ = 0.0
+        self.climbRate_ = 0.0
+        self.accelZ_ = 0.0
+        self.attitudeTime_ = 0.0
+        self.roll_ = 0.0
+        self.pitch_ = 0.0
+        self.yaw_ = 0.0
+        self.rollRate_ = 0.0
+        self.pitchRate_ = 0.0
+        self.yawRate_ = 0.0
+        self.latency_ = 0.0
+
+class BatteryState(VersionedState):
     """Holds battery information."""
+    __slots__ = ("voltageValue_", "currentValue_", "batteryRemaining_")
+    sharedFormat_ = "<3d"
+
     def __init__(self):
+        super().__init__()
         self.voltageValue_ = 0
         self.currentValue_ = 0
         self.batteryRemaining_ = 0
 
-class GimbalState:
+class GimbalState(VersionedState):
     """Holds gimbal state data."""
+    __slots__ = ("gimbalGain_", "gimbalPitchNeutral_", "gimbalYawNeutral_", "pwmPitchMin_",
+                 "pwmPitchMax_", "pwmYawMin_", "pwmYawMax_", "pwmPitch_", "pwmYaw_",
+                 "pitchPrev_", "yawPrev_", "cameraPrev_", "deploy12_", "deploy34_",
+                 "deploy12Prev_", "deploy34Prev_", "mountPitch_", "mountYaw_", "mountTime_")
+    sharedFormat_ = "<11d5q3d"
+
     def __init__(self):
+        super().__init__()
         self.gimbalGain_ = 25.1
         self.gimbalPitchNeutral_ = 1825
         self.gimbalYawNeutral_ = 1675
@@ -75,10 +194,19 @@ class GimbalState:
         self.deploy34_ = 0
         self.deploy12Prev_ = 0
         self.deploy34Prev_ = 0
+        # Gimbal angles reported by the vehicle (degrees) and when (monotonic; 0: never).
+        self.mountPitch_ = 0.0
+        self.mountYaw_ = 0.0
+        self.mountTime_ = 0.0
 
-class JoystickState:
+class JoystickState(VersionedState):
     """Holds joystick state data."""
+    __slots__ = ("joystickButtonPrev_", "joystickX_", "joystickY_", "joystickZ_",
+                 "joystickButton_", "temperature_")
+    sharedFormat_ = "<6d"
+
     def __init__(self):
+        super().__init__()
         self.joystickButtonPrev_ = 1
         self.joystickX_ = 0.0
         self.joystickY_ = 0.0
@@ -86,13 +214,32 @@ class JoystickState:
         self.joystickButton_ = 0
         self.temperature_ = 0.0
 
+DroneSnapshot = namedtuple("DroneSnapshot", ("id_", "control_", "rc_channels_", "telemetry_",
+                                             "battery_", "gimbal_", "joystick_", "estimate_"))
+
 class DroneState:
     """Aggregates all state information for the drone."""
-    def __init__(self):
+    __slots__ = ("id_", "control_", "rc_channels_", "telemetry_", "battery_", "gimbal_", "joystick_",
+                 "estimate_", "history_")
+
+    def __init__(self, historyCapacity=36000):
         self.id_ = 13
         self.control_ = ControlState()
         self.rc_channels_ = RCChannelsState()
         self.telemetry_ = TelemetryState()
         self.battery_ = BatteryState()
         self.gimbal_ = GimbalState()
-        self.joystick_ = JoystickState()
\ No newline at end of file
+        self.joystick_ = JoystickState()
+        self.estimate_ = EstimateState()
+        self.history_ = TelemetryHistory(historyCapacity)
+
+    def Snapshot(self):
+        """Snapshot every group; each group is consistent on its own."""
+        return DroneSnapshot(self.id_,
+                             self.control_.Snapshot(),
+                             self.rc_channels_.Snapshot(),
+                             self.telemetry_.Snapshot(),
+                             self.battery_.Snapshot(),
+                             self.gimbal_.Snapshot(),
+                             self.joystick_.Snapshot(),
+                             self.estimate_.Snapshot())
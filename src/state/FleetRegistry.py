@@ -0,0 +1,50 @@
+"""
+Module: FleetRegistry.py
+Description: Per-vehicle DroneState instances keyed by MAVLink system id.
+"""
+import logging
+import threading
+
+class FleetRegistry:
+    """
+    Holds one DroneState per vehicle. States are created on the first message
+    from a new system id with stateFactory(sysid), up to maxVehicles.
+    Lookups of known vehicles are a plain dict read and take no lock.
+    """
+    def __init__(self, stateFactory, maxVehicles=64, ignoredSysids=(255,)):
+        self.logger = logging.getLogger("Fleet Registry")
+        self.stateFactory_ = stateFactory
+        self.maxVehicles_ = maxVehicles
+        self.ignoredSysids_ = frozenset(ignoredSysids)
+        self.states_ = {}
+        self.lock_ = threading.Lock()
+        self.rejectedCount_ = 0
+
+    def Add(self, sysid, state):
+        with self.lock_:
+            self.states_[sysid] = state
+
+    def Get(self, sysid):
+        """State for sysid, created on first use; None for ignored or excess systems."""
+        state = self.states_.get(sysid)
+        if state is not None:
+            return state
+        if sysid in self.ignoredSysids_:
+            return None
+        with self.lock_:
+            state = self.states_.get(sysid)
+            if state is None:
+                if len(self.states_) >= self.maxVehicles_:
+                    self.rejectedCount_ += 1
+                    return None
+                state = self.stateFactory_(sysid)
+                self.states_[sysid] = state
+                self.logger.info(f"New vehicle in fleet: system id {sysid} ({len(self.states_)} total)")
+            return state
+
+    def States(self):
+        """List of all vehicle states, safe to iterate while vehicles join."""
+        return list(self.states_.values())
+
+    def __len__(self):
+        return len(self.states_)
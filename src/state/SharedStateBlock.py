@@ -0,0 +1,170 @@
+"""
+Module: SharedStateBlock.py
+Description: Fixed-layout multiprocessing.shared_memory block that backs the DroneState groups.
+
+Block layout (little endian):
+    header: magic b"MPSS", uint16 layout version, uint16 group count,
+            uint32 CRC-32 of LAYOUT_DESCRIPTION, uint32 vehicle id
+    groups: in SHARED_GROUPS order, each 8-byte aligned:
+            uint64 sequence (odd while a write is in progress), then the
+            group's fields packed with its sharedFormat_
+
+Readers in other processes, including external tools that only need to
+display state, attach by name and use Read(); a reader never writes to the
+block, so it needs no lock.
+"""
+import time
+import struct
+import zlib
+import logging
+import multiprocessing
+from multiprocessing import shared_memory
+from state.DroneState import (ControlState, RCChannelsState, TelemetryState, BatteryState,
+                              GimbalState, JoystickState, EstimateState)
+
+SHARED_MAGIC = b"MPSS"
+SHARED_VERSION = 1
+BLOCK_HEADER = struct.Struct("<4sHHII")
+GROUP_SEQUENCE = struct.Struct("<Q")
+
+SHARED_GROUPS = (
+    ("control_", ControlState),
+    ("rc_channels_", RCChannelsState),
+    ("telemetry_", TelemetryState),
+    ("battery_", BatteryState),
+    ("gimbal_", GimbalState),
+    ("joystick_", JoystickState),
+    ("estimate_", EstimateState),
+)
+
+def BuildLayout():
+    """(group name, field names, struct, offset) for every group, and the total block size."""
+    layout = []
+    offset = BLOCK_HEADER.size
+    for name, groupType in SHARED_GROUPS:
+        offset = (offset + 7) & ~7
+        fields = struct.Struct(groupType.sharedFormat_)
+        layout.append((name, groupType.__slots__, fields, offset))
+        offset += GROUP_SEQUENCE.size + fields.size
+    return tuple(layout), offset
+
+LAYOUT, BLOCK_SIZE = BuildLayout()
+LAYOUT_DESCRIPTION = ";".join(f"{name}@{offset}:{fields.format}:{','.join(slots)}"
+                              for name, slots, fields, offset in LAYOUT)
+LAYOUT_CRC = zlib.crc32(LAYOUT_DESCRIPTION.encode())
+
+class SharedGroup:
+    """One group's region of the block, with a seqlock over its sequence counter."""
+    def __init__(self, buffer, name, slots, fields, offset):
+        self.buffer_ = buffer
+        self.name_ = name
+        self.slots_ = slots
+        self.fields_ = fields
+        self.sequenceOffset_ = offset
+        self.dataOffset_ = offset + GROUP_SEQUENCE.size
+        self.localSequence_ = None  # sequence this process last wrote or loaded
+
+    def Sequence(self):
+        return GROUP_SEQUENCE.unpack_from(self.buffer_, self.sequenceOffset_)[0]
+
+    def BeginWrite(self, group):
+        """Called with the group's cross-process lock held."""
+        sequence = self.Sequence()
+        if sequence != self.localSequence_:
+            # Another process wrote last: refresh the local fields before they are modified.
+            for slot, value in zip(self.slots_, self.fields_.unpack_from(self.buffer_, self.dataOffset_)):
+                setattr(group, slot, value)
+        GROUP_SEQUENCE.pack_into(self.buffer_, self.sequenceOffset_, sequence + 1)
+
+    def EndWrite(self, group):
+        try:
+            self.fields_.pack_into(self.buffer_, self.dataOffset_, *group.fieldGetter_(group))
+        finally:
+            # Always leave the sequence even, or readers would spin forever.
+            sequence = self.Sequence() + 1
+            GROUP_SEQUENCE.pack_into(self.buffer_, self.sequenceOffset_, sequence)
+            self.localSequence_ = sequence
+
+    def Read(self):
+        """Consistent tuple of the group's fields, in __slots__ order."""
+        while True:
+            sequence = self.Sequence()
+            if not sequence & 1:
+                values = self.fields_.unpack_from(self.buffer_, self.dataOffset_)
+                if self.Sequence() == sequence:
+                    return values
+            time.sleep(0)
+
+class SharedStateBlock:
+    """
+    Shared memory holding one vehicle's DroneState groups.
+
+    The owning process creates the block and calls Attach(state) before it
+    starts its worker processes; from then on every WriteSection() of an
+    attached group is mirrored into the block and every Snapshot() reads
+    from it. Other processes open the block with SharedStateBlock(name).
+    """
+    def __init__(self, name=None, create=False, vehicleId=0):
+        self.logger = logging.getLogger("Shared State Block")
+        self.created_ = create
+        if create:
+            try:
+                self.memory_ = shared_memory.SharedMemory(name=name, create=True, size=BLOCK_SIZE)
+            except FileExistsError:
+                # Left behind by a process that did not shut down cleanly.
+                self.logger.warning(f"Replacing stale shared memory block {name}")
+                # Opened tracked: unlink() unregisters it again, so the tracker sees one of each.
+                stale = shared_memory.SharedMemory(name=name)
+                stale.close()
+                stale.unlink()
+                self.memory_ = shared_memory.SharedMemory(name=name, create=True, size=BLOCK_SIZE)
+            self.memory_.buf[:BLOCK_SIZE] = bytes(BLOCK_SIZE)
+            BLOCK_HEADER.pack_into(self.memory_.buf, 0, SHARED_MAGIC, SHARED_VERSION,
+                                   len(LAYOUT), LAYOUT_CRC, vehicleId)
+        else:
+            self.memory_ = OpenUntracked(name)
+        magic, version, groupCount, crc, self.vehicleId_ = BLOCK_HEADER.unpack_from(self.memory_.buf, 0)
+        if magic != SHARED_MAGIC or version != SHARED_VERSION or crc != LAYOUT_CRC:
+            self.memory_.close()
+            raise ValueError(f"Shared memory block {name} has an incompatible layout")
+        self.name_ = self.memory_.name
+        self.groups_ = {name: SharedGroup(self.memory_.buf, name, slots, fields, offset)
+                        for name, slots, fields, offset in LAYOUT}
+
+    def Attach(self, state, lockFactory=multiprocessing.Lock):
+        """
+        Back state's groups with this block. The current local values are
+        published first. Must run before the worker processes are forked,
+        because it swaps each group's lock for a process-shared one.
+        """
+        for name, sharedGroup in self.groups_.items():
+            group = getattr(state, name)
+            with group.writeLock_:
+                group.writeLock_ = lockFactory()
+                sharedGroup.localSequence_ = sharedGroup.Sequence()
+                group.shared_ = sharedGroup
+            with group.WriteSection():
+                pass
+        self.logger.info(f"Drone state shared as '{self.name_}' ({BLOCK_SIZE} bytes)")
+
+    def Read(self, groupName):
+        """Named snapshot of one group, for processes that have no DroneState."""
+        group = self.groups_[groupName]
+        return dict(zip(group.slots_, group.Read()))
+
+    def Close(self):
+        self.groups_ = {}
+        self.memory_.close()
+        if self.created_:
+            self.memory_.unlink()
+
+def OpenUntracked(name):
+    """Open an existing block without letting this process's resource tracker unlink it at exit."""
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        # Python < 3.13 always registers the segment; undo that for blocks we do not own.
+        from multiprocessing import resource_tracker
+        memory = shared_memory.SharedMemory(name=name)
+        resource_tracker.unregister(memory._name, "shared_memory")
+        return memory
@@ -0,0 +1,128 @@
+"""
+Module: TelemetryHistory.py
+Description: Fixed-capacity NumPy ring buffer of timestamped telemetry rows with windowed queries.
+"""
+import time
+import threading
+import numpy as np
+
+HISTORY_COLUMNS = ("time", "pitch", "roll", "heading", "latitude", "longitude", "altitude",
+                   "groundspeed", "voltage", "current", "batteryRemaining")
+COLUMN_INDEX = {name: i for i, name in enumerate(HISTORY_COLUMNS)}
+
+class TelemetryHistory:
+    """
+    Preallocated (capacity x columns) float64 ring buffer.
+
+    Every row is a full copy of the telemetry and battery values at one
+    monotonic timestamp, so memory use is fixed for the life of the process.
+    Queries work on views of the one or two contiguous segments that make
+    up the requested time window; only Window() materialises the window
+    itself, never the whole history.
+    """
+    def __init__(self, capacity=36000):
+        self.capacity_ = capacity
+        self.data_ = np.zeros((capacity, len(HISTORY_COLUMNS)), dtype=np.float64)
+        self.head_ = 0   # next row to write
+        self.count_ = 0  # valid rows, up to capacity
+        self.lock_ = threading.Lock()
+
+    def Append(self, telemetry, battery, timestamp=None):
+        """Append one row from telemetry/battery state objects or snapshots."""
+        row = (time.monotonic() if timestamp is None else timestamp,
+               telemetry.pitch_, telemetry.roll_, telemetry.heading_,
+               telemetry.latitude_, telemetry.longitude_, telemetry.altitude_,
+               telemetry.groundspeed_,
+               battery.voltageValue_, battery.currentValue_, battery.batteryRemaining_)
+        with self.lock_:
+            self.data_[self.head_] = row
+            self.head_ = (self.head_ + 1) % self.capacity_
+            if self.count_ < self.capacity_:
+                self.count_ += 1
+
+    def __len__(self):
+        return self.count_
+
+    def Segments(self, seconds=None, now=None):
+        """
+        Views of the rows from the last `seconds` (all rows if None), oldest
+        first. Call with lock_ held.
+        """
+        if self.count_ < self.capacity_:
+            segments = [self.data_[:self.count_]]
+        else:
+            segments = [self.data_[self.head_:], self.data_[:self.head_]]
+        segments = [s for s in segments if len(s)]
+        if seconds is None or not segments:
+            return segments
+        start = (time.monotonic() if now is None else now) - seconds
+        for i, segment in enumerate(segments):
+            if segment[-1, 0] >= start:
+                first = int(np.searchsorted(segment[:, 0], start, side="left"))
+                return [segment[first:]] + segments[i + 1:]
+        return []
+
+    def Last(self, n):
+        """Copy of the newest n rows, oldest first."""
+        with self.lock_:
+            n = min(n, self.count_)
+            if n == 0:
+                return np.empty((0, len(HISTORY_COLUMNS)))
+            indices = (self.head_ - n + np.arange(n)) % self.capacity_
+            return self.data_[indices]
+
+    def Window(self, seconds, column=None, now=None):
+        """
+        Copy of the rows (or one named column) from the last `seconds`, oldest first.
+        The window always ends at the newest row, so a view into the ring would be
+        overwritten by later appends once the buffer wraps.
+        """
+        with self.lock_:
+            segments = self.Segments(seconds, now)
+            if column is not None:
+                segments = [s[:, COLUMN_INDEX[column]] for s in segments]
+            if len(segments) == 1:
+                return segments[0].copy()
+            if not segments:
+                return np.empty((0,) if column is not None else (0, len(HISTORY_COLUMNS)))
+            return np.concatenate(segments)
+
+    def Stats(self, column, seconds, now=None):
+        """Mean, min and max of a column over the last `seconds`, or None if empty."""
+        c = COLUMN_INDEX[column]
+        with self.lock_:
+            segments = [s[:, c] for s in self.Segments(seconds, now)]
+            n = sum(len(s) for s in segments)
+            if n == 0:
+                return None
+            return {
+                "count": n,
+                "mean": sum(float(s.sum()) for s in segments) / n,
+                "min": min(float(s.min()) for s in segments),
+                "max": max(float(s.max()) for s in segments),
+            }
+
+    def Rate(self, column, seconds, now=None):
+        """
+        Least-squares slope of a column against time (units per second) over
+        the last `seconds`, or None with fewer than two distinct timestamps.
+        """
+        c = COLUMN_INDEX[column]
+        with self.lock_:
+            segments = self.Segments(seconds, now)
+            n = sum(len(s) for s in segments)
+            if n < 2:
+                return None
+            t0 = segments[0][0, 0]
+            st = sx = stt = stx = 0.0
+            for s in segments:
+                t = s[:, 0] - t0
+                x = s[:, c]
+                st += float(t.sum())
+                sx += float(x.sum())
+                stt += float(np.dot(t, t))
+                stx += float(np.dot(t, x))
+        denominator = n * stt - st * st
+        if denominator <= 1e-12:
+            return None
+        return (n * stx - st * sx) / denominator